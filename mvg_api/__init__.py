@@ -1,8 +1,14 @@
 # coding=utf-8
 
-import requests
+# requests and concurrent.futures are imported where they are used, so
+# importing mvg_api stays fast for scripts that never touch the network
 import datetime
-from time import mktime
+from time import mktime, monotonic, sleep, time as current_time
+
+from mvg_api import decoders, models
+from mvg_api.cache import RouteCache, TTLCache
+from mvg_api.ratelimit import RateLimiter, backoff_delay, parse_retry_after
+from mvg_api.singleflight import SingleFlight
 
 query_url_name = "https://www.mvg.de/api/fahrinfo/location/queryWeb?q={name}"  # for station names
 query_url_id = "https://www.mvg.de/api/fahrinfo/location/query?q={id}"  # for station ids
@@ -11,6 +17,19 @@ nearby_url = "https://www.mvg.de/api/fahrinfo/location/nearby?latitude={lat}&lon
 routing_url = "https://www.mvg.de/api/fahrinfo/routing/?"
 interruptions_url = "https://www.mvg.de/.rest/betriebsaenderungen/api/interruptions"
 id_prefix = "de:09162:"
+# prefix of the urls above, which a client's base_url replaces
+api_base_url = "https://www.mvg.de"
+
+user_agent = 'python-mvg-api/1 (+https://github.com/leftshift/python_mvg_api)'
+
+# seconds responses of each endpoint are cached for, 0 means never
+default_cache_ttl = {
+    'location': 24 * 60 * 60,
+    'nearby': 24 * 60 * 60,
+    'departure': 5,
+    'interruptions': 60,
+    'routing': 0,
+}
 
 
 class ApiError(Exception):
@@ -19,7 +38,7 @@ class ApiError(Exception):
     :ivar code: status code returned by the API
     :ivar reason: response given by the api (optional)
     """
-    def __init__(self, code, reason):
+    def __init__(self, code, reason=None):
         self.code = code
         self.reason = reason
 
@@ -51,20 +70,16 @@ def _station_sanity_check(id:str):
     return True
 
 
-def _perform_api_request(url):
-    resp = requests.get(
-            url,
-            headers={
-                'User-Agent': 'python-mvg-api/1 (+https://github.com/leftshift/python_mvg_api)',
-                'Accept': 'application/json'
-                }
-            )
-    if not resp.ok:
+def _accept_encoding():
+    """Content codings to ask the api for; brotli only if a brotli
+    package is installed to decode it."""
+    for module in ('brotli', 'brotlicffi'):
         try:
-            raise ApiError(resp.status_code, resp.json())
-        except ValueError:
-            raise ApiError(resp.status_code)
-    return resp.json()
+            __import__(module)
+        except ImportError:
+            continue
+        return 'gzip, deflate, br'
+    return 'gzip, deflate'
 
 
 def _convert_time(time):
@@ -87,7 +102,917 @@ def _convert_time(time):
         return datetime.datetime.fromtimestamp(timestamp)
 
 
-def get_nearby_stations(lat, lon):
+# URL building and response post-processing shared by the blocking
+# client below and the asyncio client in mvg_api.aio
+
+
+def _normalize_station_id(station_id):
+    if isinstance(station_id, int):
+        return _convert_id(station_id)
+    elif not _station_sanity_check(station_id):
+        raise TypeError("Please give the int station_id of the station.\
+                         You can find it out by running \
+                         get_id_for_station('Station name')")
+    return station_id
+
+
+def _nearby_url(lat, lon):
+    if not (isinstance(lat, float) and isinstance(lon, float)):
+        raise TypeError()
+    return nearby_url.format(lat=lat, lon=lon)
+
+
+def _locations_url(query):
+    try:
+        query = "{}{}".format(id_prefix, int(query))  # converts old style station id to new style station id
+    except(ValueError):  # happens if it is a station name
+        return query_url_name.format(name=query)
+    else:  # happens if it is a station id
+        return query_url_id.format(id=str(query))
+
+
+def _filter_stations(locations):
+    return [location for location in locations
+            if location['type'] == 'station']
+
+
+def _first_id(stations):
+    try:
+        station = stations[0]
+    except IndexError:
+        return None
+    return station['id']
+
+
+def _route_url(start, dest,
+               time=None, arrival_time=False,
+               max_walk_time_to_start=None, max_walk_time_to_dest=None,
+               change_limit=None,
+               ubahn=True,
+               bus=True,
+               tram=True,
+               sbahn=True):
+    options = []
+
+
+    if isinstance(start, tuple) and len(start) == 2:
+        options.append("fromLatitude=" + str(start[0]))
+        options.append("fromLongitude=" + str(start[1]))
+    elif isinstance(start, int):
+        options.append("fromStation=" + _convert_id(start))
+    elif _station_sanity_check(start):
+        options.append("fromStation=" + start)
+    else:
+        raise ValueError("A start must be given;\
+                          either int station id, 'new style' string ids \
+                          or a tuple with latitude and longitude")
+
+
+    if isinstance(dest, tuple) and len(dest) == 2:
+        options.append("toLatitude=" + str(dest[0]))
+        options.append("toLongitude=" + str(dest[1]))
+    elif isinstance(dest, int):
+        options.append("toStation=" + _convert_id(dest))
+    elif _station_sanity_check(dest):
+        options.append("toStation=" + dest)
+    else:
+        raise ValueError("A destination must be given;\
+                          either int station id or tuple latitude longitude")
+
+    if time:
+        if isinstance(time, datetime.datetime):
+            time = _convert_time(time)
+        options.append("time=" + str(time))
+        if arrival_time:
+            options.append("arrival=true")
+    if max_walk_time_to_start:
+        options.append("maxTravelTimeFootwayToStation=" +
+                       str(max_walk_time_to_start))
+    if max_walk_time_to_dest:
+        options.append("maxTravelTimeFootwayToDestination=" +
+                       str(max_walk_time_to_dest))
+
+    if change_limit is not None:  # 'if change_limit:' would not work for 0
+        if isinstance(change_limit, int):
+            options.append("changeLimit=" + str(change_limit))
+
+    if not ubahn:
+        options.append("transportTypeUnderground=false")
+    if not bus:
+        options.append("transportTypeBus=false")
+    if not tram:
+        options.append("transportTypeTram=false")
+    if not sbahn:
+        options.append("transportTypeSBahn=false")
+
+    options_url = "&".join(options)
+    return routing_url + options_url
+
+
+def _matrix_urls(origins, destinations, **options):
+    """Maps the routing url of every origin/destination pair to the
+    `(i, j)` matrix positions it answers, so repeated pairs are only
+    requested once."""
+    urls = {}
+    for i, start in enumerate(origins):
+        for j, dest in enumerate(destinations):
+            url = _route_url(start, dest, **options)
+            urls.setdefault(url, []).append((i, j))
+    return urls
+
+
+def _process_connection(connection, datetimes=True, as_objects=False):
+    if as_objects:
+        return models.Connection.from_dict(connection)
+    # responses may be cached, so the connections are copied, not modified
+    connection = dict(connection)
+    if datetimes:
+        connection["departure_datetime"] = \
+            _convert_time(connection["departure"])
+        connection["arrival_datetime"] = \
+            _convert_time(connection["arrival"])
+    return connection
+
+
+def _process_route(results, datetimes=True, as_objects=False):
+    return [_process_connection(connection, datetimes, as_objects)
+            for connection in results["connectionList"]]
+
+
+def _process_interruption(interruption, as_objects=False):
+    if as_objects:
+        return models.Interruption.from_dict(interruption)
+    return interruption
+
+
+def _unique_station_ids(station_ids):
+    station_ids = [_normalize_station_id(station_id)
+                   for station_id in station_ids]
+    return list(dict.fromkeys(station_ids))
+
+
+def _departures_url(station_id, timeoffset=0):
+    station_id = _normalize_station_id(station_id)
+    return departure_url.format(id=station_id, offset=timeoffset)
+
+
+# below this many departures, numpy's conversion overhead isn't worth it
+_numpy_threshold = 256
+_numpy = None
+
+
+def _get_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy
+
+
+def _minutes_until(times, delays, now=None):
+    """Minutes from `now` until each of `times` (unix timestamps in
+    milliseconds, like the api returns them), plus the given delays.
+
+    All times are compared to the same `now` (by default the current
+    time), uses numpy for long lists if it is installed.
+    """
+    if now is None:
+        now = int(current_time() * 1000)
+    numpy = _get_numpy() if len(times) >= _numpy_threshold else None
+    if numpy:
+        minutes = (numpy.asarray(times, dtype=numpy.int64) - now) // 60000
+        return (minutes + numpy.asarray(delays, dtype=numpy.int64)).tolist()
+    return [(time - now) // 60000 + delay
+            for time, delay in zip(times, delays)]
+
+
+def _process_departures(results, now=None, as_objects=False):
+    # responses may be cached, so the departures are copied, not modified
+    departures = results['departures']
+    # For some reason, mvg gives you a Unix timestamp, but in milliseconds.
+    # All departures are compared to one snapshot of the current time.
+    minutes = _minutes_until(
+        [departure['departureTime'] for departure in departures],
+        [departure.get('delay', 0) for departure in departures],
+        now)
+    if as_objects:
+        return [models.Departure.from_dict(
+                    departure, departure_time_minutes=departure_minutes)
+                for departure, departure_minutes in zip(departures, minutes)]
+    processed = []
+    for departure, departure_minutes in zip(departures, minutes):
+        departure = dict(departure)
+        departure[u'departureTimeMinutes'] = departure_minutes
+        processed.append(departure)
+    return processed
+
+
+def _process_locations(locations, as_objects=False):
+    if as_objects:
+        return [models.Location.from_dict(location) for location in locations]
+    return locations
+
+
+def _process_lines(lines, as_objects=False):
+    if as_objects:
+        return [models.ServingLine.from_dict(line) for line in lines]
+    return lines
+
+
+def _process_interruptions(results, as_objects=False):
+    if as_objects:
+        return [models.Interruption.from_dict(interruption)
+                for interruption in models.interruption_list(results)]
+    return results
+
+
+def _process_station_board(results):
+    return {
+        'departures': _process_departures(results),
+        'servingLines': results['servingLines'],
+        }
+
+
+class _ServingLinesMemo:
+    """Remembers the `servingLines` of recent departure responses, so
+    :func:`get_lines` can skip the request if a board was just fetched.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lines = {}
+
+    def remember(self, station_id, results):
+        if self.max_age:
+            self._lines[station_id] = (monotonic(), results['servingLines'])
+
+    def get(self, station_id):
+        try:
+            fetched, lines = self._lines[station_id]
+        except KeyError:
+            return None
+        if monotonic() - fetched > self.max_age:
+            self._lines.pop(station_id, None)
+            return None
+        return lines
+
+
+class _BaseClient:
+    """Configuration and bookkeeping shared by :class:`MvgClient` and
+    :class:`mvg_api.aio.AsyncMvgClient`."""
+
+    retry_status_codes = (429, 500, 502, 503, 504)
+    # how long validators of a response are kept for conditional requests
+    validator_ttl = 86400
+
+    def __init__(self, pool_size=10, timeout=(5, 15),
+                 retries=3, backoff_factor=0.3, lines_max_age=300,
+                 cache=True, cache_ttl=None, coalesce=True,
+                 station_index=None, spatial_index=None,
+                 json_decoder='auto', rate_limit=False, route_cache=False,
+                 hooks=None, conditional=True, base_url=None,
+                 endpoints=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._serving_lines = _ServingLinesMemo(lines_max_age)
+        if cache is True:
+            cache = TTLCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+        self.cache_ttl = dict(default_cache_ttl)
+        if cache_ttl:
+            self.cache_ttl.update(cache_ttl)
+        self.single_flight = self._single_flight_class() if coalesce else None
+        self.station_index = station_index
+        self.spatial_index = spatial_index
+        self.json_decoder = json_decoder
+        self._loads = None
+        if rate_limit is True:
+            rate_limit = RateLimiter()
+        elif rate_limit is False:
+            rate_limit = None
+        self.rate_limiter = rate_limit
+        if route_cache is True:
+            route_cache = RouteCache()
+        elif route_cache is False:
+            route_cache = None
+        self.route_cache = route_cache
+        # matrices are recomputed with mostly the same queries, so they
+        # get a route cache even if the client has none
+        self._matrix_route_cache = (route_cache if route_cache is not None
+                                    else RouteCache())
+        self.hooks = hooks
+        if conditional is True:
+            conditional = TTLCache(maxsize=256)
+        elif conditional is False:
+            conditional = None
+        self.validators = conditional
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.endpoints = endpoints
+        self._session = None
+
+    def _decode(self, data):
+        if self._loads is None:
+            self._loads = decoders.get_decoder(self.json_decoder)
+        return self._loads(data)
+
+    def _reserve(self, endpoint):
+        if self.rate_limiter is None:
+            return 0
+        return self.rate_limiter.reserve(endpoint)
+
+    def _retry_delay(self, attempt, status, headers):
+        """Seconds to wait before retrying a response with `status`, or
+        `None` if it shouldn't be retried."""
+        if status not in self.retry_status_codes or attempt >= self.retries:
+            return None
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after is not None and self.rate_limiter is not None:
+            # the api asked us to slow down, so everyone waits
+            self.rate_limiter.pause(retry_after)
+        delay = backoff_delay(attempt + 1, self.backoff_factor, retry_after)
+        if self.rate_limiter is not None:
+            self.rate_limiter.record_retry(delay)
+        return delay
+
+    def _indexed_stations(self, station, use_cache):
+        if self.station_index is None or not use_cache:
+            return []
+        return self.station_index.exact(station)
+
+    def _indexed_nearby_stations(self, lat, lon, use_cache):
+        if self.spatial_index is None or not use_cache:
+            return []
+        return self.spatial_index.within(lat, lon)
+
+    def _learn_nearby_stations(self, stations):
+        if self.spatial_index is not None:
+            self.spatial_index.add(stations)
+
+    def _cached_route(self, url, use_cache, route_cache):
+        if route_cache is None or not use_cache:
+            return None
+        results = route_cache.get(url)
+        if results is not None and self.hooks is not None:
+            self.hooks.on_cache_hit('routing', url)
+        return results
+
+    def _store_route(self, url, results, use_cache, route_cache):
+        if route_cache is not None and use_cache:
+            route_cache.set(url, results)
+
+    def _cached(self, url, endpoint):
+        results = self.cache.get(url)
+        if results is not None and self.hooks is not None:
+            self.hooks.on_cache_hit(endpoint, url)
+        return results
+
+    def _upstream_url(self, url):
+        """`url` with :data:`api_base_url` replaced by `base_url`."""
+        if self.base_url is None or not url.startswith(api_base_url):
+            return url
+        return self.base_url + url[len(api_base_url):]
+
+    def _record_backend(self, backend, endpoint, status, started, last):
+        """Records the outcome of a request to `backend` in the endpoint
+        registry, and returns whether to try the next backend instead."""
+        if status in self.endpoints.failover_status_codes:
+            self.endpoints.record_failure(backend)
+            return not last
+        self.endpoints.record_success(backend, endpoint,
+                                      monotonic() - started)
+        return False
+
+    def _conditional_headers(self, url):
+        """Returns the stored `(etag, last modified, results)` of `url`
+        and the headers to revalidate them, or `(None, None)`."""
+        if self.validators is None:
+            return None, None
+        stored = self.validators.get(url)
+        if stored is None:
+            return None, None
+        etag, last_modified, _ = stored
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return stored, headers
+
+    def _not_modified(self, endpoint, url, stored, size, started):
+        """Returns the stored results for a `304 Not Modified`, which is
+        both a response and a cache hit to the hooks."""
+        if self.hooks is not None:
+            self.hooks.after_response(endpoint, url, 304, size,
+                                      monotonic() - started, 0.0)
+            self.hooks.on_cache_hit(endpoint, url)
+        return stored[2]
+
+    def _store_validators(self, url, headers, results):
+        if self.validators is None:
+            return
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag or last_modified:
+            self.validators.set(url, (etag, last_modified, results),
+                                self.validator_ttl)
+
+    def _decode_response(self, endpoint, url, status, body, started):
+        """Decodes a successful response, reporting it to the hooks."""
+        if self.hooks is None:
+            return self._decode(body)
+        elapsed = monotonic() - started
+        decode_started = monotonic()
+        results = self._decode(body)
+        self.hooks.after_response(endpoint, url, status, len(body), elapsed,
+                                  monotonic() - decode_started)
+        return results
+
+    def _ttl_for(self, endpoint, use_cache):
+        if not use_cache or self.cache is None:
+            return 0
+        return self.cache_ttl.get(endpoint, 0)
+
+    @property
+    def coalesced(self):
+        """Number of requests that were not sent because an identical
+        one was already in flight."""
+        if self.single_flight is None:
+            return 0
+        return self.single_flight.coalesced
+
+
+class MvgClient(_BaseClient):
+    """Talks to the mvg api over a pooled, keep-alive HTTP session.
+
+    All module level functions like :func:`get_departures` use a shared
+    default client (see :func:`get_default_client`). Create your own
+    instance if you need a different pool size, timeout or retry policy.
+    The client can be shared between threads.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of connections kept alive to the api host.
+    timeout : float or tuple, optional
+        Timeout in seconds, either a single value or a
+        `(connect, read)` tuple as accepted by `requests`.
+    retries : int, optional
+        How often a request is retried on connection errors and on
+        status codes 429 and 5xx.
+    backoff_factor : float, optional
+        Retries wait up to `backoff_factor * 2 ** retry` seconds, picked
+        at random, but at least as long as a `Retry-After` header says.
+    lines_max_age : float, optional
+        For how many seconds :meth:`get_lines` answers from the serving
+        lines of a previous departure request for the same station.
+        `0` disables this.
+    cache : bool or cache object, optional
+        Responses are kept in a :class:`mvg_api.cache.TTLCache` by
+        default. Pass your own instance (or any object with the same
+        `get` and `set` methods) to change its size or share it, or
+        `False` to disable caching.
+    cache_ttl : dict, optional
+        Seconds to cache responses of each endpoint for, updating
+        :data:`default_cache_ttl`. Endpoints are `location`, `nearby`,
+        `departure`, `interruptions` and `routing`.
+    coalesce : bool, optional
+        If several threads request the same URL at the same time, only
+        one request is sent and all of them share its response (see
+        :attr:`coalesced`). `False` disables this.
+    station_index : :class:`mvg_api.stations.StationIndex`, optional
+        If given, station names and ids are resolved from this local
+        index first and only looked up online if it has no station of
+        exactly that name or id.
+    spatial_index : :class:`mvg_api.stations.SpatialIndex`, optional
+        If given, :meth:`get_nearby_stations` returns the stations of
+        this index within its `radius` and only asks the api if there
+        are none. Stations returned by the api are added to the index.
+    json_decoder : str or callable, optional
+        JSON backend used to decode responses: `'orjson'`, `'msgspec'`,
+        `'json'` or `'auto'` for the fastest one installed (see
+        :mod:`mvg_api.decoders`), or a function decoding `bytes`.
+    rate_limit : bool or :class:`mvg_api.ratelimit.RateLimiter`, optional
+        Set to `True` to throttle requests per endpoint according to
+        :data:`mvg_api.ratelimit.default_rates`, and to hold back all
+        requests when the api answers with a `Retry-After`. Pass your
+        own limiter to change the rates or share it between clients.
+        Its `stats()` tell how long requests waited. Requests aren't
+        throttled by default.
+    route_cache : bool or :class:`mvg_api.cache.RouteCache`, optional
+        Set to `True` (or pass your own instance) to reuse the results
+        of similar route queries, see :class:`mvg_api.cache.RouteCache`.
+        :meth:`get_routes_matrix` always caches its routes, in a route
+        cache of its own if this is not set.
+    hooks : :class:`mvg_api.metrics.Hooks`, optional
+        Gets called before and after every request, e.g. a
+        :class:`mvg_api.metrics.MetricsCollector`.
+    conditional : bool or cache object, optional
+        By default, the `ETag` and `Last-Modified` headers of responses
+        are kept (in a :class:`mvg_api.cache.TTLCache`) with the decoded
+        response, and repeated requests ask the api to answer
+        `304 Not Modified` if nothing changed, in which case the kept
+        response is used. `False` disables this.
+    base_url : str, optional
+        Sends requests to this server instead of :data:`api_base_url`,
+        e.g. to a :mod:`mvg_api.gateway` shared by many clients. Caches
+        are still keyed by the original urls.
+    endpoints : :class:`mvg_api.endpoints.EndpointRegistry`, optional
+        Servers and timeouts per endpoint, with failover to the next
+        server and preference for the fastest. Overrides `base_url`.
+    transport : object, optional
+        Sends the requests instead of the pooled session, e.g. to record
+        and replay responses (see :mod:`mvg_api.transport`). Only
+        supported by the blocking client.
+
+    Every method also accepts `use_cache=False` to bypass the cache
+    for a single call. Cached responses are shared between calls, so
+    don't modify results of `get_locations`, `get_nearby_stations`,
+    `get_lines` or `get_interruptions` in place.
+    """
+
+    _single_flight_class = SingleFlight
+
+    @property
+    def request_errors(self):
+        """Errors that bulk calls collect per station instead of raising."""
+        import requests
+        from mvg_api.transport import MissingRecording
+        return (ApiError, requests.RequestException, MissingRecording)
+
+    def __init__(self, *args, transport=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = transport
+
+    @property
+    def session(self):
+        """The underlying :class:`requests.Session`, created on first use."""
+        if self._session is None:
+            self._session = self._make_session()
+        return self._session
+
+    def _make_session(self):
+        # only connection errors, retries on status codes are done in
+        # _fetch so they can respect the rate limiter
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                      respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self.pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent': user_agent,
+            'Accept': 'application/json',
+            'Accept-Encoding': _accept_encoding(),
+            'Connection': 'keep-alive',
+            })
+        return session
+
+    def close(self):
+        """Closes all pooled connections and the transport."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        if self.transport is not None:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _perform_api_request(self, url, endpoint=None, use_cache=True):
+        ttl = self._ttl_for(endpoint, use_cache)
+        if ttl:
+            results = self._cached(url, endpoint)
+            if results is not None:
+                return results
+        if self.single_flight is None:
+            return self._fetch_and_store(url, endpoint, ttl)
+        return self.single_flight.do(url, self._fetch_and_store, url,
+                                     endpoint, ttl)
+
+    def _fetch_and_store(self, url, endpoint, ttl):
+        # cached before the call leaves the single flight, so identical
+        # requests always find one or the other
+        results = self._fetch(url, endpoint)
+        if ttl:
+            self.cache.set(url, results, ttl)
+        return results
+
+    def _fetch(self, url, endpoint=None):
+        hooks = self.hooks
+        if hooks is None:
+            return self._fetch_response(url, endpoint, None)
+        hooks.before_request(endpoint, url)
+        try:
+            return self._fetch_response(url, endpoint, monotonic())
+        except Exception as e:
+            hooks.on_error(endpoint, url, e)
+            raise
+
+    def _fetch_response(self, url, endpoint, started):
+        stored, request_headers = self._conditional_headers(url)
+        attempt = 0
+        while True:
+            wait = self._reserve(endpoint)
+            if wait:
+                sleep(wait)
+            status, headers, body = self._get(url, request_headers, endpoint)
+            delay = self._retry_delay(attempt, status, headers)
+            if delay is None:
+                break
+            attempt += 1
+            if self.hooks is not None:
+                self.hooks.on_retry(endpoint, url, status, delay)
+            sleep(delay)
+        if status >= 400:
+            try:
+                reason = self._decode(body)
+            except ValueError:
+                reason = None
+            raise ApiError(status, reason)
+        if status == 304:
+            if stored is None:
+                # not a conditional request, there is nothing to reuse
+                raise ApiError(status)
+            return self._not_modified(endpoint, url, stored, len(body),
+                                      started)
+        results = self._decode_response(endpoint, url, status, body, started)
+        self._store_validators(url, headers, results)
+        return results
+
+    def _iter_items(self, url, endpoint, prefix):
+        """Yields the objects at `prefix` of the response to `url` while
+        it is being received, see :func:`mvg_api.decoders.iter_items`.
+        Responses are neither cached nor coalesced."""
+        ijson = decoders.get_ijson()
+        if ijson is None or self.transport is not None:
+            results = self._fetch(url, endpoint)
+            yield from models._as_list(results.get(prefix))
+            return
+        hooks = self.hooks
+        if hooks is not None:
+            hooks.before_request(endpoint, url)
+            started = monotonic()
+        try:
+            resp = self._open_stream(url, endpoint)
+            with resp:
+                resp.raw.decode_content = True
+                yield from decoders.iter_items(ijson, resp.raw, prefix)
+                if hooks is not None:
+                    # parsing is interleaved with receiving, so there is
+                    # no separate decode time
+                    hooks.after_response(endpoint, url, resp.status_code,
+                                         resp.raw.tell(),
+                                         monotonic() - started, 0.0)
+        except Exception as e:
+            if hooks is not None:
+                hooks.on_error(endpoint, url, e)
+            raise
+
+    def _open_stream(self, url, endpoint):
+        attempt = 0
+        while True:
+            wait = self._reserve(endpoint)
+            if wait:
+                sleep(wait)
+            _, resp = self._route(url, endpoint, self._send_stream,
+                                  lambda response: response[1].close())
+            delay = self._retry_delay(attempt, resp.status_code,
+                                      resp.headers)
+            if delay is None:
+                break
+            resp.close()
+            attempt += 1
+            if self.hooks is not None:
+                self.hooks.on_retry(endpoint, url, resp.status_code, delay)
+            sleep(delay)
+        if not resp.ok:
+            try:
+                reason = self._decode(resp.content)
+            except ValueError:
+                reason = None
+            raise ApiError(resp.status_code, reason)
+        return resp
+
+    def _get(self, url, headers=None, endpoint=None):
+        return self._route(
+            url, endpoint,
+            lambda url, timeout: self._send(url, headers, timeout))
+
+    def _route(self, url, endpoint, send, discard=None):
+        """Calls `send(url, timeout)` for the servers of `endpoint` in the
+        endpoint registry until one answers without a connection error
+        or a status in `failover_status_codes`, and returns its response,
+        a tuple starting with the status. Responses given up on are
+        passed to `discard`."""
+        if self.endpoints is None:
+            return send(self._upstream_url(url), self.timeout)
+        timeout = self.endpoints.timeout(endpoint, self.timeout)
+        backends = self.endpoints.backends(endpoint)
+        for backend in backends:
+            last = backend is backends[-1]
+            started = monotonic()
+            try:
+                response = send(backend.url(url), timeout)
+            except self.request_errors:
+                self.endpoints.record_failure(backend)
+                if last:
+                    raise
+                continue
+            if not self._record_backend(backend, endpoint, response[0],
+                                        started, last):
+                return response
+            if discard is not None:
+                discard(response)
+
+    def _send(self, url, headers, timeout):
+        if self.transport is not None:
+            return self.transport.get(url, timeout, headers)
+        resp = self.session.get(url, timeout=timeout, headers=headers)
+        return resp.status_code, resp.headers, resp.content
+
+    def _send_stream(self, url, timeout):
+        resp = self.session.get(url, timeout=timeout, stream=True)
+        return resp.status_code, resp
+
+    def get_nearby_stations(self, lat, lon, use_cache=True):
+        """See :func:`mvg_api.get_nearby_stations`."""
+        if lat == 0 or lon == 0:
+            return None
+        url = _nearby_url(lat, lon)
+        stations = self._indexed_nearby_stations(lat, lon, use_cache)
+        if stations:
+            return stations
+        stations = self._perform_api_request(url, 'nearby', use_cache)['locations']
+        self._learn_nearby_stations(stations)
+        return stations
+
+    def get_id_for_station(self, station_name, use_cache=True):
+        """See :func:`mvg_api.get_id_for_station`."""
+        return _first_id(self.get_stations(station_name, use_cache))
+
+    def get_locations(self, query, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_locations`."""
+        url = _locations_url(query)
+        results = self._perform_api_request(url, 'location', use_cache)
+        return _process_locations(results["locations"], as_objects)
+
+    def get_stations(self, station, use_cache=True):
+        """See :func:`mvg_api.get_stations`."""
+        stations = self._indexed_stations(station, use_cache)
+        if stations:
+            return stations
+        return _filter_stations(self.get_locations(station, use_cache))
+
+    def get_route(self, start, dest, use_cache=True, datetimes=True,
+                  as_objects=False, **options):
+        """See :func:`mvg_api.get_route`."""
+        url = _route_url(start, dest, **options)
+        results = self._fetch_route(url, use_cache)
+        return _process_route(results, datetimes, as_objects)
+
+    def iter_route(self, start, dest, datetimes=True, as_objects=False,
+                   **options):
+        """See :func:`mvg_api.iter_route`."""
+        url = _route_url(start, dest, **options)
+        for connection in self._iter_items(url, 'routing', 'connectionList'):
+            yield _process_connection(connection, datetimes, as_objects)
+
+    def get_routes_matrix(self, origins, destinations, max_concurrency=None,
+                          use_cache=True, datetimes=True, **options):
+        """See :func:`mvg_api.get_routes_matrix`."""
+        matrix = models.RouteMatrix(origins, destinations)
+        urls = _matrix_urls(matrix.origins, matrix.destinations, **options)
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(
+                max_workers=max_concurrency or self.pool_size) as pool:
+            futures = {pool.submit(self._fetch_route, url, use_cache,
+                                   self._matrix_route_cache): url
+                       for url in urls}
+            for future in as_completed(futures):
+                try:
+                    result = _process_route(future.result(), datetimes)
+                except self.request_errors as e:
+                    result = e
+                for i, j in urls[futures[future]]:
+                    matrix._set(i, j, result)
+        return matrix
+
+    def _fetch_route(self, url, use_cache, route_cache=None):
+        """Routing results for `url` from `route_cache` (by default
+        :attr:`route_cache`) or the api."""
+        if route_cache is None:
+            route_cache = self.route_cache
+        results = self._cached_route(url, use_cache, route_cache)
+        if results is None:
+            results = self._perform_api_request(url, 'routing', use_cache)
+            self._store_route(url, results, use_cache, route_cache)
+        return results
+
+    def _fetch_departure_response(self, station_id, timeoffset, use_cache):
+        station_id = _normalize_station_id(station_id)
+        url = _departures_url(station_id, timeoffset)
+        results = self._perform_api_request(url, 'departure', use_cache)
+        self._serving_lines.remember(station_id, results)
+        return results
+
+    def get_departures(self, station_id, timeoffset=0, use_cache=True,
+                       as_objects=False):
+        """See :func:`mvg_api.get_departures`."""
+        results = self._fetch_departure_response(station_id, timeoffset,
+                                                 use_cache)
+        return _process_departures(results, as_objects=as_objects)
+
+    def get_station_board(self, station_id, timeoffset=0, use_cache=True):
+        """See :func:`mvg_api.get_station_board`."""
+        results = self._fetch_departure_response(station_id, timeoffset,
+                                                 use_cache)
+        return _process_station_board(results)
+
+    def iter_departures_many(self, station_ids, timeoffset=0,
+                             max_concurrency=None):
+        """See :func:`mvg_api.iter_departures_many`."""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        station_ids = _unique_station_ids(station_ids)
+        pool = ThreadPoolExecutor(max_workers=max_concurrency or self.pool_size)
+        futures = {pool.submit(self.get_departures, station_id, timeoffset):
+                   station_id for station_id in station_ids}
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except self.request_errors as e:
+                    result = e
+                yield futures[future], result
+        finally:
+            # don't keep fetching if the consumer stopped early
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def get_departures_many(self, station_ids, timeoffset=0,
+                            max_concurrency=None):
+        """See :func:`mvg_api.get_departures_many`."""
+        return dict(self.iter_departures_many(station_ids, timeoffset,
+                                              max_concurrency))
+
+    def get_lines(self, station_id, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_lines`."""
+        station_id = _normalize_station_id(station_id)
+        lines = self._serving_lines.get(station_id) if use_cache else None
+        if lines is None:
+            results = self._fetch_departure_response(station_id, 0, use_cache)
+            lines = results['servingLines']
+        return _process_lines(lines, as_objects)
+
+    def get_interruptions(self, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_interruptions`."""
+        results = self._perform_api_request(interruptions_url,
+                                            'interruptions', use_cache)
+        return _process_interruptions(results, as_objects)
+
+    def iter_interruptions(self, as_objects=False):
+        """See :func:`mvg_api.iter_interruptions`."""
+        for interruption in self._iter_items(interruptions_url,
+                                             'interruptions', 'interruption'):
+            yield _process_interruption(interruption, as_objects)
+
+
+_default_client = MvgClient()
+
+
+def get_default_client():
+    """Returns the :class:`MvgClient` used by the module level functions."""
+    return _default_client
+
+
+def set_default_client(client):
+    """Replaces the :class:`MvgClient` used by the module level functions,
+    e.g. to change pool size, timeouts or retries for all of them.
+    """
+    global _default_client
+    _default_client = client
+
+
+def _perform_api_request(url, endpoint=None, use_cache=True):
+    return _default_client._perform_api_request(url, endpoint, use_cache)
+
+
+def get_nearby_stations(lat, lon, use_cache=True):
     """Stations nearby the given location.
 
     Parameters
@@ -126,32 +1051,19 @@ def get_nearby_stations(lat, lon):
          ]
 
     """
-    if lat == 0 or lon == 0:
-        return None
-
-    if not (isinstance(lat, float) and isinstance(lon, float)):
-        raise TypeError()
-
-    url = nearby_url.format(lat=lat, lon=lon)
-
-    results = _perform_api_request(url)
-    return results['locations']
+    return _default_client.get_nearby_stations(lat, lon, use_cache)
 
 
-def get_id_for_station(station_name):
+def get_id_for_station(station_name, use_cache=True):
     """Returns the station_id for the given station name.
 
     If more than one station match, the first result is given.
     `None` is returned if no match was found.
     """
-    try:
-        station = get_stations(station_name)[0]
-    except IndexError:
-        return None
-    return station['id']
+    return _default_client.get_id_for_station(station_name, use_cache)
 
 
-def get_locations(query):
+def get_locations(query, use_cache=True, as_objects=False):
     """Returns all matches from the search for the given query string.
 
     `query` can either be a name of a station or of a street, square, etc.
@@ -183,28 +1095,18 @@ def get_locations(query):
             },
         ]
 
+    With `as_objects=True`, a list of :class:`mvg_api.models.Location`
+    is returned instead.
     """
-    try:
-        query = "{}{}".format(id_prefix, int(query))  # converts old style station id to new style station id
-    except(ValueError):  # happens if it is a station name
-        url = query_url_name.format(name=query)
-    else:  # happens if it is a station id
-        url = query_url_id.format(id=str(query))
-
-    results = _perform_api_request(url)
-    return results["locations"]
+    return _default_client.get_locations(query, use_cache=use_cache,
+                                         as_objects=as_objects)
 
 
-def get_stations(station):
+def get_stations(station, use_cache=True):
     """Like :func:`.get_locations`, but filters out all results which
     are not stations.
     """
-    results = get_locations(station)
-    stations = []
-    for result in results:
-        if result['type'] == 'station':
-            stations.append(result)
-    return stations
+    return _default_client.get_stations(station, use_cache)
 
 
 def get_route(start, dest,
@@ -214,7 +1116,10 @@ def get_route(start, dest,
               ubahn=True,
               bus=True,
               tram=True,
-              sbahn=True):
+              sbahn=True,
+              use_cache=True,
+              datetimes=True,
+              as_objects=False):
     """Plans a route from start to dest
 
     Change in 1.2.2: accepts both 'old-style' integer IDs which were used
@@ -243,72 +1148,66 @@ def get_route(start, dest,
         Specifies if the tram should be considered in the route
     sbahn: bool, optional
         Specifies if the SBahn should be considered in the route
+    use_cache: bool, optional
+        Set to `False` to bypass the response cache of the client.
+    datetimes: bool, optional
+        By default, `departure_datetime` and `arrival_datetime` are
+        added to each connection. Set to `False` to skip this if the
+        `departure` and `arrival` timestamps (in milliseconds) suffice.
+    as_objects: bool, optional
+        Return :class:`mvg_api.models.Connection` objects instead of
+        dicts.
     """
-    url = routing_url
-    options = []
-
-
-    if isinstance(start, tuple) and len(start) == 2:
-        options.append("fromLatitude=" + str(start[0]))
-        options.append("fromLongitude=" + str(start[1]))
-    elif isinstance(start, int):
-        options.append("fromStation=" + _convert_id(start))
-    elif _station_sanity_check(start):
-        options.append("fromStation=" + start)
-    else:
-        raise ValueError("A start must be given;\
-                          either int station id, 'new style' string ids \
-                          or a tuple with latitude and longitude")
-
-
-    if isinstance(dest, tuple) and len(dest) == 2:
-        options.append("toLatitude=" + str(dest[0]))
-        options.append("toLongitude=" + str(dest[1]))
-    elif isinstance(dest, int):
-        options.append("toStation=" + _convert_id(dest))
-    elif _station_sanity_check(dest):
-        options.append("toStation=" + dest)
-    else:
-        raise ValueError("A destination must be given;\
-                          either int station id or tuple latitude longitude")
-
-    if time:
-        if isinstance(time, datetime.datetime):
-            time = _convert_time(time)
-        options.append("time=" + str(time))
-        if arrival_time:
-            options.append("arrival=true")
-    if max_walk_time_to_start:
-        options.append("maxTravelTimeFootwayToStation=" +
-                       str(max_walk_time_to_start))
-    if max_walk_time_to_dest:
-        options.append("maxTravelTimeFootwayToDestination=" +
-                       str(max_walk_time_to_dest))
-
-    if change_limit is not None:  # 'if change_limit:' would not work for 0
-        if isinstance(change_limit, int):
-            options.append("changeLimit=" + str(change_limit))
-
-    if not ubahn:
-        options.append("transportTypeUnderground=false")
-    if not bus:
-        options.append("transportTypeBus=false")
-    if not tram:
-        options.append("transportTypeTram=false")
-    if not sbahn:
-        options.append("transportTypeSBahn=false")
-
-    options_url = "&".join(options)
-    url = routing_url + options_url
-    results = _perform_api_request(url)
-    for connection in results["connectionList"]:
-        connection["departure_datetime"] = \
-            _convert_time(connection["departure"])
-        connection["arrival_datetime"] = _convert_time(connection["arrival"])
-    return results["connectionList"]
+    return _default_client.get_route(
+        start, dest, time=time, arrival_time=arrival_time,
+        max_walk_time_to_start=max_walk_time_to_start,
+        max_walk_time_to_dest=max_walk_time_to_dest,
+        change_limit=change_limit,
+        ubahn=ubahn, bus=bus, tram=tram, sbahn=sbahn,
+        use_cache=use_cache, datetimes=datetimes, as_objects=as_objects)
+
+
+def iter_route(start, dest, datetimes=True, as_objects=False, **options):
+    """Like :func:`get_route`, but yields the connections one by one
+    while the response is still being received.
+
+    The response is parsed incrementally if `ijson` is installed, so the
+    first connection is available early and long connection lists are
+    never held in memory at once. Without `ijson`, the response is
+    decoded at once. Results are never cached.
+    """
+    return _default_client.iter_route(start, dest, datetimes=datetimes,
+                                      as_objects=as_objects, **options)
+
+
+def get_routes_matrix(origins, destinations, max_concurrency=None,
+                      use_cache=True, datetimes=True, **options):
+    """Plans routes from every origin to every destination at once.
+
+    `origins` and `destinations` are lists of anything :func:`get_route`
+    accepts as `start` and `dest`; all other keyword arguments (like
+    `time` or `change_limit`) are passed on to it. The routes are
+    requested concurrently by up to `max_concurrency` threads, and each
+    distinct query is only sent once, even if a pair repeats. Results
+    are kept in the client's `route_cache`, or in a
+    :class:`mvg_api.cache.RouteCache` of matrix calls if it has none,
+    so computing the matrix again only requests queries whose cached
+    connections have all departed. `use_cache=False` bypasses it.
+
+    Returns a :class:`mvg_api.models.RouteMatrix` with the duration and
+    number of changes of the fastest connection of each pair next to
+    all connections. A failing pair doesn't stop the others, its error
+    ends up in `errors`::
+
+        matrix = get_routes_matrix([6, 2], [1060, 70])
+        matrix.durations[0][1]  # minutes from station 6 to 70
+    """
+    return _default_client.get_routes_matrix(
+        origins, destinations, max_concurrency=max_concurrency,
+        use_cache=use_cache, datetimes=datetimes, **options)
 
 
-def get_departures(station_id, timeoffset=0):
+def get_departures(station_id, timeoffset=0, use_cache=True, as_objects=False):
     """Get the next departures for `station_id`. Optionally, define `timeoffset`
     to not show departures sooner than a number of minutes.
 
@@ -337,29 +1236,70 @@ def get_departures(station_id, timeoffset=0):
 
     `departureTimeMinutes`, the time left to the departure in minutes,
     is added to the response from the api for your convenience.
+
+    Responses are cached for a few seconds (see :class:`MvgClient`),
+    pass `use_cache=False` to always fetch a fresh board.
+
+    With `as_objects=True`, a list of :class:`mvg_api.models.Departure`
+    is returned instead.
     """
-    if isinstance(station_id, int):
-        station_id = _convert_id(station_id)
-    elif not _station_sanity_check(station_id):
-        raise TypeError("Please give the int station_id of the station.\
-                         You can find it out by running \
-                         get_id_for_station('Station name')")
-    url = departure_url.format(id=station_id, offset=timeoffset)
-    departures = _perform_api_request(url)['departures']
-    for departure in departures:
-        # For some reason, mvg gives you a Unix timestamp, but in milliseconds.
-        # Here, we convert it to datetime
-        time = _convert_time(departure['departureTime'])
-        relative_time = time - datetime.datetime.now()
-        if 'delay' in departure:
-            delay = departure['delay']
-        else:
-            delay = 0
-        departure[u'departureTimeMinutes'] = relative_time // datetime.timedelta(seconds=60) + delay
-    return departures
+    return _default_client.get_departures(station_id, timeoffset,
+                                          use_cache=use_cache,
+                                          as_objects=as_objects)
+
 
+def get_station_board(station_id, timeoffset=0, use_cache=True):
+    """Get both the next departures and the lines being served for
+    `station_id` with a single request.
 
-def get_lines(station_id):
+    Returns a dict like::
+
+        {
+            'departures': [...],
+            'servingLines': [...],
+        }
+
+    where `departures` looks like the result of :func:`get_departures`
+    and `servingLines` like the one of :func:`get_lines`.
+    """
+    return _default_client.get_station_board(station_id, timeoffset,
+                                             use_cache)
+
+
+def iter_departures_many(station_ids, timeoffset=0, max_concurrency=None):
+    """Like :func:`get_departures_many`, but yields `(station_id, result)`
+    tuples as soon as each station is done, in order of completion.
+
+    A slow station therefore doesn't hold up the ones that already
+    arrived. Stopping the iteration early cancels the pending requests.
+    """
+    return _default_client.iter_departures_many(station_ids, timeoffset,
+                                                max_concurrency)
+
+
+def get_departures_many(station_ids, timeoffset=0, max_concurrency=None):
+    """Get the next departures for many stations at once.
+
+    The stations are fetched concurrently by up to `max_concurrency`
+    threads (by default the connection pool size of the client).
+    Station ids can be given in any form accepted by
+    :func:`get_departures`.
+
+    Returns a dict mapping the normalized `station_id` (like
+    `de:09162:6`) to the list :func:`get_departures` would return.
+    If the request for a station failed, its value is the exception
+    (usually an :class:`ApiError`) instead, so one failing station
+    doesn't stop the whole batch::
+
+        for station_id, result in get_departures_many([6, 2]).items():
+            if isinstance(result, Exception):
+                ...
+    """
+    return _default_client.get_departures_many(station_ids, timeoffset,
+                                               max_concurrency)
+
+
+def get_lines(station_id, use_cache=True, as_objects=False):
     """Get the lines being served for `station_id`.
 
     Change in 1.2.2: accepts both 'old-style' integer IDs which were used
@@ -385,21 +1325,38 @@ def get_lines(station_id):
     Note: The api seemingly only returns a single object per
     line served, meaning that both directions of a line are
     represented only by a single line in the response.
+
+    The lines are part of every departure response, so if departures
+    for the same station were fetched recently (see the `lines_max_age`
+    parameter of :class:`MvgClient`), no new request is made.
+
+    With `as_objects=True`, a list of :class:`mvg_api.models.ServingLine`
+    is returned instead.
     """
-    if isinstance(station_id, int):
-        station_id = _convert_id(station_id)
-    elif not _station_sanity_check(station_id):
-        raise TypeError("Please give the int station_id of the station.\
-                         You can find it out by running \
-                         get_id_for_station('Station name')")
-    url = departure_url.format(id=station_id, offset=0)
-    return _perform_api_request(url)['servingLines']
+    return _default_client.get_lines(station_id, use_cache=use_cache,
+                                     as_objects=as_objects)
 
 
-def get_interruptions():
-    url = interruptions_url
-    interruptions = _perform_api_request(url)
-    return interruptions
+def get_interruptions(use_cache=True, as_objects=False):
+    """Get the current service interruptions and planned changes.
+
+    Returns the payload of the api as it is, or with `as_objects=True`
+    a list of :class:`mvg_api.models.Interruption`.
+    """
+    return _default_client.get_interruptions(use_cache=use_cache,
+                                             as_objects=as_objects)
+
+
+def iter_interruptions(as_objects=False):
+    """Like :func:`get_interruptions`, but yields the interruptions one
+    by one while the response is still being received.
+
+    The response is parsed incrementally if `ijson` is installed, so the
+    first interruption is available early and the whole payload is never
+    held in memory. Without `ijson`, the response is decoded at once.
+    Results are never cached.
+    """
+    return _default_client.iter_interruptions(as_objects=as_objects)
 
 
 class Station:
@@ -407,15 +1364,17 @@ class Station:
     station.
 
     Either give it an exact station name (like "Hauptbahnhof")
-    or a station_id.
+    or a station_id. Pass `client` to use an :class:`MvgClient` other
+    than the default one.
 
     Deprecated-ish: This is not really all that useful.
     Just using :func:`get_id_for_station` and :func:`get_departures`
     really is the nicer way in most cases.
     """
 
-    def __init__(self, station):
-        matching_stations = get_stations(station)
+    def __init__(self, station, client=None):
+        self.client = client or _default_client
+        matching_stations = self.client.get_stations(station)
         if matching_stations == []:
             raise NameError("No matching station found")
         else:
@@ -425,10 +1384,13 @@ class Station:
             self.longitude = matching_stations[0]["longitude"]
 
     def get_departures(self, timeoffset=0):
-        return get_departures(self.id, timeoffset)
+        return self.client.get_departures(self.id, timeoffset)
 
     def get_lines(self):
-        return get_lines(self.id)
+        return self.client.get_lines(self.id)
+
+    def get_board(self, timeoffset=0):
+        return self.client.get_station_board(self.id, timeoffset)
 
     def __repr__(self):
         return "Station(id=%s, name='%s')" % (self.id, self.name)
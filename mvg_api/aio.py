@@ -0,0 +1,617 @@
+# coding=utf-8
+"""asyncio versions of the functions in :mod:`mvg_api`.
+
+Every coroutine here mirrors the blocking function of the same name and
+shares its URL building and response post-processing, so results look
+exactly the same. Requires `aiohttp` (``pip install mvg_api[aio]``).
+
+The module level coroutines share the connections of a default client.
+They are closed when the event loop is shut down by :func:`asyncio.run`;
+if you run the loop yourself, ``await mvg_api.aio.close()`` before
+closing it.
+"""
+
+import asyncio
+from time import monotonic
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    raise ImportError("mvg_api.aio requires aiohttp, "
+                      "install it with 'pip install mvg_api[aio]'")
+
+from mvg_api import (
+    ApiError, user_agent, interruptions_url, _BaseClient, _accept_encoding,
+    _nearby_url, _locations_url, _filter_stations, _first_id,
+    _route_url, _process_route, _departures_url, _process_departures,
+    _unique_station_ids, _normalize_station_id, _process_station_board,
+    _process_locations, _process_lines, _process_interruptions, _matrix_urls,
+    _process_connection, _process_interruption,
+)
+from mvg_api import decoders, models
+from mvg_api.ratelimit import backoff_delay
+from mvg_api.singleflight import AsyncSingleFlight
+
+# errors after which a request is retried, or sent to the next server
+_connection_errors = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+async def _close_at_shutdown(session):
+    """Closes `session` once this task is cancelled, which
+    :func:`asyncio.run` does to all remaining tasks before it closes the
+    loop."""
+    try:
+        await asyncio.get_event_loop().create_future()
+    finally:
+        await session.close()
+
+
+def _client_timeout(timeout):
+    """:class:`aiohttp.ClientTimeout` for a timeout as the blocking
+    client takes it, seconds or a `(connect, read)` tuple."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+def _timeout_options(timeout):
+    """Request options overriding the timeout of the session with
+    `timeout`, unless it is `None`."""
+    if timeout is None:
+        return {}
+    return {'timeout': _client_timeout(timeout)}
+
+
+class AsyncMvgClient(_BaseClient):
+    """asyncio counterpart of :class:`mvg_api.MvgClient`.
+
+    All coroutines share one pooled `aiohttp` session, which is created
+    on first use inside the running event loop. Close it with
+    :meth:`close` or by using the client as an async context manager.
+    Otherwise it is closed when :func:`asyncio.run` shuts the loop down,
+    and a new one is created for the next loop.
+
+    Parameters are the same as for :class:`mvg_api.MvgClient`.
+    """
+
+    # errors that bulk calls collect per station instead of raising
+    request_errors = (ApiError, aiohttp.ClientError, asyncio.TimeoutError)
+    _single_flight_class = AsyncSingleFlight
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_loop = None
+        self._closer = None
+
+    @property
+    def session(self):
+        """The underlying :class:`aiohttp.ClientSession`.
+
+        A new session is created if there is none yet or if the old one
+        belongs to another (e.g. already finished) event loop. Sessions
+        are closed when their loop shuts down.
+        """
+        loop = asyncio.get_event_loop()
+        if (self._session is None or self._session.closed
+                or self._session_loop is not loop):
+            self._session = self._make_session()
+            self._session_loop = loop
+            self._closer = loop.create_task(
+                _close_at_shutdown(self._session))
+        return self._session
+
+    def _make_session(self):
+        timeout = _client_timeout(self.timeout)
+        connector = aiohttp.TCPConnector(limit_per_host=self.pool_size)
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={
+                'User-Agent': user_agent,
+                'Accept': 'application/json',
+                'Accept-Encoding': _accept_encoding(),
+                })
+
+    async def close(self):
+        """Closes all pooled connections."""
+        if self._closer is not None:
+            self._closer.cancel()
+            self._closer = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _perform_api_request(self, url, endpoint=None, use_cache=True):
+        ttl = self._ttl_for(endpoint, use_cache)
+        if ttl:
+            results = self._cached(url, endpoint)
+            if results is not None:
+                return results
+        if self.single_flight is None:
+            return await self._fetch_and_store(url, endpoint, ttl)
+        return await self.single_flight.do(url, self._fetch_and_store, url,
+                                           endpoint, ttl)
+
+    async def _fetch_and_store(self, url, endpoint, ttl):
+        """Async version of :meth:`mvg_api.MvgClient._fetch_and_store`."""
+        results = await self._fetch(url, endpoint)
+        if ttl:
+            self.cache.set(url, results, ttl)
+        return results
+
+    async def _fetch(self, url, endpoint=None):
+        hooks = self.hooks
+        if hooks is None:
+            return await self._fetch_response(url, endpoint, None)
+        hooks.before_request(endpoint, url)
+        try:
+            return await self._fetch_response(url, endpoint, monotonic())
+        except Exception as e:
+            hooks.on_error(endpoint, url, e)
+            raise
+
+    async def _fetch_response(self, url, endpoint, started):
+        stored, request_headers = self._conditional_headers(url)
+        attempt = 0
+        while True:
+            wait = self._reserve(endpoint)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                status, headers, body = await self._get(url, request_headers,
+                                                        endpoint)
+            except _connection_errors:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                delay = backoff_delay(attempt, self.backoff_factor)
+                if self.hooks is not None:
+                    self.hooks.on_retry(endpoint, url, None, delay)
+                await asyncio.sleep(delay)
+                continue
+            delay = self._retry_delay(attempt, status, headers)
+            if delay is None:
+                break
+            attempt += 1
+            if self.hooks is not None:
+                self.hooks.on_retry(endpoint, url, status, delay)
+            await asyncio.sleep(delay)
+        if status >= 400:
+            try:
+                reason = self._decode(body)
+            except ValueError:
+                reason = None
+            raise ApiError(status, reason)
+        if status == 304:
+            if stored is None:
+                # not a conditional request, there is nothing to reuse
+                raise ApiError(status)
+            return self._not_modified(endpoint, url, stored, len(body),
+                                      started)
+        results = self._decode_response(endpoint, url, status, body, started)
+        self._store_validators(url, headers, results)
+        return results
+
+    async def _get(self, url, headers=None, endpoint=None):
+        """Async version of :meth:`mvg_api.MvgClient._get`."""
+        async def send(url, timeout):
+            return await self._send(url, headers, timeout)
+        return await self._route(url, endpoint, send)
+
+    async def _route(self, url, endpoint, send, discard=None):
+        """Async version of :meth:`mvg_api.MvgClient._route`."""
+        if self.endpoints is None:
+            return await send(self._upstream_url(url), None)
+        timeout = self.endpoints.timeout(endpoint)
+        backends = self.endpoints.backends(endpoint)
+        for backend in backends:
+            last = backend is backends[-1]
+            started = monotonic()
+            try:
+                response = await send(backend.url(url), timeout)
+            except _connection_errors:
+                self.endpoints.record_failure(backend)
+                if last:
+                    raise
+                continue
+            if not self._record_backend(backend, endpoint, response[0],
+                                        started, last):
+                return response
+            if discard is not None:
+                discard(response)
+
+    async def _send(self, url, headers, timeout):
+        """`timeout` overrides the timeout of the session, if given."""
+        async with self.session.get(url, headers=headers,
+                                    **_timeout_options(timeout)) as resp:
+            return resp.status, resp.headers, await resp.read()
+
+    async def _send_stream(self, url, timeout):
+        resp = await self.session.get(url, **_timeout_options(timeout))
+        return resp.status, resp
+
+    async def _iter_items(self, url, endpoint, prefix):
+        """Async version of :meth:`mvg_api.MvgClient._iter_items`."""
+        ijson = decoders.get_ijson()
+        if ijson is None:
+            results = await self._fetch(url, endpoint)
+            for item in models._as_list(results.get(prefix)):
+                yield item
+            return
+        hooks = self.hooks
+        if hooks is not None:
+            hooks.before_request(endpoint, url)
+            started = monotonic()
+        try:
+            resp = await self._open_stream(url, endpoint)
+            async with resp:
+                builder = decoders.ItemBuilder(ijson, prefix)
+                async for path, event, value in ijson.parse_async(
+                        resp.content, use_float=True):
+                    item = builder.feed(path, event, value)
+                    if item is not None:
+                        yield item
+                if hooks is not None:
+                    hooks.after_response(endpoint, url, resp.status,
+                                         resp.content.total_bytes,
+                                         monotonic() - started, 0.0)
+        except Exception as e:
+            if hooks is not None:
+                hooks.on_error(endpoint, url, e)
+            raise
+
+    async def _open_stream(self, url, endpoint):
+        attempt = 0
+        while True:
+            wait = self._reserve(endpoint)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                _, resp = await self._route(
+                    url, endpoint, self._send_stream,
+                    lambda response: response[1].release())
+            except _connection_errors:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                delay = backoff_delay(attempt, self.backoff_factor)
+                if self.hooks is not None:
+                    self.hooks.on_retry(endpoint, url, None, delay)
+                await asyncio.sleep(delay)
+                continue
+            delay = self._retry_delay(attempt, resp.status, resp.headers)
+            if delay is None:
+                break
+            resp.release()
+            attempt += 1
+            if self.hooks is not None:
+                self.hooks.on_retry(endpoint, url, resp.status, delay)
+            await asyncio.sleep(delay)
+        if resp.status >= 400:
+            body = await resp.read()
+            resp.release()
+            try:
+                reason = self._decode(body)
+            except ValueError:
+                reason = None
+            raise ApiError(resp.status, reason)
+        return resp
+
+    async def get_nearby_stations(self, lat, lon, use_cache=True):
+        """See :func:`mvg_api.get_nearby_stations`."""
+        if lat == 0 or lon == 0:
+            return None
+        url = _nearby_url(lat, lon)
+        stations = self._indexed_nearby_stations(lat, lon, use_cache)
+        if stations:
+            return stations
+        results = await self._perform_api_request(url, 'nearby', use_cache)
+        self._learn_nearby_stations(results['locations'])
+        return results['locations']
+
+    async def get_id_for_station(self, station_name, use_cache=True):
+        """See :func:`mvg_api.get_id_for_station`."""
+        return _first_id(await self.get_stations(station_name, use_cache))
+
+    async def get_locations(self, query, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_locations`."""
+        url = _locations_url(query)
+        results = await self._perform_api_request(url, 'location', use_cache)
+        return _process_locations(results["locations"], as_objects)
+
+    async def get_stations(self, station, use_cache=True):
+        """See :func:`mvg_api.get_stations`."""
+        stations = self._indexed_stations(station, use_cache)
+        if stations:
+            return stations
+        return _filter_stations(await self.get_locations(station, use_cache))
+
+    async def get_route(self, start, dest, use_cache=True, datetimes=True,
+                        as_objects=False, **options):
+        """See :func:`mvg_api.get_route`."""
+        url = _route_url(start, dest, **options)
+        results = await self._fetch_route(url, use_cache)
+        return _process_route(results, datetimes, as_objects)
+
+    async def iter_route(self, start, dest, datetimes=True, as_objects=False,
+                         **options):
+        """See :func:`mvg_api.iter_route`."""
+        url = _route_url(start, dest, **options)
+        async for connection in self._iter_items(url, 'routing',
+                                                 'connectionList'):
+            yield _process_connection(connection, datetimes, as_objects)
+
+    async def get_routes_matrix(self, origins, destinations,
+                                max_concurrency=None, use_cache=True,
+                                datetimes=True, **options):
+        """See :func:`mvg_api.get_routes_matrix`."""
+        matrix = models.RouteMatrix(origins, destinations)
+        urls = _matrix_urls(matrix.origins, matrix.destinations, **options)
+        semaphore = asyncio.Semaphore(max_concurrency or self.pool_size)
+
+        async def fetch(url):
+            async with semaphore:
+                try:
+                    results = await self._fetch_route(
+                        url, use_cache, self._matrix_route_cache)
+                    result = _process_route(results, datetimes)
+                except self.request_errors as e:
+                    result = e
+            for i, j in urls[url]:
+                matrix._set(i, j, result)
+
+        await asyncio.gather(*[fetch(url) for url in urls])
+        return matrix
+
+    async def _fetch_route(self, url, use_cache, route_cache=None):
+        """Async version of :meth:`mvg_api.MvgClient._fetch_route`."""
+        if route_cache is None:
+            route_cache = self.route_cache
+        results = self._cached_route(url, use_cache, route_cache)
+        if results is None:
+            results = await self._perform_api_request(url, 'routing',
+                                                      use_cache)
+            self._store_route(url, results, use_cache, route_cache)
+        return results
+
+    async def _fetch_departure_response(self, station_id, timeoffset,
+                                        use_cache):
+        station_id = _normalize_station_id(station_id)
+        url = _departures_url(station_id, timeoffset)
+        results = await self._perform_api_request(url, 'departure', use_cache)
+        self._serving_lines.remember(station_id, results)
+        return results
+
+    async def get_departures(self, station_id, timeoffset=0, use_cache=True,
+                             as_objects=False):
+        """See :func:`mvg_api.get_departures`."""
+        results = await self._fetch_departure_response(
+            station_id, timeoffset, use_cache)
+        return _process_departures(results, as_objects=as_objects)
+
+    async def get_station_board(self, station_id, timeoffset=0,
+                                use_cache=True):
+        """See :func:`mvg_api.get_station_board`."""
+        results = await self._fetch_departure_response(
+            station_id, timeoffset, use_cache)
+        return _process_station_board(results)
+
+    async def iter_departures_many(self, station_ids, timeoffset=0,
+                                   max_concurrency=None):
+        """See :func:`mvg_api.iter_departures_many`.
+
+        This is an async generator, use it with ``async for``.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.pool_size)
+
+        async def fetch(station_id):
+            async with semaphore:
+                try:
+                    result = await self.get_departures(station_id, timeoffset)
+                except self.request_errors as e:
+                    result = e
+            return station_id, result
+
+        tasks = [asyncio.ensure_future(fetch(station_id))
+                 for station_id in _unique_station_ids(station_ids)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_departures_many(self, station_ids, timeoffset=0,
+                                  max_concurrency=None):
+        """See :func:`mvg_api.get_departures_many`."""
+        results = {}
+        async for station_id, result in self.iter_departures_many(
+                station_ids, timeoffset, max_concurrency):
+            results[station_id] = result
+        return results
+
+    async def get_lines(self, station_id, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_lines`."""
+        station_id = _normalize_station_id(station_id)
+        lines = self._serving_lines.get(station_id) if use_cache else None
+        if lines is None:
+            results = await self._fetch_departure_response(
+                station_id, 0, use_cache)
+            lines = results['servingLines']
+        return _process_lines(lines, as_objects)
+
+    async def get_interruptions(self, use_cache=True, as_objects=False):
+        """See :func:`mvg_api.get_interruptions`."""
+        results = await self._perform_api_request(
+            interruptions_url, 'interruptions', use_cache)
+        return _process_interruptions(results, as_objects)
+
+    async def iter_interruptions(self, as_objects=False):
+        """See :func:`mvg_api.iter_interruptions`."""
+        async for interruption in self._iter_items(
+                interruptions_url, 'interruptions', 'interruption'):
+            yield _process_interruption(interruption, as_objects)
+
+
+_default_client = AsyncMvgClient()
+
+
+def get_default_client():
+    """Returns the :class:`AsyncMvgClient` used by the module level
+    coroutines."""
+    return _default_client
+
+
+def set_default_client(client):
+    """Replaces the :class:`AsyncMvgClient` used by the module level
+    coroutines."""
+    global _default_client
+    _default_client = client
+
+
+async def close():
+    """Closes the connections of the default client. Needed before
+    closing an event loop which wasn't started by :func:`asyncio.run`.
+    """
+    await _default_client.close()
+
+
+async def get_nearby_stations(lat, lon, use_cache=True):
+    """See :func:`mvg_api.get_nearby_stations`."""
+    return await _default_client.get_nearby_stations(lat, lon, use_cache)
+
+
+async def get_id_for_station(station_name, use_cache=True):
+    """See :func:`mvg_api.get_id_for_station`."""
+    return await _default_client.get_id_for_station(station_name, use_cache)
+
+
+async def get_locations(query, use_cache=True, as_objects=False):
+    """See :func:`mvg_api.get_locations`."""
+    return await _default_client.get_locations(query, use_cache=use_cache,
+                                               as_objects=as_objects)
+
+
+async def get_stations(station, use_cache=True):
+    """See :func:`mvg_api.get_stations`."""
+    return await _default_client.get_stations(station, use_cache)
+
+
+async def get_route(start, dest, **options):
+    """See :func:`mvg_api.get_route`."""
+    return await _default_client.get_route(start, dest, **options)
+
+
+def iter_route(start, dest, **options):
+    """See :func:`mvg_api.iter_route`.
+
+    This is an async generator, use it with ``async for``.
+    """
+    return _default_client.iter_route(start, dest, **options)
+
+
+async def get_routes_matrix(origins, destinations, **options):
+    """See :func:`mvg_api.get_routes_matrix`."""
+    return await _default_client.get_routes_matrix(origins, destinations,
+                                                   **options)
+
+
+async def get_departures(station_id, timeoffset=0, use_cache=True,
+                         as_objects=False):
+    """See :func:`mvg_api.get_departures`."""
+    return await _default_client.get_departures(
+        station_id, timeoffset, use_cache=use_cache, as_objects=as_objects)
+
+
+async def get_station_board(station_id, timeoffset=0, use_cache=True):
+    """See :func:`mvg_api.get_station_board`."""
+    return await _default_client.get_station_board(station_id, timeoffset,
+                                                   use_cache)
+
+
+def iter_departures_many(station_ids, timeoffset=0, max_concurrency=None):
+    """See :func:`mvg_api.iter_departures_many`.
+
+    This is an async generator, use it with ``async for``.
+    """
+    return _default_client.iter_departures_many(station_ids, timeoffset,
+                                                max_concurrency)
+
+
+async def get_departures_many(station_ids, timeoffset=0, max_concurrency=None):
+    """See :func:`mvg_api.get_departures_many`."""
+    return await _default_client.get_departures_many(
+        station_ids, timeoffset, max_concurrency)
+
+
+async def get_lines(station_id, use_cache=True, as_objects=False):
+    """See :func:`mvg_api.get_lines`."""
+    return await _default_client.get_lines(station_id, use_cache=use_cache,
+                                           as_objects=as_objects)
+
+
+async def get_interruptions(use_cache=True, as_objects=False):
+    """See :func:`mvg_api.get_interruptions`."""
+    return await _default_client.get_interruptions(use_cache=use_cache,
+                                                   as_objects=as_objects)
+
+
+def iter_interruptions(as_objects=False):
+    """See :func:`mvg_api.iter_interruptions`.
+
+    This is an async generator, use it with ``async for``.
+    """
+    return _default_client.iter_interruptions(as_objects=as_objects)
+
+
+class Station:
+    """asyncio version of :class:`mvg_api.Station`.
+
+    The station is looked up when the object is awaited::
+
+        station = await Station("Hauptbahnhof")
+        departures = await station.get_departures()
+    """
+
+    def __init__(self, station, client=None):
+        self.client = client or _default_client
+        self.query = station
+        self.id = None
+
+    async def _resolve(self):
+        if self.id is None:
+            matching_stations = await self.client.get_stations(self.query)
+            if matching_stations == []:
+                raise NameError("No matching station found")
+            self.id = matching_stations[0]["id"]
+            self.name = matching_stations[0]["name"]
+            self.latitude = matching_stations[0]["latitude"]
+            self.longitude = matching_stations[0]["longitude"]
+        return self
+
+    def __await__(self):
+        return self._resolve().__await__()
+
+    async def get_departures(self, timeoffset=0):
+        await self._resolve()
+        return await self.client.get_departures(self.id, timeoffset)
+
+    async def get_lines(self):
+        await self._resolve()
+        return await self.client.get_lines(self.id)
+
+    async def get_board(self, timeoffset=0):
+        await self._resolve()
+        return await self.client.get_station_board(self.id, timeoffset)
+
+    def __repr__(self):
+        if self.id is None:
+            return "Station(query='%s')" % (self.query,)
+        return "Station(id=%s, name='%s')" % (self.id, self.name)
@@ -0,0 +1,201 @@
+# coding=utf-8
+"""Response caching for :class:`mvg_api.MvgClient`."""
+
+import threading
+from collections import OrderedDict
+from time import monotonic, time as current_time
+
+
+class TTLCache:
+    """A thread-safe, size bounded LRU cache whose entries expire.
+
+    Every entry gets its own time to live when it is stored. Once
+    `maxsize` entries are stored, the least recently used one is evicted.
+
+    Any object with the same :meth:`get` and :meth:`set` methods can be
+    given to :class:`mvg_api.MvgClient` instead, e.g. to share a cache
+    between processes.
+
+    :ivar hits: number of lookups answered from the cache
+    :ivar misses: number of lookups not found or expired
+    :ivar evictions: number of entries dropped to stay within `maxsize`
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value stored for `key`, or `default` if there is
+        none or it has expired."""
+        with self._lock:
+            try:
+                expires, value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires <= monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        """Stores `value` for `ttl` seconds."""
+        with self._lock:
+            self._entries[key] = (monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries, but keeps the counters."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the counters and the current size as a dict."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RouteCache:
+    """Caches routing results by query instead of by exact url.
+
+    Queries are canonicalized before the lookup: their options are
+    sorted, and the `time` option is rounded down to `granularity`
+    seconds, so plannings of the same trip a few seconds apart share
+    an entry. A cached result is only reused with the connections
+    that leave at or after the requested time and haven't departed
+    yet; if none are left, the lookup is a miss. So is a query for an
+    earlier time than the entry was fetched for, as connections leaving
+    in between would be missing.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Number of queries to keep; the least recently used is evicted.
+    max_age : float, optional
+        Seconds after which an entry is dropped regardless.
+    granularity : float, optional
+        Seconds the `time` of a query is rounded down to.
+
+    :ivar hits: number of lookups answered from the cache
+    :ivar misses: number of lookups not found, expired or with all
+        connections gone
+    :ivar evictions: number of entries dropped to stay within `maxsize`
+    :ivar expirations: number of entries dropped for being too old
+    """
+
+    def __init__(self, maxsize=256, max_age=300, granularity=60):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.granularity = granularity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def canonical(self, url):
+        """Returns the cache key for a routing `url` and the earliest
+        departure (unix time in milliseconds, or `None`) it asks for."""
+        base, _, query = url.partition('?')
+        options = [option for option in query.split('&') if option]
+        arrival = 'arrival=true' in options
+        step = max(int(self.granularity * 1000), 1)
+        earliest = None
+        for index, option in enumerate(options):
+            name, _, value = option.partition('=')
+            if name != 'time':
+                continue
+            try:
+                time = int(value)
+            except ValueError:
+                continue
+            if not arrival:
+                earliest = time
+            options[index] = 'time={}'.format(time // step * step)
+        return base + '?' + '&'.join(sorted(options)), earliest
+
+    def get(self, url, default=None):
+        """Returns the cached result for the query of `url` with the
+        connections that can still be taken, or `default`."""
+        key, earliest = self.canonical(url)
+        now = current_time() * 1000
+        earliest = now if earliest is None else max(earliest, now)
+        with self._lock:
+            try:
+                stored, fetched_for, results = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if monotonic() - stored > self.max_age:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            if earliest < fetched_for:
+                self.misses += 1
+                return default
+            connections = [connection for connection
+                           in results.get('connectionList') or ()
+                           if connection['departure'] >= earliest]
+            if not connections:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(results, connectionList=connections)
+
+    def set(self, url, results):
+        """Stores the routing result `results` for the query of `url`."""
+        key, earliest = self.canonical(url)
+        if earliest is None:
+            earliest = current_time() * 1000
+        with self._lock:
+            self._entries[key] = (monotonic(), earliest, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries, but keeps the counters."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the counters, the hit rate and the current size as a
+        dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                }
+
+    def __len__(self):
+        return len(self._entries)
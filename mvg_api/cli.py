@@ -0,0 +1,350 @@
+# coding=utf-8
+"""The `mvg` command line tool.
+
+::
+
+    mvg departures Hauptbahnhof --watch 30
+    mvg route Marienplatz 'de:09162:70' --time 08:15
+    mvg nearby 48.1374 11.5755
+    mvg interruptions --line U2
+
+Stations can be given by name, number or id. All commands print a
+table by default, or one JSON object per line (``--format ndjson``) or
+CSV (``--format csv``) for further processing. ``mvg departures -``
+reads stations from stdin, one per line, and prints each board as soon
+as it arrives. A station that can't be found or fetched is reported (as
+error record with ``--format ndjson``, on stderr otherwise) without
+stopping the others.
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import queue
+import sys
+import threading
+import time
+
+import mvg_api
+from mvg_api.interruptions import InterruptionIndex
+
+
+def _clock(timestamp):
+    if timestamp is None:
+        return ''
+    return mvg_api._convert_time(timestamp).strftime('%H:%M')
+
+
+def _date(timestamp):
+    if timestamp is None:
+        return ''
+    return mvg_api._convert_time(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def _parse_time(value):
+    """Parses `HH:MM` (today) or `YYYY-MM-DDTHH:MM`."""
+    for fmt in ('%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    try:
+        clock = datetime.datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid time {!r}, use HH:MM or YYYY-MM-DDTHH:MM".format(value))
+    return datetime.datetime.combine(datetime.date.today(), clock)
+
+
+def _station_id(client, station):
+    """Resolves a station number, id or name to a station id."""
+    if station.isdigit():
+        return mvg_api._convert_id(int(station))
+    if mvg_api._station_sanity_check(station):
+        return station
+    station_id = client.get_id_for_station(station)
+    if station_id is None:
+        raise LookupError("No station found for {!r}".format(station))
+    return station_id
+
+
+def _route_lines(connection):
+    return " ".join(part.get('label') or part.get('product') or '?'
+                    for part in connection.get('connectionPartList') or ()
+                    if part.get('connectionPartType') == 'TRANSPORTATION')
+
+
+# columns of the table and csv output per command, as
+# (header, width, function of the row)
+_departure_columns = (
+    ('station', 12, lambda row: row['station']),
+    ('min', 4, lambda row: row.get('departureTimeMinutes')),
+    ('time', 5, lambda row: _clock(row.get('departureTime'))),
+    ('line', 5, lambda row: row.get('label')),
+    ('destination', 30, lambda row: row.get('destination')),
+    ('delay', 5, lambda row: row.get('delay')),
+    ('product', 8, lambda row: row.get('product')),
+)
+_route_columns = (
+    ('departure', 9, lambda row: _clock(row.get('departure'))),
+    ('arrival', 7, lambda row: _clock(row.get('arrival'))),
+    ('minutes', 7,
+     lambda row: (row['arrival'] - row['departure']) // 60000),
+    ('changes', 7, lambda row: mvg_api.models.count_changes(
+        row.get('connectionPartList'))),
+    ('lines', 30, _route_lines),
+)
+_nearby_columns = (
+    ('id', 14, lambda row: row.get('id')),
+    ('name', 30, lambda row: row.get('name')),
+    ('products', 30, lambda row: " ".join(row.get('products') or ())),
+)
+_interruption_columns = (
+    ('lines', 14, lambda row: " ".join(
+        line.get('line') or '' for line in
+        mvg_api.models.interruption_lines(row))),
+    ('from', 16,
+     lambda row: _date((row.get('duration') or {}).get('from'))),
+    ('until', 16,
+     lambda row: _date((row.get('duration') or {}).get('until'))),
+    ('title', 50, lambda row: row.get('title')),
+)
+
+
+class _Output:
+    """Writes rows as table, ndjson or csv, flushing after every row so
+    the output can be piped while it is still being produced."""
+
+    def __init__(self, columns, format='table', stream=None):
+        self.columns = columns
+        self.format = format
+        self.stream = stream or sys.stdout
+        self._header = False
+        self._csv = None
+
+    def write(self, row):
+        if self.format == 'ndjson':
+            self.stream.write(json.dumps(row, default=str,
+                                         ensure_ascii=False) + "\n")
+        else:
+            values = [column[2](row) for column in self.columns]
+            values = ['' if value is None else value for value in values]
+            if self.format == 'csv':
+                if self._csv is None:
+                    self._csv = csv.writer(self.stream)
+                    self._csv.writerow(
+                        [column[0] for column in self.columns])
+                self._csv.writerow(values)
+            else:
+                if not self._header:
+                    self._line([column[0] for column in self.columns])
+                    self._header = True
+                self._line(values)
+        self.stream.flush()
+
+    def _line(self, values):
+        self.stream.write("  ".join(
+            str(value).ljust(column[1])
+            for column, value in zip(self.columns, values)).rstrip() + "\n")
+
+    def clear(self):
+        """Starts the table over, at the top of the terminal if there
+        is one."""
+        if self.format == 'table':
+            if self.stream.isatty():
+                self.stream.write("\x1b[H\x1b[2J")
+            self._header = False
+
+
+def _read_stations(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def _map_unordered(function, items, workers):
+    """Yields `function(item)` for all `items`, computed by up to
+    `workers` threads, in the order they finish.
+
+    Items are taken from `items` while earlier ones are still being
+    processed, so results for stations piped in come out while the pipe
+    is still being read. `function` must not raise.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=workers)
+    results = queue.Queue()
+    finished = object()
+    futures = []
+
+    def run(item):
+        results.put(function(item))
+
+    def submit():
+        try:
+            try:
+                for item in items:
+                    futures.append(pool.submit(run, item))
+            except RuntimeError:
+                pass  # the pool was shut down, the consumer stopped
+            pool.shutdown(wait=True)
+        finally:
+            results.put(finished)
+
+    threading.Thread(target=submit, daemon=True).start()
+    try:
+        while True:
+            result = results.get()
+            if result is finished:
+                return
+            yield result
+    finally:
+        # don't keep fetching if the consumer stopped early
+        for future in list(futures):
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def _fetch_departures(client, station, offset):
+    """Returns `(station id, departures)` for a station name, number or
+    id, with the exception instead of the departures if that failed. A
+    station that can't be resolved is returned as it was given."""
+    try:
+        station = _station_id(client, station)
+        return station, client.get_departures(station, offset)
+    except client.request_errors + (LookupError,) as e:
+        return station, e
+
+
+def departures(client, args, output):
+    stations = args.stations
+    if stations == ['-']:
+        stations = _read_stations(sys.stdin)
+        if args.watch:
+            # every refresh needs the stations again
+            stations = list(stations)
+    errors = 0
+    while True:
+        output.clear()
+        for station_id, result in _map_unordered(
+                lambda station: _fetch_departures(client, station,
+                                                  args.offset),
+                stations, client.pool_size):
+            if isinstance(result, Exception):
+                errors += 1
+                if output.format == 'ndjson':
+                    output.write({'station': station_id,
+                                  'error': str(result)})
+                else:
+                    print("{}: {}".format(station_id, result),
+                          file=sys.stderr)
+                continue
+            for departure in result[:args.limit]:
+                output.write(dict(departure, station=station_id))
+        if not args.watch:
+            return 1 if errors else 0
+        time.sleep(args.watch)
+
+
+def route(client, args, output):
+    start = _station_id(client, args.start)
+    dest = _station_id(client, args.dest)
+    connections = client.get_route(
+        start, dest, time=args.time, arrival_time=args.arrival,
+        change_limit=args.change_limit, datetimes=False)
+    for connection in connections:
+        output.write(connection)
+
+
+def nearby(client, args, output):
+    for station in client.get_nearby_stations(args.lat, args.lon) or ():
+        output.write(station)
+
+
+def interruptions(client, args, output):
+    index = InterruptionIndex(client.get_interruptions())
+    if args.line:
+        matches = index.by_line(args.line)
+    elif args.station:
+        matches = index.by_station(_station_id(client, args.station))
+    else:
+        matches = list(index)
+    if args.active:
+        active = {interruption.get('id') for interruption in index.active()}
+        matches = [interruption for interruption in matches
+                   if interruption.get('id') in active]
+    for interruption in matches:
+        output.write(interruption)
+
+
+def _make_parser():
+    parser = argparse.ArgumentParser(
+        prog='mvg', description="Departures, routes and interruptions "
+                                "of the Munich public transport (MVG).")
+    parser.add_argument('--format', choices=('table', 'ndjson', 'csv'),
+                        default='table', help="output format")
+    commands = parser.add_subparsers(metavar='command')
+
+    command = commands.add_parser(
+        'departures', help="next departures at stations")
+    command.add_argument('stations', nargs='+', metavar='station',
+                         help="station name, number or id, or - to read "
+                              "them from stdin")
+    command.add_argument('--offset', type=int, default=0,
+                         help="minutes of walking to the station")
+    command.add_argument('--limit', type=int, default=None,
+                         help="departures per station")
+    command.add_argument('--watch', type=float, metavar='SECONDS',
+                         help="refresh every SECONDS until interrupted")
+    command.set_defaults(run=departures, columns=_departure_columns)
+
+    command = commands.add_parser('route', help="plan a route")
+    command.add_argument('start', help="station name, number or id")
+    command.add_argument('dest', help="station name, number or id")
+    command.add_argument('--time', type=_parse_time,
+                         help="HH:MM or YYYY-MM-DDTHH:MM, default now")
+    command.add_argument('--arrival', action='store_true',
+                         help="--time is the time of arrival")
+    command.add_argument('--change-limit', type=int)
+    command.set_defaults(run=route, columns=_route_columns)
+
+    command = commands.add_parser('nearby', help="stations near a place")
+    command.add_argument('lat', type=float)
+    command.add_argument('lon', type=float)
+    command.set_defaults(run=nearby, columns=_nearby_columns)
+
+    command = commands.add_parser('interruptions',
+                                  help="service interruptions")
+    command.add_argument('--line', help="only those affecting this line")
+    command.add_argument('--station',
+                         help="only those affecting this station")
+    command.add_argument('--active', action='store_true',
+                         help="only those in effect right now")
+    command.set_defaults(run=interruptions, columns=_interruption_columns)
+    return parser
+
+
+def main(argv=None):
+    parser = _make_parser()
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'run'):
+        parser.print_help()
+        return 2
+    output = _Output(args.columns, args.format)
+    with mvg_api.MvgClient() as client:
+        try:
+            return args.run(client, args, output) or 0
+        except client.request_errors + (LookupError,) as e:
+            print("mvg: {}".format(e), file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            return 130
+        except BrokenPipeError:
+            # e.g. piped into head
+            sys.stderr.close()
+            return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
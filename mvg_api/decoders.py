@@ -0,0 +1,118 @@
+# coding=utf-8
+"""JSON decoding backends.
+
+Responses are decoded straight from the received bytes. By default the
+fastest installed backend is used: `orjson`, then `msgspec`, then the
+`json` module of the standard library. Choose one explicitly with the
+`json_decoder` parameter of :class:`mvg_api.MvgClient`, which also
+accepts any callable taking `bytes`.
+
+All decoders raise a `ValueError` on invalid input. Backends are only
+imported when the first response is decoded.
+
+Iterators like :func:`mvg_api.iter_route` decode responses incrementally
+with `ijson` (``pip install mvg_api[ijson]``) if it is installed, and
+fall back to decoding the whole response otherwise.
+"""
+
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+
+def _msgspec():
+    import msgspec
+    decode = msgspec.json.decode
+
+    def loads(data):
+        try:
+            return decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+    return loads
+
+
+def _json():
+    import json
+    return json.loads
+
+
+backends = {
+    'orjson': _orjson,
+    'msgspec': _msgspec,
+    'json': _json,
+}
+preference = ('orjson', 'msgspec', 'json')
+
+
+def get_decoder(name='auto'):
+    """Returns the `loads` function of the backend `name`, or of the
+    first installed backend in :data:`preference` for `'auto'`.
+
+    Raises `ImportError` if the requested backend isn't installed.
+    """
+    if callable(name):
+        return name
+    if name != 'auto':
+        return backends[name]()
+    for name in preference:
+        try:
+            return backends[name]()
+        except ImportError:
+            pass
+    raise ImportError("No json decoder available")  # pragma: no cover
+
+
+_ijson = None
+
+
+def get_ijson():
+    """Returns the `ijson` module, or `None` if it isn't installed."""
+    global _ijson
+    if _ijson is None:
+        try:
+            import ijson
+        except ImportError:
+            ijson = False
+        _ijson = ijson
+    return _ijson or None
+
+
+class ItemBuilder:
+    """Assembles the objects of the list at `prefix` out of `ijson`
+    parser events, or the object at `prefix` itself if the api sent a
+    single object instead of a list.
+
+    Feed it every `(path, event, value)` tuple; :meth:`feed` returns
+    each object once it is complete, else `None`.
+    """
+
+    def __init__(self, ijson, prefix):
+        self._ijson = ijson
+        self._targets = (prefix, prefix + '.item')
+        self._builder = None
+        self._path = None
+
+    def feed(self, path, event, value):
+        if self._builder is None:
+            if event != 'start_map' or path not in self._targets:
+                return None
+            self._builder = self._ijson.ObjectBuilder()
+            self._path = path
+        self._builder.event(event, value)
+        if event == 'end_map' and path == self._path:
+            item = self._builder.value
+            self._builder = None
+            return item
+        return None
+
+
+def iter_items(ijson, file, prefix):
+    """Yields the objects at `prefix` of the JSON document read from the
+    binary file object `file`, see :class:`ItemBuilder`."""
+    builder = ItemBuilder(ijson, prefix)
+    for path, event, value in ijson.parse(file, use_float=True):
+        item = builder.feed(path, event, value)
+        if item is not None:
+            yield item
@@ -0,0 +1,156 @@
+# coding=utf-8
+"""Routing of requests to one of several servers.
+
+By default a client sends everything to :data:`mvg_api.api_base_url`.
+An :class:`EndpointRegistry` configures other servers instead, per
+endpoint, with their own timeout, and with fallbacks::
+
+    registry = EndpointRegistry(["http://gateway:8080", mvg_api.api_base_url])
+    registry.set('departure', ["http://mirror-a", "http://mirror-b"],
+                 timeout=2)
+    client = mvg_api.MvgClient(endpoints=registry)
+
+For every request the client tries the servers of the endpoint in order
+of their latency measured for that endpoint, fastest first. A server
+that fails (with a
+connection error or a 5xx status) is skipped for a cooldown, which grows
+while it keeps failing, and the request goes to the next one.
+"""
+
+import threading
+from time import monotonic
+
+import mvg_api
+
+
+class Backend:
+    """A server answering requests for some endpoints.
+
+    :ivar latencies: moving average of the response times in seconds per
+        endpoint, as endpoints can be much slower than others
+    :ivar failures: number of failures in a row, of any endpoint
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.latencies = {}
+        self.failures = 0
+        self.down_until = 0.0
+
+    def url(self, url):
+        """`url` of the mvg api rewritten to this server."""
+        if url.startswith(mvg_api.api_base_url):
+            return self.base_url + url[len(mvg_api.api_base_url):]
+        return url
+
+    def healthy(self, now=None):
+        return self.down_until <= (monotonic() if now is None else now)
+
+    def __repr__(self):
+        return "Backend({!r}, latencies={!r}, failures={})".format(
+            self.base_url, self.latencies, self.failures)
+
+
+class EndpointRegistry:
+    """Servers and timeouts per endpoint.
+
+    Parameters
+    ----------
+    base_urls : str or list, optional
+        Servers for all endpoints without their own, by default the api.
+    timeout : float or tuple, optional
+        Timeout for these endpoints, by default that of the client.
+    cooldown : float, optional
+        Seconds a server is skipped after failing, doubling with every
+        further failure up to `max_cooldown`.
+    smoothing : float, optional
+        Weight of a new response time in the latency average.
+    """
+
+    # status codes after which the next server is tried
+    failover_status_codes = (500, 502, 503, 504)
+
+    def __init__(self, base_urls=None, timeout=None, cooldown=5,
+                 max_cooldown=300, smoothing=0.3):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.smoothing = smoothing
+        # base url -> Backend, shared by endpoints so a server failing
+        # for one is skipped for all
+        self._backends = {}
+        self._endpoints = {}  # endpoint -> (backends, timeout)
+        self._lock = threading.Lock()
+        self.set(None, base_urls or [mvg_api.api_base_url], timeout)
+
+    def _backend(self, base_url):
+        base_url = base_url.rstrip('/')
+        backend = self._backends.get(base_url)
+        if backend is None:
+            backend = self._backends[base_url] = Backend(base_url)
+        return backend
+
+    def set(self, endpoint, base_urls, timeout=None):
+        """Sends requests to `endpoint` to the servers `base_urls`, in
+        this order as long as none has been measured to be faster.
+        `endpoint` `None` sets the default for all other endpoints."""
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        base_urls = list(base_urls)
+        if not base_urls:
+            raise ValueError("No servers given for {!r}".format(endpoint))
+        with self._lock:
+            self._endpoints[endpoint] = (
+                [self._backend(base_url) for base_url in base_urls], timeout)
+
+    def timeout(self, endpoint, default=None):
+        """The timeout for `endpoint`, or `default` if it has none."""
+        _, timeout = self._endpoints.get(endpoint, self._endpoints[None])
+        return default if timeout is None else timeout
+
+    def backends(self, endpoint):
+        """The servers of `endpoint` in the order to try them: healthy
+        ones by their latency for `endpoint` (unmeasured ones first, to
+        measure them), then those cooling down, the soonest available
+        first."""
+        backends, _ = self._endpoints.get(endpoint, self._endpoints[None])
+        now = monotonic()
+        healthy = [(backend.latencies.get(endpoint, 0.0), index, backend)
+                   for index, backend in enumerate(backends)
+                   if backend.healthy(now)]
+        if len(healthy) == len(backends):
+            return [backend for _, _, backend in sorted(healthy)]
+        down = [(backend.down_until, index, backend)
+                for index, backend in enumerate(backends)
+                if not backend.healthy(now)]
+        return [backend for _, _, backend in sorted(healthy) + sorted(down)]
+
+    def record_success(self, backend, endpoint, elapsed):
+        with self._lock:
+            latency = backend.latencies.get(endpoint)
+            if latency is None:
+                latency = elapsed
+            else:
+                latency += self.smoothing * (elapsed - latency)
+            backend.latencies[endpoint] = latency
+            backend.failures = 0
+            backend.down_until = 0.0
+
+    def record_failure(self, backend):
+        with self._lock:
+            backend.failures += 1
+            backend.down_until = monotonic() + min(
+                self.max_cooldown,
+                self.cooldown * 2 ** (backend.failures - 1))
+
+    def stats(self):
+        """Latencies per endpoint, failures and health of every server
+        by base url."""
+        now = monotonic()
+        with self._lock:
+            return {
+                base_url: {
+                    'latencies': dict(backend.latencies),
+                    'failures': backend.failures,
+                    'healthy': backend.healthy(now),
+                    }
+                for base_url, backend in self._backends.items()}
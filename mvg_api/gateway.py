@@ -0,0 +1,143 @@
+# coding=utf-8
+"""A caching gateway in front of the mvg api.
+
+Many processes polling the same stations each send their own requests.
+Run one gateway instead and point the clients at it; it answers all of
+them through one :class:`mvg_api.aio.AsyncMvgClient`, so they share its
+cache, request coalescing and rate limiting, and upstream traffic grows
+with the number of distinct queries instead of the number of clients::
+
+    $ python -m mvg_api.gateway --port 8080
+
+    client = mvg_api.MvgClient(base_url="http://localhost:8080")
+    mvg_api.set_default_client(client)
+
+The gateway serves the paths of the mvg api used by this library and
+nothing else. `/_gateway/stats` returns the counters of its caches,
+coalescing and rate limiter. Requires `aiohttp`
+(``pip install mvg_api[aio]``).
+"""
+
+import argparse
+import json
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+import mvg_api
+from mvg_api.aio import AsyncMvgClient
+
+
+def _path(url):
+    return urlsplit(url.split('{')[0]).path
+
+
+def _endpoints():
+    """`(path prefix, endpoint)` of every api path the gateway serves."""
+    return [
+        (_path(mvg_api.query_url_name), 'location'),
+        (_path(mvg_api.query_url_id), 'location'),
+        (_path(mvg_api.nearby_url), 'nearby'),
+        (_path(mvg_api.departure_url), 'departure'),
+        (_path(mvg_api.routing_url), 'routing'),
+        (_path(mvg_api.interruptions_url), 'interruptions'),
+    ]
+
+
+def _json_response(data, status=200):
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status,
+                        content_type='application/json')
+
+
+def make_client(upstream=None):
+    """Returns the client a gateway uses by default: rate limited, and
+    caching routing results by query (the response cache never keeps
+    them, see :data:`mvg_api.default_cache_ttl`). `upstream` is a base
+    url to forward to instead of the api."""
+    return AsyncMvgClient(base_url=upstream, rate_limit=True,
+                          route_cache=True)
+
+
+class Gateway:
+    """Answers requests for api paths through `client` (by default one
+    from :func:`make_client`)."""
+
+    def __init__(self, client=None):
+        self.client = client or make_client()
+        # longest first, so e.g. queryWeb isn't taken for query
+        self.endpoints = sorted(_endpoints(), key=lambda item: -len(item[0]))
+
+    def endpoint(self, path):
+        for prefix, endpoint in self.endpoints:
+            if path.startswith(prefix):
+                return endpoint
+        return None
+
+    async def handle(self, request):
+        endpoint = self.endpoint(request.path)
+        if endpoint is None:
+            return _json_response({'error': 'unknown path'}, 404)
+        url = mvg_api.api_base_url + request.path_qs
+        try:
+            if endpoint == 'routing':
+                results = await self.client._fetch_route(url, True)
+            else:
+                results = await self.client._perform_api_request(url,
+                                                                 endpoint)
+        except mvg_api.ApiError as e:
+            reason = e.reason
+            if reason is None:
+                # the api's error had no json body
+                reason = {'error': str(e)}
+            return _json_response(reason, e.code)
+        except self.client.request_errors as e:
+            return _json_response({'error': str(e)}, 502)
+        return _json_response(results)
+
+    async def stats(self, request):
+        client = self.client
+        return _json_response({
+            'cache': (client.cache.stats() if client.cache is not None
+                      else None),
+            'route_cache': (client.route_cache.stats()
+                            if client.route_cache is not None else None),
+            'coalesced': client.coalesced,
+            'rate_limiter': (client.rate_limiter.stats()
+                             if client.rate_limiter is not None else None),
+        })
+
+    async def close(self, app=None):
+        await self.client.close()
+
+    def make_app(self):
+        """Returns the :class:`aiohttp.web.Application` serving the
+        gateway."""
+        app = web.Application()
+        app.router.add_get('/_gateway/stats', self.stats)
+        app.router.add_get('/{path:.*}', self.handle)
+        app.on_cleanup.append(self.close)
+        return app
+
+
+def make_app(client=None):
+    """Returns an :class:`aiohttp.web.Application` serving a
+    :class:`Gateway` with `client`."""
+    return Gateway(client).make_app()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mvg_api.gateway',
+        description="Caching gateway in front of the mvg api.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--upstream', metavar='URL',
+                        help="base url to forward to instead of the api, "
+                             "e.g. another gateway")
+    args = parser.parse_args(argv)
+    web.run_app(make_app(make_client(args.upstream)), host=args.host,
+                port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+# coding=utf-8
+"""Compact recording of departure snapshots for delay analysis.
+
+A :class:`DepartureHistory` keeps one row per departure in typed
+columns instead of dicts. `station`, `label`, `destination` and
+`product` are dictionary encoded, so each row needs a few dozen bytes.
+Recording the same departure again (by `departureId`) updates its row,
+so polling a board every minute doesn't grow the history::
+
+    history = DepartureHistory()
+    history.poll(["de:09162:6", "de:09162:2"])  # call periodically
+    history.delay_stats_by('line', start=datetime.datetime(2020, 5, 1))
+    history.save('history.mvgh')
+
+Histories are saved in a packed format of raw `array` columns, or as
+Arrow or Parquet files with dictionary columns if `pyarrow` is installed
+(``pip install mvg_api[arrow]``).
+"""
+
+import json
+import math
+import struct
+import sys
+from array import array
+from time import time as current_time
+
+import mvg_api
+
+_magic = b'MVGH1\n'
+
+# name and array typecode of the stored columns; dictionary encoded
+# columns store the code of their value
+_dictionary_columns = ('station', 'label', 'destination', 'product')
+_columns = (
+    ('station', 'I'),
+    ('label', 'I'),
+    ('destination', 'I'),
+    ('product', 'I'),
+    ('departure_id', 'q'),
+    ('departure_time', 'q'),
+    ('delay', 'i'),
+    ('live', 'b'),
+    ('minutes', 'i'),
+    ('first_seen', 'q'),
+    ('last_seen', 'q'),
+)
+# columns updated when a departure is recorded again
+_updated_columns = ('delay', 'live', 'minutes', 'last_seen')
+
+
+class _Dictionary:
+    __slots__ = ('values', '_codes')
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value):
+        return self._codes.get(value)
+
+
+def _milliseconds(time):
+    if time is None or isinstance(time, (int, float)):
+        return time
+    return mvg_api._convert_time(time)
+
+
+def _summary(delays):
+    """Statistics of a sorted sequence of delays in minutes."""
+    count = len(delays)
+    if not count:
+        return {'count': 0, 'mean': None, 'median': None, 'p90': None,
+                'max': None, 'delayed': None}
+
+    def rank(fraction):
+        # nearest rank percentile
+        return int(delays[max(0, math.ceil(count * fraction) - 1)])
+
+    delayed = count - _count_on_time(delays)
+    return {
+        'count': count,
+        'mean': float(sum(delays)) / count,
+        'median': rank(0.5),
+        'p90': rank(0.9),
+        'max': int(delays[-1]),
+        'delayed': delayed / count,
+    }
+
+
+def _count_on_time(delays):
+    # delays are sorted, so find the first one above 0
+    low, high = 0, len(delays)
+    while low < high:
+        middle = (low + high) // 2
+        if delays[middle] > 0:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class DepartureHistory:
+    """Departures recorded from :func:`mvg_api.get_departures`, one row
+    per departure, stored column by column."""
+
+    def __init__(self):
+        self._data = {name: array(typecode) for name, typecode in _columns}
+        self._dictionaries = {name: _Dictionary()
+                              for name in _dictionary_columns}
+        self._rows = {}  # (station code, departure id) -> row
+
+    def __len__(self):
+        return len(self._data['departure_id'])
+
+    def record(self, station_id, departures, recorded=None):
+        """Adds a snapshot of the departures of `station_id`, as returned
+        by :func:`mvg_api.get_departures`, taken at `recorded` (unix time
+        in milliseconds or datetime, by default now).
+
+        Departures already recorded get their delay, live flag and
+        minutes updated. Returns the number of new rows.
+        """
+        recorded = _milliseconds(recorded)
+        if recorded is None:
+            recorded = int(current_time() * 1000)
+        station = self._dictionaries['station'].encode(
+            mvg_api._normalize_station_id(station_id))
+        data = self._data
+        added = 0
+        for departure in departures:
+            values = {
+                'delay': departure.get('delay') or 0,
+                'live': 1 if departure.get('live') else 0,
+                'minutes': departure.get('departureTimeMinutes') or 0,
+                'last_seen': recorded,
+            }
+            departure_id = int(departure['departureId'])
+            key = (station, departure_id)
+            row = self._rows.get(key)
+            if row is not None:
+                for name in _updated_columns:
+                    data[name][row] = values[name]
+                continue
+            self._rows[key] = len(data['departure_id'])
+            values.update(
+                station=station,
+                label=self._dictionaries['label'].encode(
+                    departure.get('label')),
+                destination=self._dictionaries['destination'].encode(
+                    departure.get('destination')),
+                product=self._dictionaries['product'].encode(
+                    departure.get('product')),
+                departure_id=departure_id,
+                departure_time=departure['departureTime'],
+                first_seen=recorded,
+            )
+            for name, _ in _columns:
+                data[name].append(values[name])
+            added += 1
+        return added
+
+    def poll(self, station_ids, client=None):
+        """Fetches and records the departures of all `station_ids` with
+        `client` (by default the shared one). Returns the stations which
+        failed, mapped to their exception."""
+        client = client or mvg_api.get_default_client()
+        errors = {}
+        for station_id, result in client.iter_departures_many(station_ids):
+            if isinstance(result, Exception):
+                errors[station_id] = result
+            else:
+                self.record(station_id, result)
+        return errors
+
+    def column(self, name):
+        """The values of column `name` as a list, decoded for dictionary
+        encoded columns."""
+        if name in self._dictionaries:
+            values = self._dictionaries[name].values
+            return [values[code] for code in self._data[name]]
+        return self._data[name].tolist()
+
+    def rows(self):
+        """Yields every row as a dict."""
+        names = [name for name, _ in _columns]
+        for values in zip(*(self.column(name) for name in names)):
+            yield dict(zip(names, values))
+
+    def _selection(self, live_only, start, end, filters):
+        """Row numbers matching the filters, or `None` for all rows."""
+        numpy = mvg_api._get_numpy() \
+            if len(self) >= mvg_api._numpy_threshold else None
+        conditions = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name == 'station':
+                value = mvg_api._normalize_station_id(value)
+            code = self._dictionaries[name].code(value)
+            if code is None:
+                return []
+            conditions.append((name, '==', code))
+        if live_only:
+            conditions.append(('live', '==', 1))
+        if start is not None:
+            conditions.append(('departure_time', '>=', _milliseconds(start)))
+        if end is not None:
+            conditions.append(('departure_time', '<', _milliseconds(end)))
+        if not conditions:
+            return None
+        if numpy:
+            mask = numpy.ones(len(self), dtype=bool)
+            for name, operator, value in conditions:
+                column = numpy.frombuffer(self._data[name],
+                                          dtype=self._data[name].typecode)
+                if operator == '==':
+                    mask &= column == value
+                elif operator == '>=':
+                    mask &= column >= value
+                else:
+                    mask &= column < value
+            return numpy.flatnonzero(mask).tolist()
+        rows = range(len(self))
+        for name, operator, value in conditions:
+            column = self._data[name]
+            if operator == '==':
+                rows = [row for row in rows if column[row] == value]
+            elif operator == '>=':
+                rows = [row for row in rows if column[row] >= value]
+            else:
+                rows = [row for row in rows if column[row] < value]
+        return rows
+
+    def delay_stats(self, line=None, station=None, product=None,
+                    destination=None, start=None, end=None, live_only=True):
+        """Delay statistics of the departures matching all given filters.
+
+        `start` and `end` limit the scheduled departure time (datetimes
+        or unix times in milliseconds, `end` exclusive). By default only
+        departures with live data count, as the others have no delay.
+
+        Returns a dict with the `count` of departures, `mean`, `median`,
+        90th percentile (`p90`) and `max` delay in minutes, and the
+        share of `delayed` departures (delay above 0).
+        """
+        rows = self._selection(live_only, start, end, {
+            'label': line, 'station': station, 'product': product,
+            'destination': destination})
+        delays = self._data['delay']
+        if rows is None:
+            return _summary(sorted(delays))
+        return _summary(sorted(delays[row] for row in rows))
+
+    def delay_stats_by(self, group, **filters):
+        """Like :meth:`delay_stats`, but per value of `group`, which is
+        `'line'`, `'station'`, `'product'` or `'destination'`. Returns a
+        dict mapping each value to its statistics."""
+        name = 'label' if group == 'line' else group
+        if name not in _dictionary_columns:
+            raise ValueError("Can't group by {!r}".format(group))
+        rows = self._selection(filters.pop('live_only', True),
+                               filters.pop('start', None),
+                               filters.pop('end', None), {
+                                   'label': filters.pop('line', None),
+                                   'station': filters.pop('station', None),
+                                   'product': filters.pop('product', None),
+                                   'destination':
+                                       filters.pop('destination', None)})
+        if filters:
+            raise TypeError("Unexpected arguments: {}".format(
+                ", ".join(filters)))
+        if rows is None:
+            rows = range(len(self))
+        codes, delays = self._data[name], self._data['delay']
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(codes[row], []).append(delays[row])
+        values = self._dictionaries[name].values
+        return {values[code]: _summary(sorted(group_delays))
+                for code, group_delays in grouped.items()}
+
+    def _rebuild_index(self):
+        self._rows = {
+            (station, departure_id): row for row, (station, departure_id)
+            in enumerate(zip(self._data['station'],
+                             self._data['departure_id']))}
+
+    # storage
+
+    def save(self, path):
+        """Saves the history to `path`: as Parquet for `.parquet`, as
+        Arrow IPC file for `.arrow` and `.feather` (both need `pyarrow`),
+        else in the packed format."""
+        if path.endswith('.parquet'):
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(self.to_arrow(), path)
+        elif path.endswith(('.arrow', '.feather')):
+            import pyarrow.feather
+            pyarrow.feather.write_feather(self.to_arrow(), path)
+        else:
+            with open(path, 'wb') as f:
+                self._write_packed(f)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a history saved with :meth:`save`."""
+        if path.endswith('.parquet'):
+            import pyarrow.parquet
+            return cls.from_arrow(pyarrow.parquet.read_table(path))
+        if path.endswith(('.arrow', '.feather')):
+            import pyarrow.feather
+            return cls.from_arrow(pyarrow.feather.read_table(path))
+        with open(path, 'rb') as f:
+            return cls._read_packed(f)
+
+    def _write_packed(self, f):
+        header = json.dumps({
+            'rows': len(self),
+            'byteorder': sys.byteorder,
+            'columns': [[name, typecode] for name, typecode in _columns],
+            'dictionaries': {name: dictionary.values for name, dictionary
+                             in self._dictionaries.items()},
+        }).encode('utf-8')
+        f.write(_magic)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, _ in _columns:
+            self._data[name].tofile(f)
+
+    @classmethod
+    def _read_packed(cls, f):
+        if f.read(len(_magic)) != _magic:
+            raise ValueError("Not a departure history file")
+        size, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(size).decode('utf-8'))
+        history = cls()
+        for name, typecode in header['columns']:
+            column = array(typecode)
+            column.fromfile(f, header['rows'])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            history._data[name] = column
+        for name, values in header['dictionaries'].items():
+            history._dictionaries[name] = _Dictionary(values)
+        history._rebuild_index()
+        return history
+
+    def to_arrow(self):
+        """Returns the history as `pyarrow.Table` with dictionary encoded
+        `station`, `label`, `destination` and `product` columns."""
+        import pyarrow
+        arrays, names = [], []
+        for name, typecode in _columns:
+            column = pyarrow.array(self._data[name],
+                                   type=_arrow_types(pyarrow)[typecode])
+            if name in self._dictionaries:
+                column = pyarrow.DictionaryArray.from_arrays(
+                    column, pyarrow.array(self._dictionaries[name].values,
+                                          type=pyarrow.string()))
+            arrays.append(column)
+            names.append(name)
+        return pyarrow.Table.from_arrays(arrays, names=names)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Creates a history from a table made by :meth:`to_arrow`."""
+        import pyarrow
+        history = cls()
+        for name, typecode in _columns:
+            column = table.column(name).combine_chunks()
+            if name in history._dictionaries:
+                if not pyarrow.types.is_dictionary(column.type):
+                    column = column.dictionary_encode()
+                history._dictionaries[name] = _Dictionary(
+                    column.dictionary.to_pylist())
+                column = column.indices
+            history._data[name] = array(typecode, column.to_pylist())
+        history._rebuild_index()
+        return history
+
+
+def _arrow_types(pyarrow):
+    return {'I': pyarrow.uint32(), 'q': pyarrow.int64(),
+            'i': pyarrow.int32(), 'b': pyarrow.int8()}
+
@@ -0,0 +1,178 @@
+# coding=utf-8
+"""Indexed service interruptions.
+
+An :class:`InterruptionIndex` answers questions like "is U2 affected?"
+from one :func:`mvg_api.get_interruptions` payload without scanning it,
+and tells what changed between two payloads::
+
+    index = InterruptionIndex()
+    for event in index.refresh():  # poll this periodically
+        print(event.type, event.interruption['title'])
+    index.by_line('U2')
+    index.by_station('de:09162:6')
+"""
+
+from collections import namedtuple
+from time import time as current_time
+
+import mvg_api
+from mvg_api import models
+
+InterruptionEvent = namedtuple(
+    'InterruptionEvent', 'type interruption_id interruption previous')
+InterruptionEvent.__doc__ = """A change between two interruption payloads.
+
+`type` is `'new'`, `'changed'` or `'resolved'`. `interruption` is the
+interruption dict (for `resolved`, the last one seen), `previous` the
+one it replaced on `changed`, else `None`.
+"""
+
+
+def _station_id(station):
+    try:
+        return mvg_api._normalize_station_id(station)
+    except TypeError:
+        return station
+
+
+class InterruptionIndex:
+    """Interruptions indexed by id, line, product and station.
+
+    Parameters
+    ----------
+    payload : dict, optional
+        A payload as returned by :func:`mvg_api.get_interruptions`. More
+        recent ones can be loaded with :meth:`update` or :meth:`refresh`.
+
+    Lines and products are matched case insensitively, stations in any
+    form :func:`mvg_api.get_departures` accepts.
+    """
+
+    def __init__(self, payload=None):
+        self._interruptions = {}
+        self._lines = {}
+        self._products = {}
+        self._stations = {}
+        if payload is not None:
+            self.update(payload)
+
+    def _build(self, interruptions):
+        self._interruptions = {}
+        self._lines = {}
+        self._products = {}
+        self._stations = {}
+        for interruption in interruptions:
+            interruption_id = interruption.get('id')
+            self._interruptions[interruption_id] = interruption
+            for line in models.interruption_lines(interruption):
+                # dicts instead of lists so listing a line twice
+                # doesn't return the interruption twice
+                if line.get('line'):
+                    self._lines.setdefault(
+                        line['line'].upper(), {})[interruption_id] = None
+                if line.get('product'):
+                    self._products.setdefault(
+                        line['product'].lower(), {})[interruption_id] = None
+            for station in models.interruption_stations(interruption):
+                if station.get('id'):
+                    self._stations.setdefault(
+                        _station_id(station['id']), {})[interruption_id] = None
+
+    def update(self, payload):
+        """Replaces the indexed interruptions with those of `payload` and
+        returns the :class:`InterruptionEvent` list of what changed."""
+        interruptions = models.interruption_list(payload)
+        events = self.diff(interruptions)
+        self._build(interruptions)
+        return events
+
+    def refresh(self, client=None, use_cache=True):
+        """Fetches the current interruptions with `client` (by default
+        the shared one) and passes them to :meth:`update`."""
+        client = client or mvg_api.get_default_client()
+        return self.update(client.get_interruptions(use_cache=use_cache))
+
+    def diff(self, interruptions):
+        """Compares the indexed interruptions to the list `interruptions`
+        and returns the :class:`InterruptionEvent` list turning the
+        former into the latter, without changing the index."""
+        events = []
+        seen = set()
+        for interruption in interruptions:
+            interruption_id = interruption.get('id')
+            seen.add(interruption_id)
+            previous = self._interruptions.get(interruption_id)
+            if previous is None:
+                events.append(InterruptionEvent(
+                    'new', interruption_id, interruption, None))
+            elif previous != interruption:
+                events.append(InterruptionEvent(
+                    'changed', interruption_id, interruption, previous))
+        for interruption_id, interruption in self._interruptions.items():
+            if interruption_id not in seen:
+                events.append(InterruptionEvent(
+                    'resolved', interruption_id, interruption, None))
+        return events
+
+    def _get_all(self, ids):
+        return [self._interruptions[interruption_id] for interruption_id
+                in ids]
+
+    def get(self, interruption_id, default=None):
+        """The interruption with the id `interruption_id`."""
+        return self._interruptions.get(interruption_id, default)
+
+    def by_line(self, line):
+        """Interruptions affecting the line `line`, like `'U2'`."""
+        return self._get_all(self._lines.get(line.upper(), ()))
+
+    def by_product(self, product):
+        """Interruptions affecting lines of `product`, like `'u'`."""
+        return self._get_all(self._products.get(product.lower(), ()))
+
+    def by_station(self, station_id):
+        """Interruptions affecting the station `station_id`."""
+        return self._get_all(self._stations.get(_station_id(station_id), ()))
+
+    def lines(self):
+        """Labels of all affected lines."""
+        return list(self._lines)
+
+    def active(self, at=None):
+        """Interruptions valid at `at` (a datetime or unix time in
+        milliseconds, by default now). Missing bounds count as open."""
+        return self.between(at, at)
+
+    def between(self, start, end):
+        """Interruptions whose validity overlaps the period from `start`
+        to `end` (datetimes or unix times in milliseconds; `None` means
+        now)."""
+        start, end = self._milliseconds(start), self._milliseconds(end)
+        matches = []
+        for interruption in self._interruptions.values():
+            duration = interruption.get('duration') or {}
+            valid_from = duration.get('from')
+            valid_until = duration.get('until')
+            if valid_from is not None and valid_from > end:
+                continue
+            if valid_until is not None and valid_until < start:
+                continue
+            matches.append(interruption)
+        return matches
+
+    @staticmethod
+    def _milliseconds(time):
+        if time is None:
+            return int(current_time() * 1000)
+        if not isinstance(time, (int, float)):
+            return mvg_api._convert_time(time)
+        return time
+
+    def __iter__(self):
+        return iter(self._interruptions.values())
+
+    def __len__(self):
+        return len(self._interruptions)
+
+    def __contains__(self, interruption_id):
+        return interruption_id in self._interruptions
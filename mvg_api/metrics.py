@@ -0,0 +1,226 @@
+# coding=utf-8
+"""Instrumentation of api requests.
+
+Pass a :class:`Hooks` instance as `hooks` to :class:`mvg_api.MvgClient`
+(or :class:`mvg_api.aio.AsyncMvgClient`) to be told about every request
+it makes. Without hooks, the client skips all of this.
+
+:class:`MetricsCollector` is a ready made implementation which keeps
+latency histograms and counters per endpoint::
+
+    metrics = MetricsCollector()
+    client = mvg_api.MvgClient(hooks=metrics)
+    ...
+    metrics.stats()['departure']['latency']['mean']
+
+To scrape them with Prometheus, register a :class:`PrometheusCollector`
+(requires `prometheus_client`, ``pip install mvg_api[prometheus]``).
+"""
+
+import heapq
+import threading
+
+# upper bounds of the latency histogram buckets in seconds
+default_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Hooks:
+    """Receives events about the requests of a client; override the
+    methods you are interested in.
+
+    `endpoint` is one of `location`, `nearby`, `departure`, `routing`
+    and `interruptions` (or `None` for raw requests), `url` the
+    requested url. The methods are called from the thread or task
+    making the request, so they should return quickly.
+    """
+
+    def before_request(self, endpoint, url):
+        """A request is about to be sent (not called for cache hits)."""
+
+    def after_response(self, endpoint, url, status, size, elapsed,
+                       decode_time):
+        """A request succeeded. `size` is the length of the body in
+        bytes, `elapsed` the seconds since :meth:`before_request`
+        including retries, `decode_time` the seconds spent decoding the
+        body. A `304 Not Modified` is followed by :meth:`on_cache_hit`."""
+
+    def on_error(self, endpoint, url, error):
+        """A request failed with the exception `error`, which is raised
+        after this returns."""
+
+    def on_retry(self, endpoint, url, status, delay):
+        """A request is retried in `delay` seconds after a response with
+        `status` (`None` for connection errors)."""
+
+    def on_cache_hit(self, endpoint, url):
+        """A request was answered from a cache of the client."""
+
+
+class _EndpointMetrics:
+    __slots__ = ('requests', 'errors', 'retries', 'cache_hits', 'bytes',
+                 'decode_time', 'latency_sum', 'latency_buckets')
+
+    def __init__(self, buckets):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.bytes = 0
+        self.decode_time = 0.0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(buckets)
+
+
+class MetricsCollector(Hooks):
+    """Counts requests, errors, retries, cache hits, received bytes and
+    decode time, and keeps a latency histogram, all per endpoint.
+
+    Parameters
+    ----------
+    buckets : tuple, optional
+        Upper bounds of the latency histogram buckets in seconds, in
+        increasing order; the last one should be infinity.
+    slowest : int, optional
+        How many of the slowest requests to remember with their url,
+        see :meth:`slowest`.
+    """
+
+    def __init__(self, buckets=default_buckets, slowest=10):
+        self.buckets = tuple(buckets)
+        self._endpoints = {}
+        self._slowest = []  # heap of (elapsed, url)
+        self._slowest_size = slowest
+        self._lock = threading.Lock()
+
+    def _metrics(self, endpoint):
+        metrics = self._endpoints.get(endpoint)
+        if metrics is None:
+            metrics = self._endpoints[endpoint] = \
+                _EndpointMetrics(self.buckets)
+        return metrics
+
+    def after_response(self, endpoint, url, status, size, elapsed,
+                       decode_time):
+        with self._lock:
+            metrics = self._metrics(endpoint)
+            metrics.requests += 1
+            metrics.bytes += size
+            metrics.decode_time += decode_time
+            metrics.latency_sum += elapsed
+            for index, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    metrics.latency_buckets[index] += 1
+                    break
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, (elapsed, url))
+            elif self._slowest_size and elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (elapsed, url))
+
+    def on_error(self, endpoint, url, error):
+        with self._lock:
+            self._metrics(endpoint).errors += 1
+
+    def on_retry(self, endpoint, url, status, delay):
+        with self._lock:
+            self._metrics(endpoint).retries += 1
+
+    def on_cache_hit(self, endpoint, url):
+        with self._lock:
+            self._metrics(endpoint).cache_hits += 1
+
+    def slowest(self):
+        """The slowest requests so far as `(seconds, url)` tuples, the
+        slowest first."""
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def stats(self):
+        """Returns the metrics as a dict with one entry per endpoint.
+
+        `latency` holds the `count`, `sum` and `mean` of the latencies
+        of successful requests and the cumulative `buckets` as a list
+        of `(upper bound, count)` tuples.
+        """
+        with self._lock:
+            stats = {}
+            for endpoint, metrics in self._endpoints.items():
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(self.buckets,
+                                        metrics.latency_buckets):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                stats[endpoint] = {
+                    'requests': metrics.requests,
+                    'errors': metrics.errors,
+                    'retries': metrics.retries,
+                    'cache_hits': metrics.cache_hits,
+                    'bytes': metrics.bytes,
+                    'decode_time': metrics.decode_time,
+                    'latency': {
+                        'count': metrics.requests,
+                        'sum': metrics.latency_sum,
+                        'mean': (metrics.latency_sum / metrics.requests
+                                 if metrics.requests else 0.0),
+                        'buckets': buckets,
+                        },
+                    }
+            return stats
+
+    def reset(self):
+        """Sets all metrics back to zero."""
+        with self._lock:
+            self._endpoints.clear()
+            self._slowest = []
+
+
+class PrometheusCollector:
+    """Exposes the metrics of a :class:`MetricsCollector` to
+    `prometheus_client`::
+
+        from prometheus_client import REGISTRY
+        REGISTRY.register(PrometheusCollector(metrics))
+
+    All metrics are labelled with the `endpoint` and prefixed with
+    `namespace`.
+    """
+
+    def __init__(self, metrics, namespace='mvg_api'):
+        import prometheus_client  # noqa: F401, fail early if missing
+        self.metrics = metrics
+        self.namespace = namespace
+
+    def collect(self):
+        from prometheus_client.core import (
+            CounterMetricFamily, HistogramMetricFamily)
+
+        def name(metric):
+            return '{}_{}'.format(self.namespace, metric)
+
+        latency = HistogramMetricFamily(
+            name('request_duration_seconds'),
+            'Duration of api requests including retries',
+            labels=['endpoint'])
+        counters = {
+            key: CounterMetricFamily(name(metric), documentation,
+                                     labels=['endpoint'])
+            for key, metric, documentation in (
+                ('errors', 'request_errors', 'Failed api requests'),
+                ('retries', 'request_retries', 'Retried api requests'),
+                ('cache_hits', 'cache_hits', 'Requests answered from cache'),
+                ('bytes', 'received_bytes', 'Bytes of response bodies'),
+                ('decode_time', 'decode_seconds', 'Seconds spent decoding'),
+            )}
+        for endpoint, stats in self.metrics.stats().items():
+            labels = [endpoint or 'other']
+            buckets = [('+Inf' if bound == float('inf') else str(bound),
+                        count)
+                       for bound, count in stats['latency']['buckets']]
+            if buckets[-1][0] != '+Inf':
+                buckets.append(('+Inf', stats['latency']['count']))
+            latency.add_metric(labels, buckets, stats['latency']['sum'])
+            for key, family in counters.items():
+                family.add_metric(labels, stats[key])
+        yield latency
+        for family in counters.values():
+            yield family
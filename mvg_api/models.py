@@ -0,0 +1,292 @@
+# coding=utf-8
+"""Lightweight result objects.
+
+Functions like :func:`mvg_api.get_departures` return the dicts of the
+api by default. With `as_objects=True`, they return instances of the
+classes here instead. These use `__slots__`, so they need a lot less
+memory than the dicts when keeping many of them around, and offer
+derived values like :attr:`Departure.departure_datetime` as properties
+which are only computed when accessed.
+"""
+
+import datetime
+
+
+def _from_milliseconds(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp / 1000)
+
+
+class _Model:
+    """Base for the result classes.
+
+    Subclasses list their `(attribute, json key)` pairs in `_fields`
+    and derive `__slots__` from it.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for attribute, _ in self._fields:
+            setattr(self, attribute, kwargs.pop(attribute, None))
+        if kwargs:
+            raise TypeError("Unexpected arguments: {}".format(
+                ", ".join(kwargs)))
+
+    @classmethod
+    def from_dict(cls, data, **extra):
+        """Creates an instance from a dict as returned by the api.
+        Keys which are missing in `data` become `None`, keys which
+        don't belong to a field are dropped."""
+        instance = cls.__new__(cls)
+        get = data.get
+        for attribute, key in cls._fields:
+            setattr(instance, attribute, get(key))
+        for attribute, value in extra.items():
+            setattr(instance, attribute, value)
+        return instance
+
+    def to_dict(self):
+        """Returns the fields as a dict with the keys the api uses."""
+        return {key: getattr(self, attribute)
+                for attribute, key in self._fields}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, attribute) == getattr(other, attribute)
+                   for attribute, _ in self._fields)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(attribute, getattr(self, attribute))
+            for attribute, _ in self._fields[:self._repr_fields]))
+
+    _repr_fields = 3
+
+
+def _slots(fields):
+    return tuple(attribute for attribute, _ in fields)
+
+
+def count_changes(parts):
+    """Number of changes between means of transport in the
+    `connectionPartList` of a connection."""
+    rides = sum(1 for part in parts or ()
+                if part.get('connectionPartType') == 'TRANSPORTATION')
+    return max(rides - 1, 0)
+
+
+class Departure(_Model):
+    """A departure as returned by :func:`mvg_api.get_departures`."""
+
+    _fields = (
+        ('label', 'label'),
+        ('destination', 'destination'),
+        ('departure_time_minutes', 'departureTimeMinutes'),
+        ('departure_time', 'departureTime'),
+        ('product', 'product'),
+        ('live', 'live'),
+        ('delay', 'delay'),
+        ('sev', 'sev'),
+        ('line_background_color', 'lineBackgroundColor'),
+        ('departure_id', 'departureId'),
+    )
+    __slots__ = _slots(_fields)
+
+    @property
+    def departure_datetime(self):
+        """Scheduled departure as naive local datetime."""
+        return _from_milliseconds(self.departure_time)
+
+
+class Location(_Model):
+    """A station or other location as returned by
+    :func:`mvg_api.get_locations`."""
+
+    _fields = (
+        ('type', 'type'),
+        ('id', 'id'),
+        ('name', 'name'),
+        ('place', 'place'),
+        ('latitude', 'latitude'),
+        ('longitude', 'longitude'),
+        ('products', 'products'),
+        ('has_live_data', 'hasLiveData'),
+        ('has_zoom_data', 'hasZoomData'),
+        ('aliases', 'aliases'),
+        ('link', 'link'),
+        ('lines', 'lines'),
+    )
+    __slots__ = _slots(_fields)
+    _repr_fields = 4
+
+
+class ServingLine(_Model):
+    """A line served at a station as returned by
+    :func:`mvg_api.get_lines`."""
+
+    _fields = (
+        ('line_number', 'lineNumber'),
+        ('destination', 'destination'),
+        ('product', 'product'),
+        ('sev', 'sev'),
+        ('partial_net', 'partialNet'),
+        ('diva_id', 'divaId'),
+    )
+    __slots__ = _slots(_fields)
+
+
+class Connection(_Model):
+    """A connection as returned by :func:`mvg_api.get_route`.
+
+    `parts` is the `connectionPartList` of the api, left as it is.
+    """
+
+    _fields = (
+        ('origin', 'from'),
+        ('destination', 'to'),
+        ('departure', 'departure'),
+        ('arrival', 'arrival'),
+        ('parts', 'connectionPartList'),
+    )
+    __slots__ = _slots(_fields)
+    _repr_fields = 4
+
+    @property
+    def departure_datetime(self):
+        return _from_milliseconds(self.departure)
+
+    @property
+    def arrival_datetime(self):
+        return _from_milliseconds(self.arrival)
+
+    @property
+    def duration(self):
+        """Travel time in minutes."""
+        return (self.arrival - self.departure) // 60000
+
+    @property
+    def changes(self):
+        """Number of changes between means of transport."""
+        return count_changes(self.parts)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def interruption_list(payload):
+    """The list of interruptions out of a :func:`mvg_api.get_interruptions`
+    payload (the api nests them under `interruption`, and gives a single
+    interruption as object instead of a list)."""
+    return _as_list(payload.get('interruption'))
+
+
+def interruption_lines(interruption):
+    """The `{'line': ..., 'product': ...}` dicts of the lines affected by
+    an interruption dict."""
+    lines = interruption.get('lines')
+    if isinstance(lines, dict):
+        lines = lines.get('line')
+    return _as_list(lines)
+
+
+def interruption_stations(interruption):
+    """The `{'id': ..., 'name': ...}` dicts of the stations affected by
+    an interruption dict."""
+    stations = interruption.get('stations')
+    if isinstance(stations, dict):
+        stations = stations.get('station')
+    return _as_list(stations)
+
+
+class Interruption(_Model):
+    """A service interruption out of :func:`mvg_api.get_interruptions`."""
+
+    _fields = (
+        ('id', 'id'),
+        ('title', 'title'),
+        ('text', 'text'),
+        ('modification_date', 'modificationDate'),
+        ('duration', 'duration'),
+        ('lines_data', 'lines'),
+        ('stations', 'stations'),
+        ('links', 'links'),
+    )
+    __slots__ = _slots(_fields)
+
+    @property
+    def valid_from(self):
+        """Start of the interruption as unix time in milliseconds."""
+        return (self.duration or {}).get('from')
+
+    @property
+    def valid_until(self):
+        """End of the interruption as unix time in milliseconds."""
+        return (self.duration or {}).get('until')
+
+    @property
+    def lines(self):
+        """Labels of the affected lines, like `['U2', 'U8']`."""
+        return [line.get('line') for line in
+                interruption_lines({'lines': self.lines_data})]
+
+
+class RouteMatrix:
+    """Routes between every origin and every destination, as returned
+    by :func:`mvg_api.get_routes_matrix`.
+
+    All attributes except `origins` and `destinations` are lists of
+    rows, one row per origin with one entry per destination, so e.g.
+    `matrix.durations[i][j]` belongs to `origins[i]` and
+    `destinations[j]`.
+
+    :ivar connections: the connections :func:`mvg_api.get_route` returned
+    :ivar durations: travel time of the fastest connection in minutes
+    :ivar changes: number of changes on the fastest connection
+    :ivar errors: exceptions of failed requests, keyed by `(i, j)`
+
+    Durations and changes are `None` where there is no connection.
+    """
+
+    __slots__ = ('origins', 'destinations', 'connections', 'durations',
+                 'changes', 'errors')
+
+    def __init__(self, origins, destinations):
+        self.origins = list(origins)
+        self.destinations = list(destinations)
+        rows, columns = len(self.origins), len(self.destinations)
+        self.connections = [[[] for _ in range(columns)]
+                            for _ in range(rows)]
+        self.durations = [[None] * columns for _ in range(rows)]
+        self.changes = [[None] * columns for _ in range(rows)]
+        self.errors = {}
+
+    def _set(self, i, j, connections):
+        if isinstance(connections, Exception):
+            self.errors[(i, j)] = connections
+            return
+        self.connections[i][j] = connections
+        if connections:
+            fastest = min(connections, key=lambda connection: (
+                connection['arrival'] - connection['departure'],
+                count_changes(connection.get('connectionPartList'))))
+            self.durations[i][j] = \
+                (fastest['arrival'] - fastest['departure']) // 60000
+            self.changes[i][j] = count_changes(
+                fastest.get('connectionPartList'))
+
+    def __getitem__(self, index):
+        i, j = index
+        return self.connections[i][j]
+
+    def __repr__(self):
+        return "RouteMatrix({}x{}, {} errors)".format(
+            len(self.origins), len(self.destinations), len(self.errors))
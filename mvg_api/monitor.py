@@ -0,0 +1,230 @@
+# coding=utf-8
+"""Live departure monitoring.
+
+A :class:`DepartureMonitor` polls the departures of a set of stations
+and reports what changed since the last poll, instead of full lists::
+
+    def show(event):
+        print(event.type, event.station_id, event.departure['label'])
+
+    monitor = DepartureMonitor(["de:09162:6", "de:09162:2"])
+    monitor.run(show)  # blocks, call monitor.stop() from elsewhere
+
+Each station gets its own polling interval: it shrinks while the
+station's departures keep changing and grows while they don't, but a
+station is always polled again before its next departure leaves.
+"""
+
+import heapq
+import threading
+from collections import namedtuple
+from time import monotonic, time as current_time
+
+import mvg_api
+
+DepartureEvent = namedtuple(
+    'DepartureEvent', 'type station_id departure_id departure previous')
+DepartureEvent.__doc__ = """A change on a departure board.
+
+`type` is `'add'`, `'update'` or `'remove'`. `departure` is the
+departure dict as returned by :func:`mvg_api.get_departures` (for
+`remove`, the last one seen), `previous` the one it replaced on
+`update`, else `None`.
+"""
+
+# departureTimeMinutes changes every minute by itself, so it doesn't
+# count as an update
+_ignored_fields = ('departureTimeMinutes',)
+
+
+def _changed(old, new):
+    return any(old.get(key) != value for key, value in new.items()
+               if key not in _ignored_fields) or len(old) != len(new)
+
+
+def diff_departures(station_id, old, new):
+    """Compares two lists of departures of the same station and returns
+    the :class:`DepartureEvent` list turning `old` into `new`."""
+    old = {departure['departureId']: departure for departure in old}
+    events = []
+    seen = set()
+    for departure in new:
+        departure_id = departure['departureId']
+        seen.add(departure_id)
+        previous = old.get(departure_id)
+        if previous is None:
+            events.append(DepartureEvent('add', station_id, departure_id,
+                                         departure, None))
+        elif _changed(previous, departure):
+            events.append(DepartureEvent('update', station_id, departure_id,
+                                         departure, previous))
+    for departure_id, departure in old.items():
+        if departure_id not in seen:
+            events.append(DepartureEvent('remove', station_id, departure_id,
+                                         departure, None))
+    return events
+
+
+class _StationState:
+    __slots__ = ('station_id', 'departures', 'interval', 'next_poll',
+                 'last_error')
+
+    def __init__(self, station_id, interval):
+        self.station_id = station_id
+        self.departures = []
+        self.interval = interval
+        self.next_poll = monotonic()
+        self.last_error = None
+
+
+class DepartureMonitor:
+    """Polls departures of many stations adaptively and emits deltas.
+
+    Parameters
+    ----------
+    station_ids : iterable, optional
+        Stations to monitor, in any form :func:`mvg_api.get_departures`
+        accepts. More can be added with :meth:`add_station`.
+    client : :class:`mvg_api.MvgClient`, optional
+        Client to poll with, by default the shared one.
+    min_interval, max_interval : float, optional
+        Bounds for the polling interval of a station in seconds.
+    requests_per_second : float, optional
+        Budget for all stations together. Due stations wait for their
+        turn if it is used up.
+    timeoffset : int, optional
+        Passed on to :func:`mvg_api.get_departures`.
+    """
+
+    def __init__(self, station_ids=(), client=None,
+                 min_interval=10, max_interval=300,
+                 requests_per_second=1.0, timeoffset=0):
+        self.client = client or mvg_api.get_default_client()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.requests_per_second = requests_per_second
+        self.timeoffset = timeoffset
+        self._stations = {}
+        self._queue = []  # heap of (next_poll, station_id)
+        self._next_request = monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        for station_id in station_ids:
+            self.add_station(station_id)
+
+    def add_station(self, station_id):
+        """Starts monitoring `station_id`; it is polled right away."""
+        station_id = mvg_api._normalize_station_id(station_id)
+        with self._lock:
+            if station_id not in self._stations:
+                state = _StationState(station_id, self.min_interval)
+                self._stations[station_id] = state
+                heapq.heappush(self._queue, (state.next_poll, station_id))
+        self._wakeup.set()
+
+    def remove_station(self, station_id):
+        """Stops monitoring `station_id`."""
+        station_id = mvg_api._normalize_station_id(station_id)
+        with self._lock:
+            self._stations.pop(station_id, None)
+
+    @property
+    def station_ids(self):
+        return list(self._stations)
+
+    def departures(self, station_id):
+        """The departures of `station_id` as of its last poll."""
+        station_id = mvg_api._normalize_station_id(station_id)
+        return list(self._stations[station_id].departures)
+
+    def _next_due(self):
+        # drops queue entries of removed or rescheduled stations
+        while self._queue:
+            next_poll, station_id = self._queue[0]
+            state = self._stations.get(station_id)
+            if state is None or state.next_poll != next_poll:
+                heapq.heappop(self._queue)
+                continue
+            return next_poll
+        return None
+
+    def _schedule(self, state, changed, departures):
+        if changed:
+            state.interval = max(self.min_interval, state.interval / 2)
+        else:
+            state.interval = min(self.max_interval, state.interval * 1.5)
+        interval = state.interval
+        if departures:
+            # poll again when the next departure leaves
+            next_departure = min(
+                departure['departureTime'] +
+                departure.get('delay', 0) * 60000
+                for departure in departures)
+            until = (next_departure / 1000) - current_time()
+            interval = min(interval, max(self.min_interval, until))
+        state.next_poll = monotonic() + interval
+        heapq.heappush(self._queue, (state.next_poll, state.station_id))
+
+    def poll(self):
+        """Polls all stations which are due, as far as the request budget
+        allows, and returns the resulting list of events.
+
+        Use this instead of :meth:`run` to drive the monitor from your
+        own loop; :meth:`wait_time` tells when to call it again.
+        """
+        events = []
+        while True:
+            now = monotonic()
+            with self._lock:
+                next_poll = self._next_due()
+                if (next_poll is None or next_poll > now
+                        or self._next_request > now):
+                    break
+                _, station_id = heapq.heappop(self._queue)
+                state = self._stations[station_id]
+                self._next_request = (max(self._next_request, now) +
+                                      1 / self.requests_per_second)
+            try:
+                departures = self.client.get_departures(
+                    station_id, self.timeoffset, use_cache=False)
+            except self.client.request_errors as e:
+                state.last_error = e
+                with self._lock:
+                    if station_id in self._stations:
+                        self._schedule(state, False, [])
+                continue
+            station_events = diff_departures(station_id, state.departures,
+                                             departures)
+            with self._lock:
+                state.departures = departures
+                state.last_error = None
+                if station_id in self._stations:
+                    self._schedule(state, bool(station_events), departures)
+            events += station_events
+        return events
+
+    def wait_time(self):
+        """Seconds until :meth:`poll` has something to do, or `None` if
+        no stations are monitored."""
+        with self._lock:
+            next_poll = self._next_due()
+            if next_poll is None:
+                return None
+            return max(0, max(next_poll, self._next_request) - monotonic())
+
+    def run(self, callback):
+        """Polls until :meth:`stop` is called, passing every
+        :class:`DepartureEvent` to `callback`."""
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            for event in self.poll():
+                callback(event)
+            wait = self.wait_time()
+            self._wakeup.wait(self.max_interval if wait is None else wait)
+            self._wakeup.clear()
+
+    def stop(self):
+        """Makes :meth:`run` return after the current poll."""
+        self._stopped.set()
+        self._wakeup.set()
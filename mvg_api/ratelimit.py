@@ -0,0 +1,169 @@
+# coding=utf-8
+"""Client side rate limiting.
+
+A :class:`RateLimiter` gives every endpoint of the api a token bucket,
+so a client (and all threads or tasks sharing it) stays within a
+request budget. It doesn't sleep itself: :meth:`RateLimiter.reserve`
+returns how long the caller has to wait, so the same limiter works for
+blocking and asyncio clients.
+
+Clients only use a limiter if asked to, with ``rate_limit=True`` or a
+limiter of their own::
+
+    client = MvgClient(rate_limit=RateLimiter({'departure': 5}))
+"""
+
+import random
+import threading
+from time import monotonic, time as current_time
+
+# requests per second allowed for each endpoint by default
+default_rates = {
+    'departure': 20,
+    'location': 10,
+    'nearby': 10,
+    'routing': 5,
+    'interruptions': 2,
+}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average and bursts of up to
+    `burst` requests."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, now=None):
+        """Takes a token and returns the seconds to wait until it may
+        be used (0 if one is available right away)."""
+        now = monotonic() if now is None else now
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Token buckets per endpoint plus a shared pause for when the api
+    asks to back off.
+
+    Parameters
+    ----------
+    rates : dict, optional
+        Requests per second per endpoint, updating :data:`default_rates`.
+        `None` as rate means unlimited.
+    default_rate : float, optional
+        Rate for endpoints not in `rates`, by default unlimited.
+    burst : float, optional
+        How many seconds worth of requests may be sent at once.
+
+    :ivar waits: number of requests that had to wait for a token
+    :ivar wait_time: seconds spent waiting for tokens and pauses
+    :ivar retries: number of retries after 429/5xx responses
+    :ivar backoff_time: seconds spent backing off before retries
+    """
+
+    def __init__(self, rates=None, default_rate=None, burst=1):
+        self.rates = dict(default_rates)
+        if rates:
+            self.rates.update(rates)
+        self.default_rate = default_rate
+        self.burst = burst
+        self.waits = 0
+        self.wait_time = 0.0
+        self.retries = 0
+        self.backoff_time = 0.0
+        self._endpoint_wait_time = {}
+        self._buckets = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint):
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            rate = self.rates.get(endpoint, self.default_rate)
+            if rate is None:
+                return None
+            with self._lock:
+                bucket = self._buckets.setdefault(
+                    endpoint, TokenBucket(rate, max(rate * self.burst, 1)))
+        return bucket
+
+    def reserve(self, endpoint):
+        """Reserves a request to `endpoint` and returns the seconds the
+        caller has to wait before sending it."""
+        # the bucket may be new, so the time is taken after creating it
+        bucket = self._bucket(endpoint)
+        now = monotonic()
+        delay = bucket.reserve(now) if bucket is not None else 0.0
+        delay = max(delay, self._paused_until - now)
+        if delay > 0:
+            with self._lock:
+                self.waits += 1
+                self.wait_time += delay
+                self._endpoint_wait_time[endpoint] = \
+                    self._endpoint_wait_time.get(endpoint, 0.0) + delay
+            return delay
+        return 0.0
+
+    def pause(self, seconds):
+        """Holds back all requests for `seconds`, e.g. because the api
+        answered with a `Retry-After` header."""
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     monotonic() + seconds)
+
+    def record_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.backoff_time += delay
+
+    def stats(self):
+        """Returns the counters as a dict, with the wait time split up
+        per endpoint under `endpoint_wait_time`."""
+        with self._lock:
+            return {
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'retries': self.retries,
+                'backoff_time': self.backoff_time,
+                'endpoint_wait_time': dict(self._endpoint_wait_time),
+                }
+
+
+def parse_retry_after(value):
+    """Seconds to wait according to a `Retry-After` header, which is
+    either a number of seconds or a date. `None` if it can't be parsed."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - current_time())
+
+
+def backoff_delay(attempt, backoff_factor, retry_after=None, maximum=60):
+    """Seconds to wait before retry number `attempt` (starting at 1):
+    exponential backoff with full jitter, but at least `retry_after`."""
+    delay = random.uniform(0, min(maximum,
+                                  backoff_factor * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""Deduplication of concurrent identical requests.
+
+If a request for a URL is already in flight, further callers asking for
+the same URL wait for it and share its result instead of sending their
+own request.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key across threads.
+
+    :ivar coalesced: number of calls that were answered by a call
+        already in flight instead of running their own
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        """Runs `function(*args)`, unless a call with `key` is already
+        running, in which case its result is returned (or its exception
+        raised) once it is done."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """Coalesces concurrent calls with the same key within one event loop.
+
+    :ivar coalesced: number of calls that were answered by a call
+        already in flight instead of running their own
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+
+    async def do(self, key, function, *args):
+        """Awaits `function(*args)`, unless a call with `key` is already
+        running, in which case its result is shared."""
+        # imported here, asyncio is slow to import and only needed by
+        # the asyncio client, which has imported it already
+        import asyncio
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shielded, so a cancelled caller doesn't cancel the others
+        return await asyncio.shield(task)
@@ -0,0 +1,413 @@
+# coding=utf-8
+"""Offline station lookups.
+
+A :class:`StationIndex` collects the station dicts returned by
+:func:`mvg_api.get_locations`, :func:`mvg_api.get_stations` and
+:func:`mvg_api.get_nearby_stations` into an SQLite file, so names and
+ids can be resolved later without talking to the api::
+
+    index = StationIndex("stations.db")
+    index.crawl(["Hauptbahnhof", "Marienplatz", "Sendlinger Tor"])
+    index.commit()
+
+    client = MvgClient(station_index=StationIndex("stations.db"))
+    Station("Marienplatz", client=client)  # no request needed
+
+The client only takes stations of exactly the given name or id from the
+index. :meth:`StationIndex.lookup` and :meth:`StationIndex.search` also
+match names by prefix and despite typos.
+
+A :class:`SpatialIndex` answers nearest station queries in memory::
+
+    nearby = SpatialIndex(StationIndex("stations.db").stations())
+    client = MvgClient(spatial_index=nearby)
+    client.get_nearby_stations(48.1374, 11.5755)  # no request needed
+"""
+
+import difflib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+
+import mvg_api
+
+_transliterations = {'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'}
+_non_word = re.compile(r'[\W_]+')
+
+
+def normalize_name(name):
+    """Lowercases `name`, spells out umlauts and collapses everything
+    that is not a letter or digit into single spaces, so that e.g.
+    "Münchner Freiheit" and "muenchner-freiheit" compare equal."""
+    name = name.lower()
+    for umlaut, replacement in _transliterations.items():
+        name = name.replace(umlaut, replacement)
+    return _non_word.sub(' ', name).strip()
+
+
+def _search_keys(station):
+    keys = {normalize_name(station['name'])}
+    if station.get('place'):
+        keys.add(normalize_name("{} {}".format(station['place'],
+                                               station['name'])))
+    for alias in (station.get('aliases') or '').split():
+        keys.add(normalize_name("{} {}".format(alias, station['name'])))
+    keys.discard('')
+    return keys
+
+
+class StationIndex:
+    """A local, persistent index of stations.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite file to store the index in. It is created if it does not
+        exist yet. By default, the index only lives in memory; use
+        :meth:`save` to write it to a file later.
+
+    All lookups return the same dicts :func:`mvg_api.get_stations`
+    would. The index can be shared between threads.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._names = None
+        with self._lock:
+            if path != ':memory:':
+                # let sqlite read the file through a memory map
+                self._db.execute("PRAGMA mmap_size = 268435456")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS stations (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    latitude REAL,
+                    longitude REAL,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS names (
+                    key TEXT NOT NULL,
+                    station_id TEXT NOT NULL,
+                    PRIMARY KEY (key, station_id)
+                );
+                """)
+
+    def add(self, locations):
+        """Adds all stations out of `locations` (other types of
+        locations are skipped), replacing older entries with the same
+        id. Returns the number of stations added."""
+        added = 0
+        with self._lock, self._db:
+            for station in mvg_api._filter_stations(locations):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO stations VALUES (?, ?, ?, ?, ?)",
+                    (station['id'], station['name'],
+                     station.get('latitude'), station.get('longitude'),
+                     json.dumps(station)))
+                self._db.execute("DELETE FROM names WHERE station_id = ?",
+                                 (station['id'],))
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO names VALUES (?, ?)",
+                    [(key, station['id']) for key in _search_keys(station)])
+                added += 1
+            self._names = None
+        return added
+
+    def crawl(self, queries, client=None):
+        """Searches the api for every query string in `queries` and adds
+        all stations found. Returns the number of stations added."""
+        client = client or mvg_api.get_default_client()
+        return sum(self.add(client.get_locations(query))
+                   for query in queries)
+
+    def crawl_nearby(self, coordinates, client=None):
+        """Like :meth:`crawl`, but adds the stations near each
+        `(latitude, longitude)` tuple in `coordinates`."""
+        client = client or mvg_api.get_default_client()
+        return sum(self.add(client.get_nearby_stations(lat, lon) or [])
+                   for lat, lon in coordinates)
+
+    def _rows_to_stations(self, rows):
+        return [json.loads(data) for data, in rows]
+
+    def get(self, station_id):
+        """Returns the station with `station_id` (in any form accepted
+        by :func:`mvg_api.get_departures`), or `None`."""
+        station_id = mvg_api._normalize_station_id(station_id)
+        with self._lock:
+            row = self._db.execute("SELECT data FROM stations WHERE id = ?",
+                                   (station_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lookup(self, query, limit=10):
+        """Returns stations whose name (optionally prefixed with the
+        place or an alias) starts with `query`.
+
+        Exact matches come first, then shorter names before longer ones.
+        A numeric or `de:09162:6`-style `query` is looked up as id.
+        """
+        station = self._get_by_id_query(query)
+        if station is not None:
+            return [station]
+        key = normalize_name(query)
+        if not key:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT s.data FROM names n JOIN stations s
+                   ON s.id = n.station_id
+                   WHERE n.key >= ? AND n.key < ?
+                   GROUP BY s.id
+                   ORDER BY MIN(n.key != ?), MIN(LENGTH(n.key)), s.name
+                   LIMIT ?""",
+                (key, key + '\uffff', key, limit)).fetchall()
+        return self._rows_to_stations(rows)
+
+    def exact(self, query):
+        """Returns the stations named `query` (optionally prefixed with
+        the place or an alias), or the station with the id `query`.
+
+        Unlike :meth:`lookup`, names which only start with `query` don't
+        match. This is what :class:`mvg_api.MvgClient` answers from, as
+        a prefix match in an index that doesn't know every station might
+        not be the station the api would return.
+        """
+        station = self._get_by_id_query(query)
+        if station is not None:
+            return [station]
+        key = normalize_name(query)
+        if not key:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT s.data FROM names n JOIN stations s
+                   ON s.id = n.station_id
+                   WHERE n.key = ?
+                   ORDER BY s.name""",
+                (key,)).fetchall()
+        return self._rows_to_stations(rows)
+
+    def search(self, query, limit=10, cutoff=0.6):
+        """Like :meth:`lookup`, but falls back to fuzzy matching (to
+        allow for typos) if no name starts with `query`."""
+        stations = self.lookup(query, limit)
+        if stations:
+            return stations
+        names = self._all_names()
+        matches = difflib.get_close_matches(normalize_name(query), names,
+                                            n=limit, cutoff=cutoff)
+        seen = []
+        with self._lock:
+            for key in matches:
+                for station_id, in self._db.execute(
+                        "SELECT station_id FROM names WHERE key = ?",
+                        (key,)):
+                    if station_id not in seen:
+                        seen.append(station_id)
+        return [self.get(station_id) for station_id in seen[:limit]]
+
+    def id_for(self, name):
+        """Like :func:`mvg_api.get_id_for_station`, but offline."""
+        return mvg_api._first_id(self.lookup(name, limit=1))
+
+    def _get_by_id_query(self, query):
+        try:
+            return self.get(int(query))
+        except ValueError:
+            pass
+        if isinstance(query, str) and mvg_api._station_sanity_check(query):
+            return self.get(query)
+        return None
+
+    def _all_names(self):
+        with self._lock:
+            if self._names is None:
+                self._names = [key for key, in self._db.execute(
+                    "SELECT DISTINCT key FROM names")]
+            return self._names
+
+    def stations(self):
+        """Returns a list of all stations in the index."""
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM stations").fetchall()
+        return self._rows_to_stations(rows)
+
+    def commit(self):
+        """Makes sure everything is written to the file."""
+        with self._lock:
+            self._db.commit()
+
+    def save(self, path):
+        """Writes a copy of the index to the SQLite file at `path`."""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._db.backup(target)
+            finally:
+                target.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM stations").fetchone()[0]
+
+    def __contains__(self, station_id):
+        return self.get(station_id) is not None
+
+
+_earth_radius = 6371000.0  # in meters
+_meters_per_degree = math.pi * _earth_radius / 180
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Great circle distance between two coordinates in meters."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * _earth_radius * math.asin(math.sqrt(a))
+
+
+class SpatialIndex:
+    """An in-memory grid of stations for nearest station queries.
+
+    Stations are put into grid cells of `cell_size` degrees, so a query
+    only has to look at the cells around the given location.
+
+    Parameters
+    ----------
+    stations : iterable of dict, optional
+        Station dicts like the ones returned by
+        :func:`mvg_api.get_nearby_stations`.
+    radius : float, optional
+        Radius in meters :class:`mvg_api.MvgClient` uses when answering
+        :meth:`~mvg_api.MvgClient.get_nearby_stations` from this index.
+    cell_size : float, optional
+        Edge length of a grid cell in degrees.
+    """
+
+    def __init__(self, stations=(), radius=1000, cell_size=0.01):
+        self.radius = radius
+        self.cell_size = cell_size
+        self._cells = {}
+        self._bounds = None  # (min row, min col, max row, max col)
+        self._ids = set()
+        self._lock = threading.Lock()
+        self.add(stations)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_size)),
+                int(math.floor(lon / self.cell_size)))
+
+    def add(self, locations):
+        """Adds all stations with coordinates out of `locations`,
+        skipping ones already known. Returns the number added."""
+        added = 0
+        with self._lock:
+            for station in mvg_api._filter_stations(locations):
+                if station['id'] in self._ids:
+                    continue
+                lat, lon = station.get('latitude'), station.get('longitude')
+                if lat is None or lon is None:
+                    continue
+                row, col = cell = self._cell(lat, lon)
+                self._cells.setdefault(cell, []).append((lat, lon, station))
+                if self._bounds is None:
+                    self._bounds = (row, col, row, col)
+                else:
+                    min_row, min_col, max_row, max_col = self._bounds
+                    self._bounds = (min(row, min_row), min(col, min_col),
+                                    max(row, max_row), max(col, max_col))
+                self._ids.add(station['id'])
+                added += 1
+        return added
+
+    def _ring(self, center, ring, bounds):
+        """The cells `ring` cells away from `center` which lie within
+        `bounds`, as only those can hold stations."""
+        row, col = center
+        min_row, min_col, max_row, max_col = bounds
+        if ring == 0:
+            return [center]
+        cells = []
+        first_col = max(col - ring, min_col)
+        last_col = min(col + ring, max_col)
+        for edge in (row - ring, row + ring):
+            if min_row <= edge <= max_row:
+                cells += [(edge, i) for i in range(first_col, last_col + 1)]
+        first_row = max(row - ring + 1, min_row)
+        last_row = min(row + ring - 1, max_row)
+        for edge in (col - ring, col + ring):
+            if min_col <= edge <= max_col:
+                cells += [(i, edge) for i in range(first_row, last_row + 1)]
+        return cells
+
+    def _search(self, lat, lon, k, radius):
+        # cells are searched in growing rings around the query location,
+        # until no unsearched cell can hold anything nearer than needed.
+        # Rings start at the first one reaching the cells with stations,
+        # and only their cells with stations are visited, so locations
+        # far away from all stations don't search empty cells.
+        center = self._cell(lat, lon)
+        cell_meters = self.cell_size * _meters_per_degree * min(
+            1, math.cos(math.radians(lat)))
+        best = []  # heap of (-distance, counter, station)
+        counter = 0
+        with self._lock:
+            if self._bounds is None:
+                return []
+            bounds = min_row, min_col, max_row, max_col = self._bounds
+            max_ring = max(center[0] - min_row, max_row - center[0],
+                           center[1] - min_col, max_col - center[1])
+            first_ring = max(min_row - center[0], center[0] - max_row,
+                             min_col - center[1], center[1] - max_col, 0)
+            for ring in range(first_ring, max_ring + 1):
+                for cell in self._ring(center, ring, bounds):
+                    for s_lat, s_lon, station in self._cells.get(cell, ()):
+                        d = distance(lat, lon, s_lat, s_lon)
+                        if radius is not None and d > radius:
+                            continue
+                        counter += 1
+                        if k is None or len(best) < k:
+                            heapq.heappush(best, (-d, counter, station))
+                        elif d < -best[0][0]:
+                            heapq.heapreplace(best, (-d, counter, station))
+                reach = ring * cell_meters
+                if radius is not None and reach >= radius:
+                    break
+                if k is not None and len(best) == k and -best[0][0] <= reach:
+                    break
+        return [station for _, _, station in sorted(best, reverse=True)]
+
+    def nearest(self, lat, lon, k=10, radius=None):
+        """Returns the `k` stations nearest to the location, closest
+        first, optionally only the ones within `radius` meters."""
+        return self._search(lat, lon, k, radius)
+
+    def within(self, lat, lon, radius=None):
+        """Returns all stations within `radius` meters (by default
+        :attr:`radius`) of the location, closest first."""
+        return self._search(lat, lon, None,
+                            self.radius if radius is None else radius)
+
+    def nearest_many(self, coordinates, k=10, radius=None):
+        """Runs :meth:`nearest` for every `(latitude, longitude)` pair in
+        `coordinates` (e.g. a list of tuples or a numpy array of shape
+        `(n, 2)`) and returns a list of the results."""
+        return [self.nearest(lat, lon, k, radius) for lat, lon in coordinates]
+
+    def within_many(self, coordinates, radius=None):
+        """Runs :meth:`within` for every `(latitude, longitude)` pair in
+        `coordinates` and returns a list of the results."""
+        return [self.within(lat, lon, radius) for lat, lon in coordinates]
+
+    def __len__(self):
+        return len(self._ids)
@@ -0,0 +1,161 @@
+# coding=utf-8
+"""Pluggable HTTP transports for :class:`mvg_api.MvgClient`.
+
+By default the client sends its requests over its own pooled `requests`
+session. A transport given as `transport` replaces that, which allows
+recording the responses of the api once and replaying them later
+without network access, e.g. for benchmarks::
+
+    recorder = MvgClient(transport=RecordingTransport('fixtures'))
+    recorder.get_departures(6)  # asks the api, saves the response
+
+    offline = MvgClient(transport=ReplayTransport('fixtures'))
+    offline.get_departures(6)  # answered from fixtures/
+
+A transport is any object with a `get(url, timeout, headers)` method
+returning a :class:`Response`, where `headers` are extra request
+headers or `None`. Retries, rate limiting and caching of the client
+still apply on top of it.
+"""
+
+import base64
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+Response = namedtuple('Response', 'status headers body')
+Response.__doc__ = """A response as returned by a transport: the status
+code, a case insensitive mapping of headers and the body as `bytes`."""
+
+
+# describe the body as it was sent, not as it is recorded
+_transfer_headers = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class MissingRecording(LookupError):
+    """Raised by :class:`ReplayTransport` for urls never recorded."""
+
+
+def recording_key(url):
+    """File name a response to `url` is recorded under.
+
+    Only the path and query of the url count, so recordings can be
+    replayed against another host.
+    """
+    path = url.split('://', 1)[-1].partition('/')[2]
+    return hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json'
+
+
+class RequestsTransport:
+    """Sends requests with a `requests` session, by default a new one
+    with the user agent of :mod:`mvg_api`."""
+
+    def __init__(self, session=None):
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from mvg_api import user_agent, _accept_encoding
+            self._session = requests.Session()
+            self._session.headers.update({
+                'User-Agent': user_agent,
+                'Accept': 'application/json',
+                'Accept-Encoding': _accept_encoding(),
+                })
+        return self._session
+
+    def get(self, url, timeout=None, headers=None):
+        resp = self.session.get(url, timeout=timeout, headers=headers)
+        return Response(resp.status_code, resp.headers, resp.content)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class RecordingTransport:
+    """Passes requests on to `transport` (by default a
+    :class:`RequestsTransport`) and saves every response except
+    `304 Not Modified` as a JSON file in the directory `path`,
+    overwriting earlier recordings of the same url. Bodies are saved
+    decompressed, without the headers describing their encoding."""
+
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or RequestsTransport()
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, url, timeout=None, headers=None):
+        response = self.transport.get(url, timeout, headers)
+        if response.status == 304:
+            # answer to a conditional request, keep the full recording
+            return response
+        record = {
+            'url': url,
+            'status': response.status,
+            'headers': {name: value
+                        for name, value in response.headers.items()
+                        if name.lower() not in _transfer_headers},
+            }
+        try:
+            record['body'] = response.body.decode('utf-8')
+        except UnicodeDecodeError:
+            record['body_base64'] = \
+                base64.b64encode(response.body).decode('ascii')
+        filename = os.path.join(self.path, recording_key(url))
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport:
+    """Answers requests from the responses a :class:`RecordingTransport`
+    saved in the directory `path`, without any network access.
+
+    Urls that were never recorded raise :class:`MissingRecording`, or
+    are answered with status `missing_status` if that is given. Bulk
+    calls like :meth:`mvg_api.MvgClient.get_departures_many` collect it
+    per station like any other request error.
+    Recordings are read once and then kept in memory.
+    """
+
+    def __init__(self, path, missing_status=None):
+        self.path = path
+        self.missing_status = missing_status
+        self._responses = {}
+
+    def _load(self, key):
+        with open(os.path.join(self.path, key), encoding='utf-8') as f:
+            record = json.load(f)
+        if 'body' in record:
+            body = record['body'].encode('utf-8')
+        else:
+            body = base64.b64decode(record['body_base64'])
+        from requests.structures import CaseInsensitiveDict
+        return Response(record['status'],
+                        CaseInsensitiveDict(record['headers']), body)
+
+    def get(self, url, timeout=None, headers=None):
+        # conditional headers are ignored, recordings are always
+        # replayed in full
+        key = recording_key(url)
+        response = self._responses.get(key)
+        if response is None:
+            try:
+                response = self._responses[key] = self._load(key)
+            except FileNotFoundError:
+                if self.missing_status is None:
+                    raise MissingRecording(
+                        "No recorded response for {}".format(url))
+                return Response(self.missing_status, {}, b'')
+        return response
+
+    def close(self):
+        self._responses.clear()
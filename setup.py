@@ -35,12 +35,25 @@ setup(
         'Intended Audience :: Developers',
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
 
     packages=['mvg_api'],
+    python_requires='>=3.7',
+    entry_points={
+        'console_scripts': ['mvg = mvg_api.cli:main'],
+    },
     install_requires=['requests'],
+    extras_require={
+        'aio': ['aiohttp'],
+        'numpy': ['numpy'],
+        'orjson': ['orjson'],
+        'msgspec': ['msgspec'],
+        'prometheus': ['prometheus_client'],
+        'ijson': ['ijson'],
+        'brotli': ['brotli'],
+        'arrow': ['pyarrow'],
+        'test': ['pytest', 'pytest-benchmark'],
+    },
 )
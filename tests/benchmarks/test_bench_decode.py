@@ -0,0 +1,28 @@
+# coding=utf-8
+"""Decoding recorded responses with each JSON backend installed."""
+
+import pytest
+
+import mvg_api
+from mvg_api import decoders
+
+responses = {
+    'departures': mvg_api._departures_url(6),
+    'route': mvg_api._route_url(6, 2),
+    'interruptions': mvg_api.interruptions_url,
+}
+
+
+@pytest.fixture(params=decoders.preference)
+def loads(request):
+    try:
+        return decoders.get_decoder(request.param)
+    except ImportError:
+        pytest.skip("{} is not installed".format(request.param))
+
+
+@pytest.mark.parametrize('response', sorted(responses))
+def test_decode(benchmark, replay_client, loads, response):
+    benchmark.group = 'decode ' + response
+    body = replay_client.transport.get(responses[response]).body
+    assert benchmark(loads, body) == decoders.get_decoder('json')(body)
@@ -0,0 +1,38 @@
+# coding=utf-8
+"""Benchmarks of the public functions on replayed responses, without
+network access. Run with ``pytest tests/benchmarks``, and compare
+releases with ``--benchmark-autosave`` and ``--benchmark-compare``.
+
+The client caches nothing, so every call decodes and processes the
+whole recorded response.
+"""
+
+
+def test_get_departures(benchmark, replay_client):
+    departures = benchmark(replay_client.get_departures, 6)
+    assert len(departures) == 120
+
+
+def test_get_departures_objects(benchmark, replay_client):
+    departures = benchmark(replay_client.get_departures, 6, as_objects=True)
+    assert len(departures) == 120
+
+
+def test_get_route(benchmark, replay_client):
+    connections = benchmark(replay_client.get_route, 6, 2)
+    assert len(connections) == 8
+
+
+def test_get_locations(benchmark, replay_client):
+    locations = benchmark(replay_client.get_locations, "Hauptbahnhof")
+    assert len(locations) == 4
+
+
+def test_get_nearby_stations(benchmark, replay_client):
+    stations = benchmark(replay_client.get_nearby_stations, 48.1374, 11.5755)
+    assert len(stations) == 10
+
+
+def test_get_interruptions(benchmark, replay_client):
+    interruptions = benchmark(replay_client.get_interruptions)
+    assert len(interruptions['interruption']) == 20
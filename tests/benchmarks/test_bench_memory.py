@@ -0,0 +1,48 @@
+# coding=utf-8
+"""Memory of a board of about 20000 departures, as dicts and as
+:class:`mvg_api.models.Departure` objects.
+
+The bytes the results take up are added to the `extra_info` of each
+benchmark, see ``--benchmark-json``.
+"""
+
+import tracemalloc
+
+import pytest
+
+import mvg_api
+
+
+def _allocated(function, *args):
+    """Returns the result of `function` and the bytes it still holds."""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+@pytest.fixture
+def board(replay_client):
+    results = replay_client._perform_api_request(
+        mvg_api._departures_url(6), 'departure')
+    return dict(results, departures=results['departures'] * 170)
+
+
+@pytest.mark.benchmark(group='board memory')
+@pytest.mark.parametrize('as_objects', [False, True],
+                         ids=['dicts', 'objects'])
+def test_board(benchmark, board, as_objects):
+    departures, size = _allocated(mvg_api._process_departures, board, None,
+                                  as_objects)
+    benchmark.extra_info['bytes'] = size
+    benchmark.extra_info['bytes_per_departure'] = size // len(departures)
+    benchmark(mvg_api._process_departures, board, None, as_objects)
+
+
+def test_objects_take_less_memory(board):
+    _, dicts = _allocated(mvg_api._process_departures, board, None, False)
+    _, objects = _allocated(mvg_api._process_departures, board, None, True)
+    assert objects < dicts / 2
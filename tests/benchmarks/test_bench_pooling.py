@@ -0,0 +1,26 @@
+# coding=utf-8
+"""Requests per second (the OPS column) against the local stub server,
+with the pooled client and with a new connection for every request as
+before :class:`mvg_api.MvgClient` existed."""
+
+import pytest
+
+import mvg_api
+
+
+@pytest.mark.benchmark(group='pooling')
+def test_pooled_client(benchmark, stub_client):
+    departures = benchmark(stub_client.get_departures, 6, use_cache=False)
+    assert len(departures) == 120
+
+
+@pytest.mark.benchmark(group='pooling')
+def test_connection_per_request(benchmark, stub):
+    import requests
+    url = stub.url + mvg_api._departures_url(6)[len(mvg_api.api_base_url):]
+
+    def get_departures():
+        resp = requests.get(url, timeout=(5, 15))
+        return mvg_api._process_departures(resp.json())
+
+    assert len(benchmark(get_departures)) == 120
@@ -0,0 +1,135 @@
+# coding=utf-8
+"""Fixtures shared by the tests and benchmarks.
+
+Nothing here talks to the real api. `tests/fixtures` holds responses in
+the format :class:`mvg_api.transport.RecordingTransport` writes, which
+are either replayed with a :class:`mvg_api.transport.ReplayTransport`
+or served over HTTP by a local :class:`StubServer`.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import mvg_api
+from mvg_api.transport import ReplayTransport
+
+fixtures_path = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class StubServer:
+    """An HTTP server on a free local port, answering requests for api
+    paths with the recordings in `path` and with 404 otherwise.
+
+    Responses appended to :attr:`queue` as `(status, headers, body)` are
+    sent first, one per request, e.g. to make the next requests fail.
+    Every response is held back for :attr:`delay` seconds.
+
+    :ivar paths: path and query of every request received
+    :ivar headers: headers of every request received
+    :ivar connections: client addresses of the connections requests
+        came in on
+    """
+
+    def __init__(self, path=fixtures_path):
+        self.replay = ReplayTransport(path, missing_status=404)
+        self.queue = []
+        self.delay = 0
+        self.paths = []
+        self.headers = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self._server.server_port)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                # headers and body are written separately, don't let
+                # them wait for the ack of the previous segment
+                self.request.setsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.paths.append(self.path)
+                    stub.headers.append(self.headers)
+                    stub.connections.add(self.client_address)
+                    queued = stub.queue.pop(0) if stub.queue else None
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if queued is None:
+                    queued = stub.replay.get(mvg_api.api_base_url + self.path)
+                status, headers, body = queued
+                self.send_response(status)
+                headers = dict(headers)
+                headers.setdefault('Content-Type', 'application/json')
+                headers['Content-Length'] = str(len(body))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stub_client(stub):
+    """A client sending its requests to :func:`stub`, without cache,
+    rate limit or waiting between retries."""
+    with mvg_api.MvgClient(base_url=stub.url, cache=False, rate_limit=False,
+                           backoff_factor=0) as client:
+        yield client
+
+
+@pytest.fixture
+def replay_client():
+    """A client answering every request from the recorded fixtures."""
+    with mvg_api.MvgClient(transport=ReplayTransport(fixtures_path),
+                           cache=False, rate_limit=False,
+                           conditional=False) as client:
+        yield client
+
+
+@pytest.fixture
+def upcoming_route(replay_client):
+    """Body of the recorded route 6 -> 2 with its connections moved to
+    an hour from now, so route caches keep them."""
+    response = replay_client.transport.get(mvg_api._route_url(6, 2))
+    results = json.loads(response.body.decode('utf-8'))
+    shift = int(time.time() * 1000) + 3600000 - \
+        results['connectionList'][0]['departure']
+    for connection in results['connectionList']:
+        connection['departure'] += shift
+        connection['arrival'] += shift
+    return json.dumps(results).encode('utf-8')
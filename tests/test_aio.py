@@ -0,0 +1,49 @@
+# coding=utf-8
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from mvg_api import aio  # noqa: E402
+
+
+@pytest.fixture
+def async_client(stub):
+    client = aio.AsyncMvgClient(base_url=stub.url, cache=False,
+                                rate_limit=False, backoff_factor=0)
+    previous = aio.get_default_client()
+    aio.set_default_client(client)
+    yield client
+    aio.set_default_client(previous)
+
+
+def test_same_results_as_blocking_client(async_client, stub_client):
+    departures = asyncio.run(async_client.get_departures(6))
+    assert ([d['departureId'] for d in departures] ==
+            [d['departureId'] for d in stub_client.get_departures(6)])
+
+
+def test_session_closed_with_its_loop(async_client):
+    sessions = []
+
+    async def get_departures():
+        sessions.append(async_client.session)
+        return await aio.get_departures(6)
+
+    for _ in range(2):
+        assert len(asyncio.run(get_departures())) == 120
+    assert sessions[0] is not sessions[1]
+    assert all(session.closed for session in sessions)
+
+
+def test_close_default_client(async_client):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(aio.get_departures(6))
+        session = async_client._session
+        loop.run_until_complete(aio.close())
+    finally:
+        loop.close()
+    assert session.closed
+    assert async_client._session is None
@@ -0,0 +1,147 @@
+# coding=utf-8
+import pytest
+
+import mvg_api
+from mvg_api import cache
+from mvg_api.cache import RouteCache, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'monotonic', clock)
+    return clock
+
+
+def test_ttl_expiry(clock):
+    ttl_cache = TTLCache()
+    ttl_cache.set('a', 1, 5)
+    clock.now += 4.9
+    assert ttl_cache.get('a') == 1
+    clock.now += 0.1
+    assert ttl_cache.get('a') is None
+    assert len(ttl_cache) == 0
+
+
+def test_lru_eviction(clock):
+    ttl_cache = TTLCache(maxsize=2)
+    ttl_cache.set('a', 1, 60)
+    ttl_cache.set('b', 2, 60)
+    ttl_cache.get('a')  # b is now the least recently used
+    ttl_cache.set('c', 3, 60)
+    assert ttl_cache.get('b') is None
+    assert ttl_cache.get('a') == 1
+    assert ttl_cache.get('c') == 3
+    assert ttl_cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1,
+                                 'size': 2, 'maxsize': 2}
+
+
+def test_client_cache(stub):
+    with mvg_api.MvgClient(base_url=stub.url, rate_limit=False) as client:
+        for _ in range(3):
+            assert len(client.get_departures(6)) == 120
+        assert len(stub.paths) == 1
+        assert client.cache.hits == 2
+        assert len(client.get_departures(6, use_cache=False)) == 120
+        assert len(stub.paths) == 2
+
+
+
+minute = 60000
+noon = 1571918400000  # 2019-10-24 12:00 UTC in milliseconds
+
+
+@pytest.fixture
+def wall_clock(monkeypatch):
+    """Milliseconds since the epoch as seen by the route cache."""
+    clock = Clock()
+    clock.now = noon
+    monkeypatch.setattr(cache, 'current_time', lambda: clock.now / 1000)
+    return clock
+
+
+def _route_url(time, **options):
+    return mvg_api._route_url(6, 2, time=time, **options)
+
+
+def _route(*departures):
+    return {'connectionList': [{'departure': departure}
+                               for departure in departures]}
+
+
+def _departures(results):
+    return [c['departure'] for c in results['connectionList']]
+
+
+def test_route_canonical():
+    route_cache = RouteCache(granularity=60)
+    url = mvg_api.routing_url + 'toStation=2&fromStation=6&time={}'
+    key, earliest = route_cache.canonical(url.format(noon + 50000))
+    assert key == (mvg_api.routing_url +
+                   'fromStation=6&time={}&toStation=2'.format(noon))
+    assert earliest == noon + 50000
+    # arrival times don't restrict the departures
+    _, earliest = route_cache.canonical(url.format(noon) + '&arrival=true')
+    assert earliest is None
+
+
+def test_route_bucketing(clock, wall_clock):
+    route_cache = RouteCache()
+    route_cache.set(_route_url(noon + 10000),
+                    _route(noon + 30000, noon + 5 * minute))
+    results = route_cache.get(_route_url(noon + 50000))
+    assert _departures(results) == [noon + 5 * minute]
+    # the next bucket is another query
+    assert route_cache.get(_route_url(noon + minute)) is None
+
+
+def test_route_earlier_in_bucket_is_a_miss(clock, wall_clock):
+    route_cache = RouteCache()
+    route_cache.set(_route_url(noon + 50000), _route(noon + 5 * minute))
+    # connections leaving from 12:00:10 to 12:00:50 weren't asked for
+    assert route_cache.get(_route_url(noon + 10000)) is None
+    assert route_cache.misses == 1
+
+
+def test_route_departed_connections(clock, wall_clock):
+    route_cache = RouteCache()
+    route_cache.set(_route_url(noon), _route(noon + minute, noon + 3 * minute))
+    wall_clock.now += 2 * minute
+    assert _departures(route_cache.get(_route_url(noon))) == \
+        [noon + 3 * minute]
+    wall_clock.now += 2 * minute
+    assert route_cache.get(_route_url(noon)) is None
+
+
+def test_route_max_age(clock, wall_clock):
+    route_cache = RouteCache(max_age=300)
+    route_cache.set(_route_url(noon), _route(noon + 60 * minute))
+    clock.now += 300
+    assert route_cache.get(_route_url(noon)) is not None
+    clock.now += 1
+    assert route_cache.get(_route_url(noon)) is None
+    assert route_cache.expirations == 1
+    assert len(route_cache) == 0
+
+
+def test_route_stats(clock, wall_clock):
+    route_cache = RouteCache(maxsize=1)
+    route_cache.set(_route_url(noon), _route(noon + minute))
+    route_cache.get(_route_url(noon))
+    route_cache.get(_route_url(noon + 10000))
+    route_cache.get(_route_url(noon + 10 * minute))
+    route_cache.set(_route_url(noon + 10 * minute), _route(noon + 11 * minute))
+    stats = route_cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+    assert stats['evictions'] == 1
+    assert stats['size'] == 1
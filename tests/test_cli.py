@@ -0,0 +1,78 @@
+# coding=utf-8
+import io
+import json
+import threading
+
+from mvg_api import cli
+
+
+class _Stdin:
+    """Yields `lines`, but holds back the second line until something
+    was written to `output` or a second has passed."""
+
+    def __init__(self, lines, output):
+        self.lines = lines
+        self.output = output
+        self.streamed = None
+
+    def __iter__(self):
+        yield self.lines[0]
+        self.streamed = self.output.written.wait(1)
+        for line in self.lines[1:]:
+            yield line
+
+
+class _Output(io.StringIO):
+
+    def __init__(self):
+        super().__init__()
+        self.written = threading.Event()
+
+    def write(self, text):
+        self.written.set()
+        return super().write(text)
+
+
+def _departures(client, argv, stdin=None, monkeypatch=None):
+    args = cli._make_parser().parse_args(argv)
+    stream = _Output()
+    if stdin is not None:
+        stdin = _Stdin(stdin, stream)
+        monkeypatch.setattr('sys.stdin', stdin)
+    output = cli._Output(args.columns, args.format, stream)
+    status = args.run(client, args, output)
+    return status, stream.getvalue(), stdin
+
+
+def test_departures_table(stub_client):
+    status, text, _ = _departures(
+        stub_client, ['departures', '6', '--limit', '3'])
+    lines = text.splitlines()
+    assert status == 0
+    assert lines[0].split()[:3] == ['station', 'min', 'time']
+    assert len(lines) == 4
+
+
+def test_departures_from_stdin(stub_client, monkeypatch):
+    status, text, stdin = _departures(
+        stub_client, ['--format', 'ndjson', 'departures', '-', '--limit', '2'],
+        ["6\n", "# comment\n", "2\n", "foo bar\n"], monkeypatch)
+    records = [json.loads(line) for line in text.splitlines()]
+    assert status == 1
+    assert stdin.streamed
+    assert sorted(r['station'] for r in records if 'error' not in r) == \
+        ['de:09162:2'] * 2 + ['de:09162:6'] * 2
+    errors = [r for r in records if 'error' in r]
+    assert [r['station'] for r in errors] == ['foo bar']
+
+
+def test_unknown_station_on_stderr(stub_client, capsys):
+    status, text, _ = _departures(stub_client, ['departures', '6', 'foo'])
+    assert status == 1
+    assert len(text.splitlines()) == 121
+    assert capsys.readouterr().err.startswith("foo: ")
+
+
+def test_parse_time():
+    assert cli._parse_time('2019-10-24T08:15').hour == 8
+    assert cli._parse_time('08:15').minute == 15
@@ -0,0 +1,73 @@
+# coding=utf-8
+import pytest
+
+import mvg_api
+
+
+@pytest.fixture
+def default_client(stub_client):
+    previous = mvg_api.get_default_client()
+    mvg_api.set_default_client(stub_client)
+    yield stub_client
+    mvg_api.set_default_client(previous)
+
+
+def test_connections_are_reused(stub, stub_client):
+    for _ in range(5):
+        assert len(stub_client.get_departures(6, use_cache=False)) == 120
+    assert len(stub.paths) == 5
+    assert len(stub.connections) == 1
+
+
+def test_retry_on_server_errors(stub, stub_client):
+    stub.queue += [(503, {}, b''), (502, {}, b'')]
+    assert len(stub_client.get_departures(6)) == 120
+    assert len(stub.paths) == 3
+
+
+def test_retries_exhausted(stub):
+    stub.queue += [(503, {}, b'')] * 3
+    with mvg_api.MvgClient(base_url=stub.url, retries=1, backoff_factor=0,
+                           rate_limit=False) as client:
+        with pytest.raises(mvg_api.ApiError) as excinfo:
+            client.get_departures(6)
+    assert excinfo.value.code == 503
+    assert len(stub.paths) == 2
+
+
+def test_client_errors_are_not_retried(stub, stub_client):
+    stub.queue.append((404, {}, b'{"error": "unknown station"}'))
+    with pytest.raises(mvg_api.ApiError) as excinfo:
+        stub_client.get_departures(6)
+    assert excinfo.value.reason == {'error': 'unknown station'}
+    assert len(stub.paths) == 1
+
+
+def test_error_without_json_body(stub, stub_client):
+    stub.queue.append((404, {'Content-Type': 'text/html'},
+                       b'<html><body>Not Found</body></html>'))
+    with pytest.raises(mvg_api.ApiError) as excinfo:
+        stub_client.get_departures(6)
+    assert excinfo.value.code == 404
+    assert excinfo.value.reason is None
+    assert str(excinfo.value) == "Got status code 404"
+
+
+def test_set_default_client(stub, default_client):
+    assert mvg_api.get_default_client() is default_client
+    assert len(mvg_api.get_departures(6)) == 120
+    assert mvg_api.get_id_for_station("Hauptbahnhof") == 'de:09162:6'
+    station = mvg_api.Station("Hauptbahnhof")
+    assert station.client is default_client
+    # the client has no cache, so the station is looked up twice
+    assert len(stub.paths) == 3
+
+
+def test_routes_matrix_is_cached(stub, stub_client, upcoming_route):
+    stub.queue.append((200, {}, upcoming_route))
+    for _ in range(2):
+        matrix = stub_client.get_routes_matrix([6, 6], [2])
+        assert len(matrix.connections[1][0]) == 8
+    assert len(stub.paths) == 1
+    stub_client.get_routes_matrix([6], [2], use_cache=False)
+    assert len(stub.paths) == 2
@@ -0,0 +1,79 @@
+# coding=utf-8
+import pytest
+
+import mvg_api
+from mvg_api.metrics import MetricsCollector
+
+
+def _ids(departures):
+    return [departure['departureId'] for departure in departures]
+
+
+@pytest.fixture
+def departures(replay_client):
+    """Body of the recorded departures of station 6."""
+    return replay_client.transport.get(mvg_api._departures_url(6)).body
+
+
+def test_not_modified(stub, departures):
+    stub.queue.append((200, {'ETag': '"v1"'}, departures))
+    stub.queue.append((304, {'ETag': '"v1"'}, b''))
+    metrics = MetricsCollector()
+    with mvg_api.MvgClient(base_url=stub.url, cache=False, rate_limit=False,
+                           hooks=metrics) as client:
+        first = client.get_departures(6)
+        second = client.get_departures(6)
+    assert len(first) == 120
+    assert _ids(second) == _ids(first)
+    assert 'If-None-Match' not in stub.headers[0]
+    assert stub.headers[1]['If-None-Match'] == '"v1"'
+    stats = metrics.stats()['departure']
+    assert stats['requests'] == 2
+    assert stats['cache_hits'] == 1
+    assert stats['latency']['count'] == 2
+
+
+def test_last_modified(stub, departures):
+    date = 'Thu, 24 Oct 2019 13:00:00 GMT'
+    stub.queue.append((200, {'Last-Modified': date}, departures))
+    with mvg_api.MvgClient(base_url=stub.url, cache=False,
+                           rate_limit=False) as client:
+        client.get_departures(6)
+        client.get_departures(6)
+    assert stub.headers[1]['If-Modified-Since'] == date
+
+
+def test_unconditional_without_validators(stub, stub_client):
+    stub_client.get_departures(6)
+    stub_client.get_departures(6)
+    assert 'If-None-Match' not in stub.headers[1]
+    assert 'If-Modified-Since' not in stub.headers[1]
+
+
+def test_not_modified_without_stored_response(stub, stub_client):
+    stub.queue.append((304, {}, b''))
+    with pytest.raises(mvg_api.ApiError) as excinfo:
+        stub_client.get_departures(6)
+    assert excinfo.value.code == 304
+
+
+def test_async_not_modified(stub, departures):
+    pytest.importorskip('aiohttp')
+    import asyncio
+    from mvg_api import aio
+    stub.queue.append((200, {'ETag': '"v1"'}, departures))
+    stub.queue.append((304, {'ETag': '"v1"'}, b''))
+    stub.queue.append((304, {}, b''))
+
+    async def get_departures():
+        async with aio.AsyncMvgClient(base_url=stub.url, cache=False,
+                                      rate_limit=False) as client:
+            first = await client.get_departures(6)
+            second = await client.get_departures(6)
+            assert _ids(second) == _ids(first)
+            client.validators.clear()
+            with pytest.raises(mvg_api.ApiError):
+                await client.get_departures(6)
+
+    asyncio.run(get_departures())
+    assert stub.headers[1]['If-None-Match'] == '"v1"'
@@ -0,0 +1,83 @@
+# coding=utf-8
+import datetime
+import random
+import sys
+
+import pytest
+
+import mvg_api
+
+now = 1571923200000
+
+
+def test_station_board_is_one_request(stub, stub_client):
+    board = stub_client.get_station_board(6)
+    assert len(board['departures']) == 120
+    assert 'departureTimeMinutes' in board['departures'][0]
+    assert board['servingLines'][0]['lineNumber'] == 'U1'
+    assert len(stub.paths) == 1
+
+
+def test_lines_reuse_departures(stub, stub_client):
+    stub_client.get_departures(6)
+    lines = stub_client.get_lines('de:09162:6')
+    assert lines[0]['lineNumber'] == 'U1'
+    assert len(stub.paths) == 1
+    # other stations and use_cache=False still ask the api
+    stub_client.get_lines(2)
+    stub_client.get_lines(6, use_cache=False)
+    assert len(stub.paths) == 3
+
+
+def test_lines_memo_expires(stub):
+    with mvg_api.MvgClient(base_url=stub.url, cache=False, rate_limit=False,
+                           lines_max_age=0) as client:
+        client.get_departures(6)
+        client.get_lines(6)
+    assert len(stub.paths) == 2
+
+
+def _times_and_delays(count):
+    rng = random.Random(count)
+    times = [now + rng.randrange(-10 * 60000, 120 * 60000)
+             for _ in range(count)]
+    # exact minute boundaries round differently if done carelessly
+    times[:3] = [now, now + 60000, now - 60000]
+    delays = [rng.choice((0, 0, 1, 5)) for _ in range(count)]
+    return times, delays
+
+
+def _datetime_minutes(times, delays):
+    """The formula get_departures used before the minutes were computed
+    in one pass."""
+    current = mvg_api._convert_time(now)
+    return [(mvg_api._convert_time(time) - current) //
+            datetime.timedelta(seconds=60) + delay
+            for time, delay in zip(times, delays)]
+
+
+@pytest.mark.parametrize('count', [10, 1000])
+def test_minutes_until(count, monkeypatch):
+    times, delays = _times_and_delays(count)
+    expected = _datetime_minutes(times, delays)
+    assert mvg_api._minutes_until(times, delays, now) == expected
+    monkeypatch.setattr(mvg_api, '_numpy_threshold', sys.maxsize)
+    assert mvg_api._minutes_until(times, delays, now) == expected
+
+
+def test_minutes_until_numpy():
+    pytest.importorskip('numpy')
+    times, delays = _times_and_delays(mvg_api._numpy_threshold)
+    minutes = mvg_api._minutes_until(times, delays, now)
+    assert all(type(value) is int for value in minutes)
+    assert minutes == _datetime_minutes(times, delays)
+
+
+def test_process_departures_keeps_response(replay_client):
+    results = replay_client.transport.get(mvg_api._departures_url(6))
+    results = replay_client._decode(results.body)
+    departures = mvg_api._process_departures(results, now=now)
+    assert 'departureTimeMinutes' not in results['departures'][0]
+    assert [d['departureTimeMinutes'] for d in departures] == \
+        _datetime_minutes([d['departureTime'] for d in departures],
+                          [d.get('delay', 0) for d in departures])
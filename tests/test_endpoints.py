@@ -0,0 +1,106 @@
+# coding=utf-8
+import asyncio
+
+import pytest
+
+import mvg_api
+from mvg_api.endpoints import EndpointRegistry
+
+# nothing listens on the discard port
+dead_url = 'http://127.0.0.1:9'
+
+
+def _client(endpoints):
+    return mvg_api.MvgClient(endpoints=endpoints, cache=False,
+                             rate_limit=False, retries=0)
+
+
+def test_empty_server_list():
+    registry = EndpointRegistry()
+    with pytest.raises(ValueError):
+        registry.set('departure', [])
+    with pytest.raises(ValueError):
+        registry.set(None, iter([]))
+
+
+def test_latency_per_endpoint():
+    registry = EndpointRegistry(['http://a', 'http://b'])
+    a, b = registry.backends(None)
+    # a is slow for routing only, b for departures only
+    registry.record_success(a, 'routing', 2.0)
+    registry.record_success(a, 'departure', 0.05)
+    registry.record_success(b, 'departure', 0.1)
+    registry.record_success(b, 'routing', 0.5)
+    assert registry.backends('departure') == [a, b]
+    assert registry.backends('routing') == [b, a]
+    assert registry.stats()['http://a']['latencies'] == {
+        'routing': 2.0, 'departure': 0.05}
+
+
+def test_health_is_shared_by_endpoints():
+    registry = EndpointRegistry(['http://a', 'http://b'])
+    a, b = registry.backends(None)
+    registry.record_failure(a)
+    assert registry.backends('departure') == [b, a]
+    assert registry.backends('routing') == [b, a]
+
+
+def test_failover_on_connection_error(stub):
+    registry = EndpointRegistry([dead_url, stub.url])
+    with _client(registry) as client:
+        assert len(client.get_departures(6)) == 120
+        dead = registry._backends[dead_url]
+        alive = registry._backends[stub.url]
+        assert dead.failures == 1
+        assert list(alive.latencies) == ['departure']
+        # the dead server is cooling down and no longer tried first
+        assert registry.backends(None) == [alive, dead]
+
+
+def test_failover_on_server_error(stub):
+    # the stub under a second name
+    registry = EndpointRegistry([stub.url, stub.url.replace('127.0.0.1',
+                                                            'localhost')])
+    stub.queue.append((503, {}, b''))
+    with _client(registry) as client:
+        assert len(client.get_departures(6)) == 120
+    assert len(stub.paths) == 2
+    first, second = registry.backends(None)
+    assert first.failures == 0 and second.failures == 1
+
+
+def test_streaming_failover(stub):
+    pytest.importorskip('ijson')
+    registry = EndpointRegistry([dead_url, stub.url])
+    with _client(registry) as client:
+        assert len(list(client.iter_interruptions())) == 20
+        assert len(list(client.iter_route(6, 2))) == 8
+    assert registry._backends[dead_url].failures == 1
+    assert set(registry._backends[stub.url].latencies) == \
+        {'interruptions', 'routing'}
+
+
+def test_streaming_failover_on_server_error(stub):
+    pytest.importorskip('ijson')
+    registry = EndpointRegistry([stub.url, stub.url.replace('127.0.0.1',
+                                                            'localhost')])
+    stub.queue.append((503, {}, b''))
+    with _client(registry) as client:
+        assert len(list(client.iter_interruptions())) == 20
+    assert len(stub.paths) == 2
+
+
+def test_async_streaming_failover(stub):
+    pytest.importorskip('aiohttp')
+    pytest.importorskip('ijson')
+    from mvg_api import aio
+    registry = EndpointRegistry([dead_url, stub.url])
+
+    async def iter_interruptions():
+        async with aio.AsyncMvgClient(endpoints=registry, cache=False,
+                                      rate_limit=False, retries=0) as client:
+            return [i async for i in client.iter_interruptions()]
+
+    assert len(asyncio.run(iter_interruptions())) == 20
+    assert registry._backends[dead_url].failures == 1
+    assert list(registry._backends[stub.url].latencies) == ['interruptions']
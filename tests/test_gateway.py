@@ -0,0 +1,100 @@
+# coding=utf-8
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from aiohttp import web  # noqa: E402
+
+import mvg_api  # noqa: E402
+from mvg_api import gateway  # noqa: E402
+
+
+@pytest.fixture
+def gateway_url(stub):
+    """Url of a gateway with the default client, forwarding to `stub`."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(gateway.make_app(gateway.make_client(stub.url)))
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    host, port = runner.addresses[0][:2]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield "http://{}:{}".format(host, port)
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def _client(gateway_url):
+    return mvg_api.MvgClient(base_url=gateway_url, cache=False,
+                             rate_limit=False, backoff_factor=0)
+
+
+def test_one_upstream_request_per_url(stub, gateway_url):
+    clients = [_client(gateway_url) for _ in range(5)]
+
+    def poll(client):
+        return (len(client.get_departures(6)),
+                client.get_id_for_station("Hauptbahnhof"))
+
+    with ThreadPoolExecutor(len(clients)) as pool:
+        # concurrently, then one after another
+        results = list(pool.map(poll, clients))
+    results += [poll(client) for client in clients]
+    assert results == [(120, 'de:09162:6')] * 10
+    assert sorted(stub.paths) == [
+        '/api/fahrinfo/departure/de:09162:6?footway=0',
+        '/api/fahrinfo/location/queryWeb?q=Hauptbahnhof',
+        ]
+    for client in clients:
+        client.close()
+
+
+def test_routes_are_cached(stub, gateway_url, upcoming_route):
+    stub.queue.append((200, {}, upcoming_route))
+    for _ in range(5):
+        with _client(gateway_url) as client:
+            assert len(client.get_route(6, 2)) == 8
+    assert stub.paths == [
+        '/api/fahrinfo/routing/?fromStation=de:09162:6&toStation=de:09162:2']
+
+
+def test_unknown_path(stub, gateway_url):
+    with _client(gateway_url) as client:
+        status, _, body = client._send(gateway_url + '/favicon.ico', None, 5)
+    assert status == 404
+    assert json.loads(body.decode('utf-8')) == {'error': 'unknown path'}
+    assert stub.paths == []
+
+
+def test_api_errors_are_passed_through(stub, gateway_url):
+    stub.queue.append((404, {}, b'{"error": "unknown station"}'))
+    stub.queue.append((404, {'Content-Type': 'text/html'}, b'Not Found'))
+    with _client(gateway_url) as client:
+        with pytest.raises(mvg_api.ApiError) as excinfo:
+            client.get_departures(6)
+        assert excinfo.value.code == 404
+        assert excinfo.value.reason == {'error': 'unknown station'}
+        with pytest.raises(mvg_api.ApiError) as excinfo:
+            client.get_departures(2)
+        assert excinfo.value.code == 404
+        assert excinfo.value.reason == {'error': 'Got status code 404'}
+
+
+def test_stats(stub, gateway_url):
+    with _client(gateway_url) as client:
+        client.get_departures(6)
+        client.get_departures(6)
+        stats = client._perform_api_request(gateway_url + '/_gateway/stats')
+    assert stats['cache']['hits'] == 1
+    assert stats['cache']['size'] == 1
+    assert stats['route_cache']['size'] == 0
+    assert stats['coalesced'] == 0
+    assert stats['rate_limiter']['retries'] == 0
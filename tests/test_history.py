@@ -0,0 +1,149 @@
+# coding=utf-8
+import sys
+
+import pytest
+
+import mvg_api
+from mvg_api import history as history_module
+from mvg_api.history import DepartureHistory
+
+noon = 1571918400000  # 2019-10-24 12:00 UTC in milliseconds
+minute = 60000
+
+
+def _departure(departure_id, delay=0, live=True, label='U1',
+               destination='Olympia-Einkaufszentrum', product='UBAHN',
+               time=noon):
+    return {'departureId': departure_id, 'delay': delay, 'live': live,
+            'label': label, 'destination': destination, 'product': product,
+            'departureTime': time, 'departureTimeMinutes': 3}
+
+
+@pytest.fixture
+def history():
+    """Departures with known delays at two stations."""
+    history = DepartureHistory()
+    history.record(6, [
+        _departure(1, 0), _departure(2, 0), _departure(3, 1),
+        _departure(4, 2, label='U2', destination='Messestadt Ost'),
+        _departure(5, 5, label='S1', product='SBAHN', time=noon + minute),
+        _departure(6, 7, live=False),
+    ], recorded=noon)
+    history.record(2, [_departure(7, 10, time=noon + 2 * minute)],
+                   recorded=noon)
+    return history
+
+
+def test_dedupe_by_departure_id():
+    history = DepartureHistory()
+    assert history.record(6, [_departure(1, 0), _departure(2, 0)],
+                          recorded=noon) == 2
+    assert history.record(6, [_departure(1, 3), _departure(3, 0)],
+                          recorded=noon + minute) == 1
+    assert len(history) == 3
+    row = next(row for row in history.rows() if row['departure_id'] == 1)
+    assert row['delay'] == 3
+    assert row['first_seen'] == noon
+    assert row['last_seen'] == noon + minute
+    # the same departure at another station is another row
+    assert history.record(2, [_departure(1, 0)], recorded=noon) == 1
+
+
+def test_delay_stats(history):
+    assert history.delay_stats() == {
+        'count': 6, 'mean': 3.0, 'median': 1, 'p90': 10, 'max': 10,
+        'delayed': 4 / 6}
+    assert history.delay_stats(live_only=False)['count'] == 7
+    assert history.delay_stats(line='U1', station='de:09162:6') == {
+        'count': 3, 'mean': 1 / 3, 'median': 0, 'p90': 1, 'max': 1,
+        'delayed': 1 / 3}
+    assert history.delay_stats(start=noon + minute,
+                               end=noon + 2 * minute)['count'] == 1
+    assert history.delay_stats(line='U9')['count'] == 0
+
+
+def test_delay_stats_by(history):
+    stats = history.delay_stats_by('line', station=6)
+    assert {line: s['count'] for line, s in stats.items()} == \
+        {'U1': 3, 'U2': 1, 'S1': 1}
+    assert stats['S1']['mean'] == 5.0
+    stats = history.delay_stats_by('station', product='UBAHN')
+    assert stats['de:09162:2']['max'] == 10
+    assert stats['de:09162:6']['count'] == 4
+    with pytest.raises(ValueError):
+        history.delay_stats_by('platform')
+    with pytest.raises(TypeError):
+        history.delay_stats_by('line', platform=1)
+
+
+def test_numpy_selection(monkeypatch):
+    pytest.importorskip('numpy')
+    history = DepartureHistory()
+    history.record(6, [
+        _departure(i, i % 7, live=i % 5 != 0,
+                   label=('U1', 'U2', 'S1')[i % 3],
+                   time=noon + (i % 60) * minute)
+        for i in range(600)], recorded=noon)
+    selections = [
+        (True, None, None, {}),
+        (False, noon + 10 * minute, noon + 20 * minute, {'label': 'U2'}),
+        (True, noon + 30 * minute, None, {'station': 6, 'label': 'S1'}),
+        (False, None, None, {'label': 'U9'}),
+    ]
+    results = {}
+    for threshold in (0, sys.maxsize):
+        monkeypatch.setattr(mvg_api, '_numpy_threshold', threshold)
+        results[threshold] = [history._selection(*selection)
+                              for selection in selections]
+    assert results[0] == results[sys.maxsize]
+    assert len(results[0][0]) == 480
+
+
+def _assert_equal(loaded, history):
+    assert list(loaded.rows()) == list(history.rows())
+    assert loaded.delay_stats_by('line') == history.delay_stats_by('line')
+    # the index of recorded departures is restored
+    assert loaded.record(6, [_departure(1, 4)]) == 0
+    assert loaded.record(6, [_departure(99)]) == 1
+
+
+def test_save_and_load(history, tmp_path):
+    path = str(tmp_path / 'history.mvgh')
+    history.save(path)
+    _assert_equal(DepartureHistory.load(path), history)
+
+
+def test_load_other_byteorder(history, tmp_path, monkeypatch):
+    path = str(tmp_path / 'history.mvgh')
+    for column in history._data.values():
+        column.byteswap()
+    other = 'big' if sys.byteorder == 'little' else 'little'
+    with monkeypatch.context() as patch:
+        patch.setattr(history_module.sys, 'byteorder', other)
+        history.save(path)
+    loaded = DepartureHistory.load(path)
+    for column in history._data.values():
+        column.byteswap()
+    _assert_equal(loaded, history)
+
+
+def test_load_other_file(tmp_path):
+    path = tmp_path / 'history.mvgh'
+    path.write_bytes(b'{"not": "a history"}')
+    with pytest.raises(ValueError):
+        DepartureHistory.load(str(path))
+
+
+@pytest.mark.parametrize('name', ['history.parquet', 'history.arrow'])
+def test_save_and_load_arrow(history, tmp_path, name):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / name)
+    history.save(path)
+    _assert_equal(DepartureHistory.load(path), history)
+
+
+def test_poll(replay_client):
+    history = DepartureHistory()
+    errors = history.poll([6, 2, 999], client=replay_client)
+    assert list(errors) == ['de:09162:999']
+    assert len(history) == 160
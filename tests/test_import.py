@@ -0,0 +1,52 @@
+# coding=utf-8
+"""`import mvg_api` has to stay fast for short-lived scripts, so the
+HTTP stack and JSON backends are only imported on first use."""
+
+import os
+import subprocess
+import sys
+
+# cumulative microseconds `import mvg_api` may take, `requests` alone
+# takes several times as long
+budget = 50000
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(*args):
+    env = dict(os.environ)
+    # the first run writes the bytecode the following ones load
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return subprocess.run([sys.executable] + list(args), cwd=root, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def _import_time():
+    """Cumulative microseconds of `import mvg_api` per -X importtime."""
+    output = _python('-X', 'importtime', '-c', 'import mvg_api').stderr
+    # lines look like "import time:  <self> | <cumulative> | <module>"
+    for line in output.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == 'mvg_api':
+            return int(fields[1])
+    raise AssertionError("mvg_api missing in:\n" + output)
+
+
+def test_import_time():
+    _import_time()
+    elapsed = min(_import_time() for _ in range(3))
+    assert elapsed < budget, \
+        "import mvg_api took {} us, the budget is {} us".format(
+            elapsed, budget)
+
+
+def test_no_eager_imports():
+    output = _python('-c', "import sys\n"
+                           "before = set(sys.modules)\n"
+                           "import mvg_api\n"
+                           "print(' '.join(set(sys.modules) - before))").stdout
+    imported = set(output.split())
+    assert 'mvg_api' in imported
+    for module in ('requests', 'urllib3', 'asyncio', 'json'):
+        assert module not in imported
@@ -0,0 +1,99 @@
+# coding=utf-8
+import copy
+import datetime
+
+import pytest
+
+from mvg_api.interruptions import InterruptionIndex
+
+# validity of the recorded interruptions
+earliest_start = 1571577580000
+latest_end = 1572527980000
+
+
+@pytest.fixture
+def payload(replay_client):
+    return copy.deepcopy(replay_client.get_interruptions())
+
+
+@pytest.fixture
+def index(payload):
+    return InterruptionIndex(payload)
+
+
+def _ids(interruptions):
+    return sorted(interruption['id'] for interruption in interruptions)
+
+
+def test_lookups(index):
+    assert len(index) == 20
+    assert '90000' in index
+    assert index.get('90000')['title'].startswith('58:')
+    assert index.get('1') is None
+    assert _ids(index.by_line('S3')) == ['90004', '90007', '90009']
+    assert _ids(index.by_line('s3')) == ['90004', '90007', '90009']
+    assert index.by_line('U1') == []
+    assert _ids(index.by_product('U')) == [
+        '90003', '90006', '90010', '90012', '90018']
+    assert _ids(index.by_station(6)) == ['90000', '90014', '90015']
+    assert _ids(index.by_station('de:09162:6')) == \
+        ['90000', '90014', '90015']
+    assert sorted(index.lines()) == sorted(
+        ['58', 'S2', 'U4', 'S3', '16', 'U2', 'S7', 'U5', 'U8', '19', 'S8',
+         'S1'])
+
+
+def test_events(index, payload):
+    payload = copy.deepcopy(payload)
+    interruptions = payload['interruption']
+    interruptions[1]['title'] = 'S2: Signalstörung'
+    resolved = interruptions.pop(0)
+    interruptions.append(dict(interruptions[0], id='90100',
+                              lines={'line': {'line': 'U1',
+                                              'product': 'u'}}))
+    events = index.update(payload)
+    assert [(event.type, event.interruption_id) for event in events] == \
+        [('changed', '90001'), ('new', '90100'), ('resolved', '90000')]
+    assert events[0].previous['title'].startswith('S2:')
+    assert events[2].interruption == resolved
+    # the index follows the update
+    assert '90000' not in index
+    assert _ids(index.by_line('U1')) == ['90100']
+    assert '90000' not in _ids(index.by_station(6))
+    assert index.update(payload) == []
+
+
+def test_active(index):
+    assert index.active(earliest_start - 1) == []
+    assert len(index.active(1571923180000)) == 20
+    assert len(index.active(latest_end)) == 2
+    assert index.active(latest_end + 1) == []
+    at = datetime.datetime.fromtimestamp(1571923180)
+    assert len(index.active(at)) == 20
+
+
+def test_between(index):
+    assert len(index.between(earliest_start - 10, earliest_start)) == 4
+    # everything still valid after the first ones ended
+    assert len(index.between(1572009580001, latest_end + 1)) == 17
+    assert index.between(latest_end + 1, None) == []
+
+
+def test_open_bounds(index, payload):
+    payload = copy.deepcopy(payload)
+    interruptions = payload['interruption']
+    del interruptions[0]['duration']
+    del interruptions[1]['duration']['from']
+    del interruptions[2]['duration']['until']
+    index.update(payload)
+    assert _ids(index.active(0)) == ['90000', '90001']
+    assert _ids(index.active(latest_end + 1)) == ['90000', '90002']
+    assert _ids(index.between(None, None)) == ['90000', '90002']
+
+
+def test_refresh(replay_client):
+    index = InterruptionIndex()
+    events = index.refresh(replay_client)
+    assert len(events) == 20
+    assert {event.type for event in events} == {'new'}
+    assert index.refresh(replay_client) == []
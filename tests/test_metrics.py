@@ -0,0 +1,77 @@
+# coding=utf-8
+import pytest
+
+import mvg_api
+from mvg_api.metrics import MetricsCollector, PrometheusCollector
+
+inf = float('inf')
+
+
+@pytest.fixture
+def metrics():
+    return MetricsCollector(buckets=(0.1, 1.0, inf), slowest=2)
+
+
+def test_client_metrics(stub, replay_client):
+    body = replay_client.transport.get(mvg_api._departures_url(6)).body
+    metrics = MetricsCollector()
+    stub.queue.append((503, {}, b''))
+    with mvg_api.MvgClient(base_url=stub.url, rate_limit=False,
+                           backoff_factor=0, hooks=metrics) as client:
+        client.get_departures(6)
+        client.get_departures(6)
+        with pytest.raises(mvg_api.ApiError):
+            client.get_departures(999)
+    departure = metrics.stats()['departure']
+    assert departure['requests'] == 1
+    assert departure['retries'] == 1
+    assert departure['cache_hits'] == 1
+    assert departure['errors'] == 1
+    assert departure['bytes'] == len(body)
+    assert departure['decode_time'] > 0
+    latency = departure['latency']
+    assert latency['count'] == 1
+    assert latency['mean'] == latency['sum'] > 0
+    counts = [count for _, count in latency['buckets']]
+    assert counts == sorted(counts)
+    assert latency['buckets'][-1] == (inf, 1)
+    assert [url for _, url in metrics.slowest()] == \
+        [mvg_api._departures_url(6)]
+
+
+def test_histogram(metrics):
+    for elapsed in (0.05, 0.1, 0.5, 2.0, 30.0):
+        metrics.after_response('routing', str(elapsed), 200, 100, elapsed,
+                               0.01)
+    routing = metrics.stats()['routing']
+    assert routing['latency']['buckets'] == [(0.1, 2), (1.0, 3), (inf, 5)]
+    assert routing['latency']['sum'] == pytest.approx(32.65)
+    assert routing['bytes'] == 500
+    assert routing['decode_time'] == pytest.approx(0.05)
+    assert metrics.slowest() == [(30.0, '30.0'), (2.0, '2.0')]
+    metrics.reset()
+    assert metrics.stats() == {}
+    assert metrics.slowest() == []
+
+
+def test_prometheus(metrics):
+    prometheus_client = pytest.importorskip('prometheus_client')
+    metrics.after_response('departure', 'url', 200, 100, 0.5, 0.01)
+    metrics.on_cache_hit('departure', 'url')
+    metrics.on_retry(None, 'url', 503, 0)
+    registry = prometheus_client.CollectorRegistry()
+    registry.register(PrometheusCollector(metrics))
+    text = prometheus_client.generate_latest(registry).decode('utf-8')
+    lines = text.splitlines()
+    assert ('mvg_api_request_duration_seconds_bucket'
+            '{endpoint="departure",le="0.1"} 0.0') in lines
+    assert ('mvg_api_request_duration_seconds_bucket'
+            '{endpoint="departure",le="1.0"} 1.0') in lines
+    assert ('mvg_api_request_duration_seconds_bucket'
+            '{endpoint="departure",le="+Inf"} 1.0') in lines
+    assert ('mvg_api_request_duration_seconds_count'
+            '{endpoint="departure"} 1.0') in lines
+    assert 'mvg_api_cache_hits_total{endpoint="departure"} 1.0' in lines
+    assert 'mvg_api_received_bytes_total{endpoint="departure"} 100.0' \
+        in lines
+    assert 'mvg_api_request_retries_total{endpoint="other"} 1.0' in lines
@@ -0,0 +1,39 @@
+# coding=utf-8
+import mvg_api
+from mvg_api import models
+
+
+def test_route_matrix_cells_are_independent():
+    matrix = models.RouteMatrix([6, 2], [1, 3])
+    matrix.connections[0][0].append({'departure': 0, 'arrival': 60000})
+    assert matrix.connections[0][1] == []
+    assert matrix.connections[1][0] == []
+
+
+def test_route_matrix(replay_client):
+    connections = replay_client.get_route(6, 2)
+    matrix = models.RouteMatrix([6], [2, 999])
+    matrix._set(0, 0, connections)
+    matrix._set(0, 1, mvg_api.ApiError(404))
+    fastest = min(c['arrival'] - c['departure'] for c in connections)
+    assert matrix.durations[0][0] == fastest // 60000
+    assert matrix[0, 0] is connections
+    assert matrix.durations[0][1] is None
+    assert matrix.connections[0][1] == []
+    assert matrix.errors[(0, 1)].code == 404
+
+
+def test_count_changes():
+    ride = {'connectionPartType': 'TRANSPORTATION'}
+    walk = {'connectionPartType': 'FOOTWAY'}
+    assert models.count_changes(None) == 0
+    assert models.count_changes([ride]) == 0
+    assert models.count_changes([ride, walk, ride, ride]) == 2
+
+
+def test_departure_objects(replay_client):
+    departures = replay_client.get_departures(6)
+    objects = replay_client.get_departures(6, as_objects=True)
+    assert [d.departure_id for d in objects] == \
+        [d['departureId'] for d in departures]
+    assert objects[0].to_dict()['label'] == departures[0]['label']
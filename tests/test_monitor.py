@@ -0,0 +1,145 @@
+# coding=utf-8
+import pytest
+
+from mvg_api import monitor as monitor_module
+from mvg_api.monitor import DepartureMonitor, diff_departures
+from mvg_api.transport import MissingRecording
+
+# a while before the first recorded departure
+recorded_at = 1571920000
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fakes the monotonic and the wall clock of the monitor."""
+    clock = Clock(1000.0)
+    monkeypatch.setattr(monitor_module, 'monotonic', clock)
+    monkeypatch.setattr(monitor_module, 'current_time',
+                        lambda: recorded_at + clock.now - 1000)
+    return clock
+
+
+def _monitor(replay_client, station_ids, **options):
+    return DepartureMonitor(station_ids, client=replay_client,
+                            min_interval=10, max_interval=300, **options)
+
+
+def test_first_poll_adds_everything(clock, replay_client):
+    monitor = _monitor(replay_client, [6, 2], requests_per_second=1000)
+    events = monitor.poll()
+    # one request, the next has to wait for the budget
+    assert len({event.station_id for event in events}) == 1
+    clock.now += 0.001
+    events += monitor.poll()
+    assert len(events) == 160
+    assert {event.type for event in events} == {'add'}
+    assert {event.station_id for event in events} == \
+        {'de:09162:6', 'de:09162:2'}
+    assert len(monitor.departures(6)) == 120
+
+
+def test_unchanged_poll(clock, replay_client):
+    monitor = _monitor(replay_client, [6])
+    assert monitor.poll()
+    assert monitor.wait_time() == 10
+    clock.now += 5
+    assert monitor.poll() == []  # not due yet
+    clock.now += 5
+    assert monitor.poll() == []
+    assert monitor._stations['de:09162:6'].interval == 15
+
+
+def test_requests_per_second(clock, replay_client, monkeypatch):
+    requested = []
+    get_departures = replay_client.get_departures
+
+    def record(station_id, *args, **kwargs):
+        requested.append((clock.now, station_id))
+        return get_departures(station_id, *args, **kwargs)
+
+    monkeypatch.setattr(replay_client, 'get_departures', record)
+    monitor = _monitor(replay_client, [6, 2, 1], requests_per_second=0.5)
+    for _ in range(5):
+        monitor.poll()
+        clock.now += 1
+    # all three are due at once, but only one is polled every 2 seconds
+    assert requested == [(1000, 'de:09162:1'), (1002, 'de:09162:2'),
+                         (1004, 'de:09162:6')]
+
+
+def test_error_is_recorded(clock, replay_client):
+    monitor = _monitor(replay_client, [999])
+    assert monitor.poll() == []
+    state = monitor._stations['de:09162:999']
+    assert isinstance(state.last_error, MissingRecording)
+    # failures count as unchanged
+    assert state.interval == 15
+
+
+def test_adaptive_interval(clock, replay_client):
+    monitor = _monitor(replay_client, [6])
+    state = monitor._stations['de:09162:6']
+    intervals = []
+    for changed in (False, False, True, True, True):
+        monitor._schedule(state, changed, [])
+        intervals.append(state.interval)
+    assert intervals == [15, 22.5, 11.25, 10, 10]
+    for _ in range(20):
+        monitor._schedule(state, False, [])
+    assert state.interval == 300
+
+
+def test_polled_before_next_departure(clock, replay_client):
+    monitor = _monitor(replay_client, [6])
+    state = monitor._stations['de:09162:6']
+    now = monitor_module.current_time() * 1000
+    state.interval = 100
+    monitor._schedule(state, False, [{'departureTime': now + 40000}])
+    assert state.next_poll - clock.now == 40
+    # delays postpone the departure
+    monitor._schedule(state, False, [{'departureTime': now, 'delay': 1}])
+    assert state.next_poll - clock.now == 60
+    # but not below the minimum interval
+    monitor._schedule(state, False, [{'departureTime': now}])
+    assert state.next_poll - clock.now == 10
+    assert state.interval == 300
+
+
+def test_remove_station(clock, replay_client):
+    monitor = _monitor(replay_client, [6, 2], requests_per_second=1000)
+    monitor.remove_station(2)
+    assert monitor.station_ids == ['de:09162:6']
+    for _ in range(3):
+        monitor.poll()
+        clock.now += 1
+    assert monitor.wait_time() == 7
+
+
+def test_diff_departures():
+    old = [
+        {'departureId': 1, 'delay': 0, 'departureTimeMinutes': 5},
+        {'departureId': 2, 'delay': 0, 'departureTimeMinutes': 6},
+        {'departureId': 3, 'delay': 0, 'departureTimeMinutes': 7},
+    ]
+    new = [
+        {'departureId': 1, 'delay': 0, 'departureTimeMinutes': 4},
+        {'departureId': 2, 'delay': 2, 'departureTimeMinutes': 7},
+        {'departureId': 4, 'delay': 0, 'departureTimeMinutes': 9},
+    ]
+    events = diff_departures('de:09162:6', old, new)
+    assert [(event.type, event.departure_id) for event in events] == \
+        [('update', 2), ('add', 4), ('remove', 3)]
+    update = events[0]
+    assert update.previous is old[1] and update.departure is new[1]
+    assert events[2].departure is old[2]
+    # a new field is a change
+    assert diff_departures('de:09162:6', old[:1],
+                           [dict(old[0], sev=True)])[0].type == 'update'
@@ -0,0 +1,52 @@
+# coding=utf-8
+import mvg_api
+from mvg_api.ratelimit import (
+    RateLimiter, TokenBucket, backoff_delay, parse_retry_after,
+)
+
+
+def test_not_throttled_by_default():
+    assert mvg_api.MvgClient().rate_limiter is None
+    assert mvg_api.get_default_client().rate_limiter is None
+    assert isinstance(mvg_api.MvgClient(rate_limit=True).rate_limiter,
+                      RateLimiter)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket._updated
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0.5
+    assert bucket.reserve(now + 1.5) == 0
+
+
+def test_limiter_counts_waits():
+    limiter = RateLimiter({'departure': 1, 'routing': None})
+    assert limiter.reserve('departure') == 0
+    assert limiter.reserve('departure') > 0
+    assert limiter.reserve('routing') == 0
+    assert limiter.stats()['waits'] == 1
+    assert set(limiter.stats()['endpoint_wait_time']) == {'departure'}
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_backoff_delay():
+    assert 0 <= backoff_delay(3, 0.5) <= 4
+    assert backoff_delay(1, 0, retry_after=2) == 2
+
+
+def test_retry_after_pauses_limiter(stub):
+    stub.queue.append((429, {'Retry-After': '0'}, b''))
+    limiter = RateLimiter()
+    with mvg_api.MvgClient(base_url=stub.url, rate_limit=limiter,
+                           backoff_factor=0) as client:
+        assert len(client.get_departures(6)) == 120
+    assert len(stub.paths) == 2
+    assert limiter.stats()['retries'] == 1
@@ -0,0 +1,83 @@
+# coding=utf-8
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import mvg_api
+from mvg_api.singleflight import SingleFlight
+
+threads = 8
+
+
+def test_concurrent_requests_are_coalesced(stub, stub_client):
+    stub.delay = 0.2
+    start = threading.Barrier(threads)
+
+    def get_departures(_):
+        start.wait()
+        return len(stub_client.get_departures(6))
+
+    with ThreadPoolExecutor(threads) as pool:
+        assert list(pool.map(get_departures, range(threads))) == \
+            [120] * threads
+    assert len(stub.paths) == 1
+    assert stub_client.coalesced == threads - 1
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait()
+        raise mvg_api.ApiError(503)
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, 'url', fail)
+        started.wait()
+        follower = pool.submit(flight.do, 'url', fail)
+        while flight.coalesced == 0:
+            pass
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(mvg_api.ApiError):
+                future.result()
+    assert flight.coalesced == 1
+    # the failed call isn't remembered
+    assert flight.do('url', lambda: 1) == 1
+
+
+def test_async_requests_are_coalesced(stub):
+    pytest.importorskip('aiohttp')
+    from mvg_api import aio
+
+    async def get_departures():
+        async with aio.AsyncMvgClient(base_url=stub.url, cache=False,
+                                      rate_limit=False) as client:
+            results = await asyncio.gather(
+                *[client.get_departures(6) for _ in range(threads)])
+            return [len(r) for r in results], client.coalesced
+
+    assert asyncio.run(get_departures()) == ([120] * threads, threads - 1)
+    assert len(stub.paths) == 1
+
+
+def test_result_is_cached_before_the_flight_ends(stub):
+    with mvg_api.MvgClient(base_url=stub.url, rate_limit=False) as client:
+        flight = client.single_flight
+        calls = flight._calls
+        cached = []
+
+        class Calls(dict):
+            def __delitem__(self, key):
+                # a request arriving now must find the cached response
+                cached.append(client.cache.get(key) is not None)
+                super().__delitem__(key)
+
+        flight._calls = Calls(calls)
+        client.get_departures(6)
+    assert cached == [True]
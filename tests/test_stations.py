@@ -0,0 +1,77 @@
+# coding=utf-8
+import random
+import time
+
+from mvg_api.stations import SpatialIndex, StationIndex, distance
+
+
+def _station(station_id, name):
+    return {'type': 'station', 'id': 'de:09162:{}'.format(station_id),
+            'name': name, 'place': 'München', 'latitude': 48.14,
+            'longitude': 11.56}
+
+
+def test_lookup_by_prefix():
+    index = StationIndex()
+    index.add([_station(180, "Hauptbahnhof Nord"),
+               _station(6, "Hauptbahnhof")])
+    assert [s['name'] for s in index.lookup("hauptbahn")] == \
+        ["Hauptbahnhof", "Hauptbahnhof Nord"]
+    assert index.lookup("6")[0]['name'] == "Hauptbahnhof"
+    assert index.search("Hauptbanhof Nord")[0]['id'] == 'de:09162:180'
+
+
+def test_exact():
+    index = StationIndex()
+    index.add([_station(180, "Hauptbahnhof Nord"),
+               _station(500, "Münchner Freiheit")])
+    assert index.exact("Hauptbahnhof") == []
+    assert index.exact("muenchner-freiheit")[0]['id'] == 'de:09162:500'
+    assert index.exact("München Münchner Freiheit")[0]['id'] == \
+        'de:09162:500'
+    assert index.exact('de:09162:180')[0]['name'] == "Hauptbahnhof Nord"
+
+
+def test_client_ignores_prefix_matches(stub, stub_client):
+    stub_client.station_index = StationIndex()
+    stub_client.station_index.add([_station(180, "Hauptbahnhof Nord")])
+    assert stub_client.get_id_for_station("Hauptbahnhof") == 'de:09162:6'
+    assert len(stub.paths) == 1
+
+
+def test_client_uses_exact_matches(stub, stub_client):
+    stub_client.station_index = StationIndex()
+    stub_client.station_index.add([_station(180, "Hauptbahnhof Nord")])
+    assert stub_client.get_id_for_station("Hauptbahnhof Nord") == \
+        'de:09162:180'
+    assert stub.paths == []
+
+
+def _random_stations(count, seed=8):
+    rnd = random.Random(seed)
+    return [dict(_station(i, "Station {}".format(i)),
+                 latitude=48.14 + rnd.uniform(-0.1, 0.1),
+                 longitude=11.56 + rnd.uniform(-0.15, 0.15))
+            for i in range(count)]
+
+
+def test_nearest_matches_linear_scan():
+    stations = _random_stations(300)
+    index = SpatialIndex(stations)
+    for lat, lon in [(48.14, 11.56), (48.3, 11.2), (47.9, 11.9)]:
+        expected = sorted(stations, key=lambda s: distance(
+            lat, lon, s['latitude'], s['longitude']))
+        assert index.nearest(lat, lon, k=5) == expected[:5]
+        assert index.within(lat, lon, radius=5000) == [
+            s for s in expected
+            if distance(lat, lon, s['latitude'], s['longitude']) <= 5000]
+
+
+def test_nearest_far_away():
+    index = SpatialIndex([_station(6, "Hauptbahnhof"),
+                          dict(_station(2, "Marienplatz"), latitude=48.137,
+                               longitude=11.575)])
+    started = time.monotonic()
+    assert index.nearest(0.0, 0.0, k=1)[0]['id'] == 'de:09162:2'
+    assert index.within(0.0, 0.0) == []
+    assert time.monotonic() - started < 1
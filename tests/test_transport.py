@@ -0,0 +1,109 @@
+# coding=utf-8
+import gzip
+
+import pytest
+
+import mvg_api
+from mvg_api.transport import (
+    MissingRecording, RecordingTransport, ReplayTransport, Response,
+    RequestsTransport, recording_key,
+)
+
+
+class _FixedTransport:
+    """Answers every request with `response`."""
+
+    def __init__(self, response):
+        self.response = response
+        self.urls = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.urls.append(url)
+        return self.response
+
+    def close(self):
+        pass
+
+
+def test_recording_key_ignores_host():
+    assert (recording_key("https://www.mvg.de/api/x?q=1") ==
+            recording_key("http://127.0.0.1:8080/api/x?q=1"))
+    assert (recording_key("https://www.mvg.de/api/x?q=1") !=
+            recording_key("https://www.mvg.de/api/x?q=2"))
+
+
+def test_record_and_replay(tmp_path):
+    url = mvg_api._departures_url(6)
+    body = b'{"departures": [], "servingLines": []}'
+    recorder = RecordingTransport(str(tmp_path), _FixedTransport(
+        Response(200, {'Content-Type': 'application/json'}, body)))
+    assert recorder.get(url).body == body
+
+    response = ReplayTransport(str(tmp_path)).get(url)
+    assert response.status == 200
+    assert response.body == body
+    assert response.headers['content-type'] == 'application/json'
+
+
+def test_record_compressed_response(stub, tmp_path):
+    body = b'{"departures": [], "servingLines": []}'
+    stub.queue.append((200, {'Content-Encoding': 'gzip'},
+                       gzip.compress(body)))
+    url = mvg_api._departures_url(6)
+    recorder = RecordingTransport(str(tmp_path), RequestsTransport())
+    assert recorder.get(stub.url + url[len(mvg_api.api_base_url):]).body \
+        == body
+    recorder.close()
+
+    response = ReplayTransport(str(tmp_path)).get(url)
+    assert response.body == body
+    assert response.headers['Content-Type'] == 'application/json'
+    for name in ('Content-Encoding', 'Content-Length', 'Transfer-Encoding'):
+        assert name not in response.headers
+
+
+def test_record_binary_body(tmp_path):
+    url = mvg_api.interruptions_url
+    recorder = RecordingTransport(str(tmp_path), _FixedTransport(
+        Response(500, {}, b'\xff\x00')))
+    recorder.get(url)
+    assert ReplayTransport(str(tmp_path)).get(url).body == b'\xff\x00'
+
+
+def test_not_modified_is_not_recorded(tmp_path):
+    recorder = RecordingTransport(str(tmp_path), _FixedTransport(
+        Response(304, {}, b'')))
+    recorder.get(mvg_api.interruptions_url)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_missing_recording(tmp_path):
+    with pytest.raises(MissingRecording):
+        ReplayTransport(str(tmp_path)).get(mvg_api.interruptions_url)
+    response = ReplayTransport(str(tmp_path), missing_status=404).get(
+        mvg_api.interruptions_url)
+    assert response.status == 404
+
+
+def test_replay_all_endpoints(replay_client):
+    assert len(replay_client.get_departures(6)) == 120
+    assert replay_client.get_route(6, 2)
+    assert replay_client.get_stations("Hauptbahnhof")[0]['id'] == \
+        'de:09162:6'
+    assert len(replay_client.get_nearby_stations(48.1374, 11.5755)) == 10
+    assert len(replay_client.get_interruptions(as_objects=True)) == 20
+
+
+def test_missing_recording_is_a_request_error(replay_client):
+    with pytest.raises(MissingRecording):
+        replay_client.get_departures(999)
+    results = replay_client.get_departures_many([6, 2, 999])
+    assert len(results['de:09162:6']) == 120
+    assert len(results['de:09162:2']) == 40
+    assert isinstance(results['de:09162:999'], MissingRecording)
+
+
+def test_missing_recording_in_matrix(replay_client):
+    matrix = replay_client.get_routes_matrix([6], [2, 999])
+    assert matrix.durations[0][0] is not None
+    assert isinstance(matrix.errors[(0, 1)], MissingRecording)